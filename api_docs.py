@@ -0,0 +1,124 @@
+"""Especificacion OpenAPI y Swagger UI sin costo al arrancar la API.
+
+swagger.yml es la fuente del contrato. Parsearla con PyYAML y armar
+Flasgger era lo mas caro de crear la app, y casi ningun pedido lo usa:
+
+- la especificacion se compila a JSON (swagger.json, junto a swagger.yml)
+  y cada proceso la lee una sola vez, con el primer pedido a
+  /apispec_1.json, y la sirve ya serializada. Si swagger.yml es mas nueva
+  que el JSON se vuelve a compilar; ``python api_docs.py`` lo hace de
+  antemano (por ejemplo, al armar la imagen);
+- Flasgger se importa recien cuando alguien abre /apidocs (LazySwaggerUI).
+
+Uso:
+    python api_docs.py [--check]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SPEC_SOURCE = os.path.join(ROOT, "swagger.yml")
+SPEC_CACHE = os.path.join(ROOT, "swagger.json")
+SPEC_ROUTE = "/apispec_1.json"
+# Rutas de Swagger UI, las de Flasgger por defecto (SPEC_ROUTE la sirve la API).
+UI_PREFIXES = ("/apidocs", "/flasgger_static/", "/oauth2-redirect.html")
+
+_lock = threading.Lock()
+_spec = None
+
+
+def compile_spec(source=SPEC_SOURCE, cache=SPEC_CACHE):
+    """Parsea ``source`` y la guarda como JSON en ``cache``; devuelve el JSON en bytes.
+
+    Si ``cache`` no se puede escribir (por ejemplo, un directorio de solo
+    lectura) devuelve el JSON igual: solo se pierde el atajo del proximo
+    arranque.
+    """
+    import yaml
+
+    with open(source, encoding="utf-8") as f:
+        body = json.dumps(yaml.safe_load(f)).encode()
+    # Con un nombre por proceso y os.replace, dos workers que compilan a la
+    # vez no se pisan ni dejan un archivo a medio escribir.
+    partial = f"{cache}.{os.getpid()}.tmp"
+    try:
+        with open(partial, "wb") as f:
+            f.write(body)
+        os.replace(partial, cache)
+    except OSError:
+        pass
+    return body
+
+
+def load_spec(source=SPEC_SOURCE, cache=SPEC_CACHE):
+    """El JSON de ``cache`` si esta al dia con ``source``; si no, lo compila."""
+    try:
+        if os.path.getmtime(cache) >= os.path.getmtime(source):
+            with open(cache, "rb") as f:
+                return f.read()
+    except OSError:
+        pass
+    return compile_spec(source, cache)
+
+
+def spec_json():
+    """La especificacion serializada, leida una vez por proceso."""
+    global _spec
+    if _spec is None:
+        with _lock:
+            if _spec is None:
+                _spec = load_spec()
+    return _spec
+
+
+class LazySwaggerUI:
+    """Middleware WSGI que atiende UI_PREFIXES con una app Flasgger armada al primer pedido.
+
+    El resto de los pedidos pasa directo a ``wsgi_app``, que no carga
+    Flasgger. La UI pide la especificacion a SPEC_ROUTE.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self._ui = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO", "").startswith(UI_PREFIXES):
+            return self._ui_app()(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+    def _ui_app(self):
+        with self._lock:
+            if self._ui is None:
+                from flask import Flask
+                from flasgger import Swagger
+
+                ui = Flask(__name__)
+                Swagger(ui, template=json.loads(spec_json()))
+                self._ui = ui
+            return self._ui
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compila swagger.yml a swagger.json")
+    parser.add_argument("--check", action="store_true",
+                        help="no escribir: salir con 1 si swagger.json falta o esta desactualizado")
+    args = parser.parse_args(argv)
+    if args.check:
+        try:
+            fresh = os.path.getmtime(SPEC_CACHE) >= os.path.getmtime(SPEC_SOURCE)
+        except OSError:
+            fresh = False
+        print(f"{SPEC_CACHE} is {'up to date' if fresh else 'stale'}", file=sys.stderr)
+        return 0 if fresh else 1
+    body = compile_spec()
+    print(f"wrote {SPEC_CACHE} ({len(body)} bytes)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
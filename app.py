@@ -1,39 +1,221 @@
-from flask import Flask, jsonify, request
-from flasgger import Swagger
-import yaml
-import dataclasses
-from database import DatabaseHandler
-from managers import IncidentManager, TicketManager, ClientManager
+from flask import Blueprint, Flask, Response, g, jsonify, make_response, request
+from flask.json.provider import DefaultJSONProvider
+import io
+import os
+import threading
+from contextlib import ExitStack
+from repository import create_repository
+from instrumentation import (
+    Metrics, PROFILE_HEADER, begin_request, end_request, finish_profile,
+    log_request, phase, start_profile
+)
+from endpoints import (
+    CORS_EXPOSE_HEADERS, METRICS_CONTENT_TYPE, SSE_HEADERS, SSE_KEEPALIVE, Services
+)
 from flask_cors import CORS
+import api_docs
+import endpoints
+import transfer
 
-app = Flask(__name__)
-CORS(app)
 
-with open("swagger.yml", "r", encoding="utf-8") as f:
-    swagger_template = yaml.safe_load(f)
-swagger = Swagger(app, template=swagger_template)
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON de Flask con el parseo del pedido y la serializacion medidos como fases."""
 
-db = DatabaseHandler()
-incident_manager = IncidentManager(db)
-ticket_manager = TicketManager(db)
-client_manager = ClientManager(db)
+    def loads(self, s, **kwargs):
+        with phase("decode"):
+            return super().loads(s, **kwargs)
+
+    def dumps(self, obj, **kwargs):
+        with phase("serialize"):
+            return super().dumps(obj, **kwargs)
+
+
+api = Blueprint("api", __name__)
+
+# Base y managers que usan las rutas (endpoints.Services); los crea create_app.
+services = None
+_app_lock = threading.Lock()
+
+
+def create_app(database=None, multiprocess=None):
+    """Arma la app Flask y abre la base.
+
+    ``database`` es un Repository ya creado; por defecto, create_repository()
+    (backend segun TICKETS_DB_BACKEND). Importar este modulo no abre la base
+    ni carga swagger.yml o Flasgger (ver api_docs.py). Las rutas usan los
+    servicios de este modulo, asi que hay una app por proceso: un servidor
+    con varios procesos la crea en cada uno, despues del fork (ver serve.py).
+    Si la base es un archivo (o con ``multiprocess=True``), cada pedido
+    empieza invalidando de las caches lo que escribieron otros procesos
+    (CacheSync); ver endpoints.Services.
+    """
+    global services
+
+    flask_app = Flask(__name__)
+    flask_app.json = TimedJSONProvider(flask_app)
+    CORS(flask_app, expose_headers=CORS_EXPOSE_HEADERS)
+    flask_app.register_blueprint(api)
+    flask_app.wsgi_app = api_docs.LazySwaggerUI(flask_app.wsgi_app)
+
+    services = Services(database if database is not None else create_repository(), multiprocess)
+    if services.cache_sync is not None:
+        # Despues de los hooks del blueprint: la consulta usa la conexion del pedido.
+        flask_app.before_request(sync_caches)
+    return flask_app
+
+
+def sync_caches():
+    if services.needs_cache_sync(request.path):
+        services.cache_sync.sync()
+
+
+def __getattr__(name):
+    # ``app`` se crea con el primer acceso (from app import app, flask run,
+    # un servidor WSGI con app:app), no al importar el modulo.
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    global app
+    with _app_lock:
+        if "app" not in globals():
+            app = create_app()
+    return app
+
+
+# Directorio donde guardar los perfiles pedidos con el header X-Profile;
+# sin definir, el header se ignora.
+PROFILE_DIR = os.environ.get("TICKETS_PROFILE_DIR")
+
+metrics = Metrics()
+
+
+# ------------------------------
+# Instrumentacion
+# ------------------------------
+@api.before_app_request
+def start_timing():
+    g.timing, g.timing_token = begin_request()
+    if PROFILE_DIR and request.headers.get(PROFILE_HEADER):
+        g.profiler = start_profile()
+
+
+@api.before_app_request
+def open_db_scope():
+    # Despues de start_timing, asi tomar la conexion cuenta como "connect".
+    g.db_scope = ExitStack()
+    g.db_scope.enter_context(services.db.request_scope())
+
+
+@api.after_app_request
+def finish_timing(response):
+    """Registra la latencia y las fases del pedido y agrega Server-Timing.
+
+    Con ``X-Profile: 1`` guarda el perfil y devuelve su nombre en
+    X-Profile-File; con ``X-Profile: text`` responde el reporte en lugar
+    del cuerpo.
+    """
+    timing = g.get("timing")
+    if timing is None:
+        return response
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        filename, report = finish_profile(profiler, PROFILE_DIR, request.method, request.path)
+        if request.headers.get(PROFILE_HEADER) == "text":
+            response = Response(report, status=response.status_code, mimetype="text/plain")
+        response.headers["X-Profile-File"] = filename
+    elapsed = timing.elapsed()
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe(request.method, route, response.status_code, elapsed, timing)
+    log_request(request.method, route, response.status_code, elapsed, timing)
+    response.headers["Server-Timing"] = timing.server_timing(elapsed)
+    return response
+
+
+@api.teardown_app_request
+def close_db_scope(exc):
+    scope = g.pop("db_scope", None)
+    if scope is not None:
+        scope.close()
+
+
+@api.teardown_app_request
+def reset_timing(exc):
+    token = g.pop("timing_token", None)
+    if token is not None:
+        end_request(token)
+
+
+def reply(result):
+    """Respuesta JSON de una operacion de endpoints: (cuerpo, status, headers)."""
+    body, status, headers = result
+    response = jsonify(body)
+    response.status_code = status
+    if headers:
+        response.headers.update(headers)
+    return response
+
+
+def conditional_response(stamp, build):
+    """Responde 304 si el cliente ya tiene la version indicada por ``stamp``.
+
+    ``stamp`` es (etag, last_modified) o None; ``build`` arma la respuesta
+    completa y solo se llama si hace falta.
+    """
+    if stamp is None:
+        return make_response(build())
+    fresh = endpoints.is_fresh(
+        stamp, request.headers.get("If-None-Match"), request.headers.get("If-Modified-Since")
+    )
+    response = Response(status=304) if fresh else make_response(build())
+    if response.status_code in (200, 304):
+        response.headers.update(endpoints.stamp_headers(stamp))
+    return response
+
+
+def list_response(entity):
+    """Responde un listado paginado o, si se pidio, completo en streaming.
+
+    Salvo con closed_within, el listado lleva ETag y responde 304 mientras
+    no cambie ninguna de las tablas de las que depende.
+    """
+    params, error = endpoints.list_args(entity, request.args)
+    if error:
+        return reply(endpoints.error(error, 400))
+    manager = services.list_managers[entity]
+    fmt = endpoints.stream_format(request.accept_mimetypes.best, request.args.get("stream"))
+
+    def build():
+        if fmt is None:
+            return reply(endpoints.list_page(manager, params))
+        del params["limit"]
+        return Response(endpoints.stream_chunks(manager.stream_dicts(**params), fmt),
+                        mimetype=endpoints.stream_mimetype(fmt))
+
+    if not endpoints.list_is_conditional(params):
+        return build()
+    return conditional_response(manager.list_stamp(f"{request.full_path} {fmt}"), build)
+
+
+def item_response(manager, item_id, label):
+    return conditional_response(
+        manager.stamp(item_id), lambda: reply(endpoints.get_item(manager, item_id, label))
+    )
 
 
 # ------------------------------
 # Endpoints de incidentes
 # ------------------------------
-@app.route("/api/incidents/", methods=["GET"])
+@api.route("/api/incidents/", methods=["GET"])
 def show_incidents():
     """
-    Lista todos los incidents registrados.
+    Lista los incidents registrados, paginados por id.
     ---
     tags:
       - Incidents
     """
-    return jsonify([dataclasses.asdict(i) for i in incident_manager.show()])
+    return list_response("incidents")
 
 
-@app.route("/api/incidents/", methods=["POST"])
+@api.route("/api/incidents/", methods=["POST"])
 def create_incident():
     """
     Crea un nuevo incident.
@@ -41,12 +223,10 @@ def create_incident():
     tags:
       - Incidents
     """
-    data = request.json
-    incident = incident_manager.create(data["description"], data["incident_type"])
-    return jsonify(dataclasses.asdict(incident)), 201
+    return reply(endpoints.create_incident(services, request.get_json(silent=True)))
 
 
-@app.route("/api/incidents/<int:incident_id>", methods=["GET"])
+@api.route("/api/incidents/<int:incident_id>", methods=["GET"])
 def get_incident(incident_id):
     """
     Obtiene un incident por su ID.
@@ -54,13 +234,10 @@ def get_incident(incident_id):
     tags:
       - Incidents
     """
-    incident = incident_manager.get(incident_id)
-    if incident:
-        return jsonify(dataclasses.asdict(incident))
-    return jsonify({"error": "Incident not found"}), 404
+    return item_response(services.incident_manager, incident_id, "Incident")
 
 
-@app.route("/api/incidents/<int:incident_id>", methods=["PUT"])
+@api.route("/api/incidents/<int:incident_id>", methods=["PUT"])
 def update_incident(incident_id):
     """
     Modifica un incident existente.
@@ -68,32 +245,24 @@ def update_incident(incident_id):
     tags:
       - Incidents
     """
-    data = request.json
-    incident = incident_manager.update(
-        incident_id,
-        description=data.get("description"),
-        incident_type=data.get("incident_type")
-    )
-    if incident:
-        return jsonify(dataclasses.asdict(incident))
-    return jsonify({"error": "Incident not found"}), 404
+    return reply(endpoints.update_incident(services, incident_id, request.get_json(silent=True)))
 
 
 # ------------------------------
 # Endpoints de tickets
 # ------------------------------
-@app.route("/api/tickets/", methods=["GET"])
+@api.route("/api/tickets/", methods=["GET"])
 def show_tickets():
     """
-    Lista todos los tickets registrados.
+    Lista los tickets registrados, paginados por id.
     ---
     tags:
       - Tickets
     """
-    return jsonify([dataclasses.asdict(t) for t in ticket_manager.show()])
+    return list_response("tickets")
 
 
-@app.route("/api/tickets/", methods=["POST"])
+@api.route("/api/tickets/", methods=["POST"])
 def create_ticket():
     """
     Crea un nuevo ticket.
@@ -101,27 +270,21 @@ def create_ticket():
     tags:
       - Tickets
     """
-    data = request.json
+    return reply(endpoints.create_ticket(services, request.get_json(silent=True)))
 
-    incident = incident_manager.get(data["incident_id"])
-    if not incident:
-        return jsonify({"error": "Incident is not valid"}), 400
 
-    client_id = data.get("client_id")
-    if not client_id:
-        return jsonify({"error": "client_id is required"}), 400
-
-    client = client_manager.get(client_id)
-    if not client:
-        return jsonify({"error": "Client not found"}), 404
-
-    service = data.get("service") or "Unknown"
-
-    ticket = ticket_manager.create(client, service, incident.id)
-    return jsonify(dataclasses.asdict(ticket)), 201
+@api.route("/api/tickets/bulk", methods=["POST"])
+def create_tickets_bulk():
+    """
+    Crea varios tickets en una sola transaccion.
+    ---
+    tags:
+      - Tickets
+    """
+    return reply(endpoints.create_tickets_bulk(services, request.get_json(silent=True)))
 
 
-@app.route("/api/tickets/<int:ticket_id>", methods=["GET"])
+@api.route("/api/tickets/<int:ticket_id>", methods=["GET"])
 def get_ticket(ticket_id):
     """
     Obtiene un ticket por su ID.
@@ -129,13 +292,10 @@ def get_ticket(ticket_id):
     tags:
       - Tickets
     """
-    ticket = ticket_manager.get(ticket_id)
-    if ticket:
-        return jsonify(dataclasses.asdict(ticket))
-    return jsonify({"error": "Ticket not found"}), 404
+    return item_response(services.ticket_manager, ticket_id, "Ticket")
 
 
-@app.route("/api/tickets/<int:ticket_id>/close", methods=["PUT"])
+@api.route("/api/tickets/<int:ticket_id>/close", methods=["PUT"])
 def close_ticket(ticket_id):
     """
     Cierra un ticket.
@@ -143,58 +303,40 @@ def close_ticket(ticket_id):
     tags:
       - Tickets
     """
-    ticket = ticket_manager.close(ticket_id)
-    if ticket:
-        return jsonify(dataclasses.asdict(ticket))
-    return jsonify({"error": "Ticket not found"}), 404
+    return reply(endpoints.close_ticket(services, ticket_id, request.get_json(silent=True)))
 
 
-@app.route("/api/tickets/<int:ticket_id>", methods=["PUT"])
+@api.route("/api/tickets/<int:ticket_id>", methods=["PUT"])
 def update_ticket(ticket_id):
-    data = request.json or {}
-
-    incident_id = data.get("incident_id")
-    if incident_id is not None and not incident_manager.get(incident_id):
-        return jsonify({"error": "Invalid incident"}), 400
-
-    client = None
-    if "client_id" in data:
-        client = client_manager.get(data["client_id"])
-        if not client:
-            return jsonify({"error": "Client not found"}), 404
-
-    service = data.get("service")
-    status = data.get("status")
-
-    ticket = ticket_manager.update(
-        ticket_id,
-        client=client,
-        service=service,
-        incident_id=incident_id,
-        status=status
-    )
+    return reply(endpoints.update_ticket(services, ticket_id, request.get_json(silent=True)))
 
-    if not ticket:
-        return jsonify({"error": "Ticket not found"}), 404
 
-    return jsonify(dataclasses.asdict(ticket))
+@api.route("/api/queue/claim", methods=["POST"])
+def claim_ticket():
+    """
+    Asigna al agente el ticket abierto mas prioritario que nadie tomo.
+    ---
+    tags:
+      - Queue
+    """
+    return reply(endpoints.claim_ticket(services, request.get_json(silent=True)))
 
 
 # ------------------------------
 # Endpoints de clientes
 # ------------------------------
-@app.route("/api/clients/", methods=["GET"])
+@api.route("/api/clients/", methods=["GET"])
 def show_clients():
     """
-    Lista todos los clientes registrados.
+    Lista los clientes registrados, paginados por id.
     ---
     tags:
       - Clients
     """
-    return jsonify([dataclasses.asdict(c) for c in client_manager.show()])
+    return list_response("clients")
 
 
-@app.route("/api/clients/<int:client_id>", methods=["GET"])
+@api.route("/api/clients/<int:client_id>", methods=["GET"])
 def get_client(client_id):
     """
     Obtiene un cliente por su ID.
@@ -202,13 +344,10 @@ def get_client(client_id):
     tags:
       - Clients
     """
-    client = client_manager.get(client_id)
-    if client:
-        return jsonify(dataclasses.asdict(client))
-    return jsonify({"error": "Client not found"}), 404
+    return item_response(services.client_manager, client_id, "Client")
 
 
-@app.route("/api/clients/", methods=["POST"])
+@api.route("/api/clients/", methods=["POST"])
 def create_client():
     """
     Crea un nuevo cliente.
@@ -216,16 +355,10 @@ def create_client():
     tags:
       - Clients
     """
-    data = request.json
-    client = client_manager.create(
-        name=data["name"],
-        email=data["email"],
-        phone_number=data["phone_number"]
-    )
-    return jsonify(dataclasses.asdict(client)), 201
+    return reply(endpoints.create_client(services, request.get_json(silent=True)))
 
 
-@app.route("/api/clients/<int:client_id>", methods=["PUT"])
+@api.route("/api/clients/<int:client_id>", methods=["PUT"])
 def update_client(client_id):
     """
     Modifica un cliente existente.
@@ -233,17 +366,149 @@ def update_client(client_id):
     tags:
       - Clients
     """
-    data = request.json or {}
-    client = client_manager.update(
-        client_id,
-        name=data.get("name"),
-        email=data.get("email"),
-        phone_number=data.get("phone_number")
+    return reply(endpoints.update_client(services, client_id, request.get_json(silent=True)))
+
+
+# ------------------------------
+# Endpoint de busqueda
+# ------------------------------
+@api.route("/api/search", methods=["GET"])
+def search():
+    """
+    Busca texto en incidents y tickets, ordenado por relevancia.
+    ---
+    tags:
+      - Search
+    """
+    return reply(endpoints.search(services, request.args))
+
+
+# ------------------------------
+# Endpoints de estadisticas
+# ------------------------------
+@api.route("/api/stats/", methods=["GET"])
+def show_stats():
+    """
+    Totales de tickets abiertos y cerrados y tiempo medio de cierre.
+    ---
+    tags:
+      - Stats
+    """
+    return reply(endpoints.stats_summary(services))
+
+
+@api.route("/api/stats/<dimension>", methods=["GET"])
+def show_stats_by(dimension):
+    """
+    Estadisticas de tickets agrupadas por service, incident_type o day.
+    ---
+    tags:
+      - Stats
+    """
+    return reply(endpoints.stats_by(services, dimension, request.args))
+
+
+# ------------------------------
+# Endpoints de cambios
+# ------------------------------
+@api.route("/api/changes", methods=["GET"])
+def show_changes():
+    """
+    Eventos del changelog posteriores a since, en orden.
+    ---
+    tags:
+      - Changes
+    """
+    return reply(endpoints.changes_page(services, request.args))
+
+
+@api.route("/api/changes/stream", methods=["GET"])
+def stream_changes():
+    """
+    Server-Sent Events con cada cambio, a partir de since o Last-Event-ID.
+    ---
+    tags:
+      - Changes
+    """
+    since, error = endpoints.stream_start(
+        services, request.args.get("since") or request.headers.get("Last-Event-ID")
+    )
+    if error:
+        return reply(error)
+
+    def generate(since):
+        subscription = services.change_feed.subscribe()
+        try:
+            if since is None:
+                since = services.change_manager.last_seq()
+            for seq, frame in endpoints.catch_up(services, since):
+                yield frame
+                since = seq
+            while not subscription.dropped:
+                text, since = endpoints.live_chunk(subscription.get(SSE_KEEPALIVE), since)
+                if text:
+                    yield text
+        finally:
+            subscription.close()
+
+    return Response(generate(since), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+# ------------------------------
+# Importacion y exportacion masiva
+# ------------------------------
+@api.route("/api/export/<entity>", methods=["GET"])
+def export_entity(entity):
+    """
+    Exporta todas las filas de tickets, clients o incidents en CSV o NDJSON, en streaming.
+    ---
+    tags:
+      - Transfer
+    """
+    fmt, error = endpoints.export_args(entity, request.args, request.accept_mimetypes.best)
+    if error:
+        return reply(error)
+    return Response(
+        transfer.export_chunks(services.db, entity, fmt), mimetype=transfer.MIMETYPES[fmt],
+        headers=endpoints.export_headers(entity, fmt)
     )
-    if client:
-        return jsonify(dataclasses.asdict(client))
-    return jsonify({"error": "Client not found"}), 404
+
+
+@api.route("/api/import/<entity>", methods=["POST"])
+def import_entity(entity):
+    """
+    Importa filas de tickets, clients o incidents desde un cuerpo CSV o NDJSON, por lotes.
+    ---
+    tags:
+      - Transfer
+    """
+    options, error = endpoints.import_args(entity, request.args, request.mimetype)
+    if error:
+        return reply(error)
+    body = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    return reply(endpoints.import_entity(services, entity, body, options))
+
+
+# ------------------------------
+# Monitoreo
+# ------------------------------
+@api.route("/metrics", methods=["GET"])
+def show_metrics():
+    """
+    Metricas de pedidos, consultas y pool en formato de texto de Prometheus.
+    ---
+    tags:
+      - Monitoring
+    """
+    return Response(metrics.render(services.gauges()), content_type=METRICS_CONTENT_TYPE)
+
+
+@api.route(api_docs.SPEC_ROUTE, methods=["GET"])
+def apispec():
+    """Especificacion OpenAPI: swagger.yml compilada a JSON (ver api_docs.py)."""
+    return Response(api_docs.spec_json(), mimetype="application/json")
 
 
 if __name__ == "__main__":
-    app.run(debug=True, port=8000)
+    # Servidor de desarrollo, un solo proceso; en produccion, serve.py.
+    create_app().run(debug=os.environ.get("FLASK_DEBUG") == "1", port=8000)
@@ -0,0 +1,55 @@
+"""Mueve al archivo (tickets_archive) los tickets cerrados hace mas de un tiempo.
+
+La tabla tickets queda con el trabajo abierto y lo cerrado hace poco, asi
+sus listados e indices no crecen con la historia. El traslado va en tandas
+cortas para no frenar a los escritores; GET /api/tickets/<id> sigue
+encontrando los tickets archivados y las estadisticas los siguen contando.
+
+Pensado para correr periodicamente (cron o similar).
+
+Uso:
+    python archive_tickets.py [--db db.sqlite] [--older-than 90d] [--chunk-size 500] [--pause 0.05]
+"""
+import argparse
+import sys
+import time
+
+from database import ARCHIVE_CHUNK_SIZE, DB_NAME
+from repository import BACKENDS, create_repository
+from timestamps import now, parse_duration
+
+DEFAULT_AGE = "90d"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archiva los tickets cerrados hace tiempo")
+    parser.add_argument("--db", default=DB_NAME, help="archivo SQLite")
+    parser.add_argument("--backend", choices=list(BACKENDS), help="backend de base (por defecto, TICKETS_DB_BACKEND)")
+    parser.add_argument("--older-than", default=DEFAULT_AGE,
+                        help="antiguedad minima del cierre: segundos o 30d, 12h, ...")
+    parser.add_argument("--chunk-size", type=int, default=ARCHIVE_CHUNK_SIZE, help="tickets por transaccion")
+    parser.add_argument("--pause", type=float, default=0.0, help="segundos de espera entre tandas")
+    args = parser.parse_args(argv)
+    try:
+        age = parse_duration(args.older_than)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    db = create_repository(args.backend, db_name=args.db)
+    try:
+        start = time.perf_counter()
+        moved = db.archive_tickets(now() - age, args.chunk_size, args.pause)
+        seconds = time.perf_counter() - start
+        stats = db.archive_stats()
+    finally:
+        db.close()
+
+    print(f"archived {moved} ticket(s) in {seconds:.1f}s")
+    print(f"live tickets: {stats['live']} ({stats['live_closed']} closed), archived: {stats['archived']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
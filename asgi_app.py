@@ -0,0 +1,454 @@
+"""Variante ASGI (Starlette) de la API de tickets.
+
+Sirve las mismas rutas y el mismo contrato de swagger.yml que app.py, pero
+los handlers no bloquean el event loop: toda la logica que toca la base
+(managers incluidos) corre en los hilos de AsyncDatabaseHandler, asi miles
+de clientes lentos no retienen un hilo cada uno.
+
+La instrumentacion (Server-Timing y /metrics) es la misma que en app.py.
+El perfilado con X-Profile no esta disponible aca: cProfile solo ve el
+hilo del event loop, no los hilos donde corre el trabajo.
+
+La base se abre (y se inicializa) al arrancar el servidor, en el lifespan
+de la app, no al importar el modulo; igual que en app.py, hay una app por
+proceso.
+
+Uso:
+    uvicorn asgi_app:app --port 8000
+"""
+import asyncio
+import io
+import json
+from contextlib import asynccontextmanager
+from queue import Full, Queue
+
+from starlette import responses
+from starlette.applications import Starlette
+from starlette.datastructures import MutableHeaders
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from database import AsyncDatabaseHandler
+from repository import create_repository
+from instrumentation import Metrics, begin_request, end_request, log_request, phase
+from endpoints import (
+    CORS_EXPOSE_HEADERS, METRICS_CONTENT_TYPE, SSE_HEADERS, SSE_KEEPALIVE, Services
+)
+import api_docs
+import endpoints
+import transfer
+
+# Fragmentos del cuerpo de una importacion en espera de ser leidos.
+IMPORT_QUEUE = 16
+
+# Se crean en el lifespan de la app (ver create_app).
+services = None
+adb = None
+metrics = Metrics()
+
+
+class JSONResponse(responses.JSONResponse):
+    """JSONResponse con la serializacion medida como fase."""
+
+    def render(self, content):
+        with phase("serialize"):
+            return super().render(content)
+
+
+def reply(result):
+    """Respuesta JSON de una operacion de endpoints: (cuerpo, status, headers)."""
+    body, status, headers = result
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+async def run(operation, *args):
+    """Corre ``operation(services, *args)`` en los hilos de base y arma la respuesta."""
+    return reply(await adb.run(operation, services, *args))
+
+
+async def read_json(request):
+    body = await request.body()
+    try:
+        with phase("decode"):
+            return json.loads(body)
+    except ValueError:
+        return None
+
+
+def accepted(request):
+    """El tipo preferido del header Accept (el primero)."""
+    return request.headers.get("accept", "").split(",")[0].strip()
+
+
+async def conditional_response(request, stamp, build):
+    """Responde 304 si el cliente ya tiene la version indicada por ``stamp``.
+
+    ``stamp`` es (etag, last_modified) o None; ``build`` es una corrutina
+    que arma la respuesta completa y solo se espera si hace falta.
+    """
+    if stamp is None:
+        return await build()
+    fresh = endpoints.is_fresh(
+        stamp, request.headers.get("if-none-match"), request.headers.get("if-modified-since")
+    )
+    response = Response(status_code=304) if fresh else await build()
+    if response.status_code in (200, 304):
+        response.headers.update(endpoints.stamp_headers(stamp))
+    return response
+
+
+async def list_response(request, entity):
+    params, message = endpoints.list_args(entity, request.query_params)
+    if message:
+        return reply(endpoints.error(message, 400))
+    manager = services.list_managers[entity]
+    fmt = endpoints.stream_format(accepted(request), request.query_params.get("stream"))
+
+    async def build():
+        if fmt is None:
+            return reply(await adb.run(endpoints.list_page, manager, params))
+        del params["limit"]
+        # Leer y serializar corre en los hilos de base, de a STREAM_BATCH filas.
+        chunks = endpoints.stream_chunks(manager.stream_dicts(**params), fmt)
+        return StreamingResponse(adb.iterate(chunks, batch=1), media_type=endpoints.stream_mimetype(fmt))
+
+    if not endpoints.list_is_conditional(params):
+        return await build()
+    stamp = await adb.run(manager.list_stamp, f"{request.url.path}?{request.url.query} {fmt}")
+    return await conditional_response(request, stamp, build)
+
+
+async def item_response(request, manager, item_id, label):
+    async def build():
+        return reply(await adb.run(endpoints.get_item, manager, item_id, label))
+    return await conditional_response(request, await adb.run(manager.stamp, item_id), build)
+
+
+# ------------------------------
+# Endpoints de incidentes
+# ------------------------------
+async def show_incidents(request):
+    return await list_response(request, "incidents")
+
+
+async def create_incident(request):
+    return await run(endpoints.create_incident, await read_json(request))
+
+
+async def get_incident(request):
+    return await item_response(request, services.incident_manager, request.path_params["incident_id"], "Incident")
+
+
+async def update_incident(request):
+    return await run(endpoints.update_incident, request.path_params["incident_id"], await read_json(request))
+
+
+# ------------------------------
+# Endpoints de tickets
+# ------------------------------
+async def show_tickets(request):
+    return await list_response(request, "tickets")
+
+
+async def create_ticket(request):
+    return await run(endpoints.create_ticket, await read_json(request))
+
+
+async def create_tickets_bulk(request):
+    return await run(endpoints.create_tickets_bulk, await read_json(request))
+
+
+async def get_ticket(request):
+    return await item_response(request, services.ticket_manager, request.path_params["ticket_id"], "Ticket")
+
+
+async def close_ticket(request):
+    return await run(endpoints.close_ticket, request.path_params["ticket_id"], await read_json(request))
+
+
+async def update_ticket(request):
+    return await run(endpoints.update_ticket, request.path_params["ticket_id"], await read_json(request))
+
+
+async def claim_ticket(request):
+    return await run(endpoints.claim_ticket, await read_json(request))
+
+
+# ------------------------------
+# Endpoints de clientes
+# ------------------------------
+async def show_clients(request):
+    return await list_response(request, "clients")
+
+
+async def get_client(request):
+    return await item_response(request, services.client_manager, request.path_params["client_id"], "Client")
+
+
+async def create_client(request):
+    return await run(endpoints.create_client, await read_json(request))
+
+
+async def update_client(request):
+    return await run(endpoints.update_client, request.path_params["client_id"], await read_json(request))
+
+
+# ------------------------------
+# Endpoints de busqueda y estadisticas
+# ------------------------------
+async def search(request):
+    return await run(endpoints.search, request.query_params)
+
+
+async def show_stats(request):
+    return await run(endpoints.stats_summary)
+
+
+async def show_stats_by(request):
+    return await run(endpoints.stats_by, request.path_params["dimension"], request.query_params)
+
+
+# ------------------------------
+# Endpoints de cambios
+# ------------------------------
+async def show_changes(request):
+    return await run(endpoints.changes_page, request.query_params)
+
+
+async def stream_changes(request):
+    since, error = await adb.run(
+        endpoints.stream_start, services,
+        request.query_params.get("since") or request.headers.get("last-event-id")
+    )
+    if error:
+        return reply(error)
+
+    async def body(since):
+        # Cada conexion es una corrutina y una cola: miles de tableros no
+        # ocupan hilos, y los eventos nuevos salen de una sola lectura.
+        subscription = services.change_feed.subscribe(asyncio.get_running_loop())
+        try:
+            if since is None:
+                since = await adb.run(services.change_manager.last_seq)
+            async for seq, frame in adb.iterate(endpoints.catch_up(services, since)):
+                yield frame
+                since = seq
+            while not subscription.dropped:
+                text, since = endpoints.live_chunk(await subscription.get(SSE_KEEPALIVE), since)
+                if text:
+                    yield text
+        finally:
+            subscription.close()
+
+    return StreamingResponse(body(since), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+# ------------------------------
+# Importacion y exportacion masiva
+# ------------------------------
+class BodyReader(io.RawIOBase):
+    """Cuerpo del pedido como archivo de lectura bloqueante, para importar en un hilo de base.
+
+    El event loop lo alimenta de a fragmentos por una cola acotada, asi el
+    cuerpo nunca esta entero en memoria y un cliente rapido espera al hilo.
+    """
+
+    def __init__(self, maxsize=IMPORT_QUEUE):
+        self.chunks = Queue(maxsize)
+        self.pending = b""
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending and not self.eof:
+            chunk = self.chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if chunk is None:
+                self.eof = True
+            else:
+                self.pending = chunk
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    async def feed(self, chunk, consumer):
+        """Encola ``chunk`` (None es el fin); devuelve False si ``consumer`` ya termino."""
+        while True:
+            if consumer.done():
+                return False
+            try:
+                self.chunks.put_nowait(chunk)
+                return True
+            except Full:
+                await asyncio.sleep(0.005)
+
+
+async def export_entity(request):
+    entity = request.path_params["entity"]
+    fmt, error = endpoints.export_args(entity, request.query_params, accepted(request))
+    if error:
+        return reply(error)
+    return StreamingResponse(
+        adb.iterate(transfer.export_chunks(services.db, entity, fmt), batch=1),
+        media_type=transfer.MIMETYPES[fmt], headers=endpoints.export_headers(entity, fmt)
+    )
+
+
+async def import_entity(request):
+    entity = request.path_params["entity"]
+    mimetype = request.headers.get("content-type", "").split(";")[0].strip()
+    options, error = endpoints.import_args(entity, request.query_params, mimetype)
+    if error:
+        return reply(error)
+
+    reader = BodyReader()
+    body = io.TextIOWrapper(io.BufferedReader(reader), encoding="utf-8", newline="")
+    task = asyncio.ensure_future(adb.run(endpoints.import_entity, services, entity, body, options))
+    try:
+        async for chunk in request.stream():
+            if chunk and not await reader.feed(chunk, task):
+                break
+        await reader.feed(None, task)
+    except BaseException:
+        await reader.feed(ConnectionError("request body interrupted"), task)
+        raise
+    return reply(await task)
+
+
+# ------------------------------
+# Monitoreo
+# ------------------------------
+async def show_metrics(request):
+    return Response(metrics.render(services.gauges()), media_type=METRICS_CONTENT_TYPE)
+
+
+class TimingMiddleware:
+    """Mide cada pedido HTTP y agrega Server-Timing, como los hooks de app.py.
+
+    Se registra al empezar la respuesta: el cuerpo de un streaming no entra
+    en la cuenta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timing, token = begin_request()
+        observed = False
+
+        def observe(status):
+            nonlocal observed
+            observed = True
+            elapsed = timing.elapsed()
+            route = ROUTE_PATHS.get(scope.get("endpoint"), "unmatched")
+            metrics.observe(scope["method"], route, status, elapsed, timing)
+            log_request(scope["method"], route, status, elapsed, timing)
+            return elapsed
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start" and not observed:
+                elapsed = observe(message["status"])
+                MutableHeaders(scope=message).append("Server-Timing", timing.server_timing(elapsed))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            if not observed:
+                observe(500)
+            end_request(token)
+
+
+class CacheSyncMiddleware:
+    """Antes de cada pedido HTTP, saca de las caches lo que escribieron otros procesos.
+
+    Es el before_request de app.py; la consulta a table_changes corre en
+    los hilos de base.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and services.needs_cache_sync(scope["path"]):
+            await adb.run(services.cache_sync.sync)
+        await self.app(scope, receive, send)
+
+
+async def apispec(request):
+    return Response(api_docs.spec_json(), media_type="application/json")
+
+
+routes = [
+    Route("/api/incidents/", show_incidents, methods=["GET"]),
+    Route("/api/incidents/", create_incident, methods=["POST"]),
+    Route("/api/incidents/{incident_id:int}", get_incident, methods=["GET"]),
+    Route("/api/incidents/{incident_id:int}", update_incident, methods=["PUT"]),
+    Route("/api/tickets/", show_tickets, methods=["GET"]),
+    Route("/api/tickets/", create_ticket, methods=["POST"]),
+    Route("/api/tickets/bulk", create_tickets_bulk, methods=["POST"]),
+    Route("/api/tickets/{ticket_id:int}", get_ticket, methods=["GET"]),
+    Route("/api/tickets/{ticket_id:int}", update_ticket, methods=["PUT"]),
+    Route("/api/tickets/{ticket_id:int}/close", close_ticket, methods=["PUT"]),
+    Route("/api/queue/claim", claim_ticket, methods=["POST"]),
+    Route("/api/clients/", show_clients, methods=["GET"]),
+    Route("/api/clients/", create_client, methods=["POST"]),
+    Route("/api/clients/{client_id:int}", get_client, methods=["GET"]),
+    Route("/api/clients/{client_id:int}", update_client, methods=["PUT"]),
+    Route("/api/search", search, methods=["GET"]),
+    Route("/api/stats/", show_stats, methods=["GET"]),
+    Route("/api/stats/{dimension}", show_stats_by, methods=["GET"]),
+    Route("/api/changes", show_changes, methods=["GET"]),
+    Route("/api/changes/stream", stream_changes, methods=["GET"]),
+    Route("/api/export/{entity}", export_entity, methods=["GET"]),
+    Route("/api/import/{entity}", import_entity, methods=["POST"]),
+    Route("/metrics", show_metrics, methods=["GET"]),
+    Route(api_docs.SPEC_ROUTE, apispec, methods=["GET"]),
+]
+# Plantilla de ruta por handler, para etiquetar las metricas.
+ROUTE_PATHS = {route.endpoint: route.path for route in routes}
+
+
+def create_app(database=None, multiprocess=None):
+    """Arma la app Starlette; la base se abre al arrancar el servidor.
+
+    ``database`` es un Repository ya creado; por defecto, create_repository()
+    (backend segun TICKETS_DB_BACKEND). Se cierra al apagar. Abrir la
+    base, correr init_db y levantar los hilos de AsyncDatabaseHandler pasa
+    en el lifespan, asi importar el modulo no tiene efectos.
+    ``multiprocess`` es el de endpoints.Services: con una base en archivo,
+    cada pedido empieza invalidando lo que escribieron otros procesos.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app):
+        global services, adb
+        services = Services(database if database is not None else create_repository(), multiprocess)
+        adb = AsyncDatabaseHandler(services.db)
+        try:
+            yield
+        finally:
+            services.change_feed.close()
+            adb.close()
+
+    return Starlette(
+        routes=routes,
+        middleware=[
+            Middleware(CORSMiddleware, allow_origins=["*"], expose_headers=CORS_EXPOSE_HEADERS),
+            Middleware(TimingMiddleware),
+            Middleware(CacheSyncMiddleware),
+        ],
+        lifespan=lifespan,
+    )
+
+
+app = create_app()
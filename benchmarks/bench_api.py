@@ -0,0 +1,440 @@
+"""Benchmark de la API: carga mixta de lecturas y escrituras sobre todas las rutas.
+
+Siembra una base temporal con N clientes, M incidents y K tickets y corre
+la misma carga (reproducible con --seed) contra la app Flask de dos formas:
+
+- testclient: app.test_client() dentro del mismo proceso (mide la app sin
+  la capa HTTP);
+- server: la app servida por el servidor WSGI de werkzeug en un subproceso,
+  con clientes HTTP reales.
+
+Informa latencia p50/p95/p99 (total y por ruta), throughput, errores y el
+pico de memoria (VmHWM) del proceso que corre la app. Compara contra un
+baseline guardado en JSON: con --save-baseline guarda la corrida actual, y
+con --check devuelve codigo de salida 1 si alguna metrica empeoro mas que
+--threshold. El baseline depende de la maquina; conviene guardarlo y
+compararlo en la misma.
+
+Con --backend se elige el backend de repository que usa la app (ver
+bench_backends.py para compararlos operacion por operacion).
+
+GET /api/changes/stream no entra en la carga: es una conexion que queda
+abierta y no tiene latencia por pedido.
+
+Uso (desde la raiz del repo):
+    python benchmarks/bench_api.py [--clients 1000] [--incidents 200] [--tickets 50000]
+        [--requests 5000] [--concurrency 8] [--write-ratio 0.2] [--modes testclient server]
+        [--backend sqlite|sqlalchemy]
+        [--baseline benchmarks/baseline.json] [--save-baseline] [--check]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from database import DatabaseHandler  # noqa: E402
+from repository import BACKEND_ENV, BACKENDS  # noqa: E402
+from bench_async import free_port, percentile, wait_for_port  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SEED_CHUNK = 10000
+START_EPOCH = 1704067200  # 2024-01-01 UTC
+SEED_SPAN = 365 * 86400
+
+SERVICES = ["Email Support", "Phone Support", "Web Hosting", "VPN", "Billing", "Networking"]
+INCIDENT_TYPES = ["Network", "Software", "Hardware", "Security", "Billing"]
+WORDS = ["red", "caida", "servidor", "correo", "lento", "acceso", "error", "impresora",
+         "disco", "backup", "firewall", "licencia", "usuario", "clave", "dns", "latencia"]
+STATUSES = ["Open", "In Progress", "Closed"]
+
+
+class Dataset:
+    """Tamanos sembrados; las operaciones eligen ids dentro de esos rangos."""
+
+    def __init__(self, clients, incidents, tickets):
+        self.clients = clients
+        self.incidents = incidents
+        self.tickets = tickets
+
+
+def seed(path, dataset, rng):
+    """Crea la base en ``path``; los triggers llenan FTS, estadisticas y changelog."""
+    db = DatabaseHandler(path)
+    try:
+        db.executemany(
+            "INSERT INTO clients (name, email, phone_number, updated_at) VALUES (?, ?, ?, ?)",
+            [(f"Cliente {i}", f"cliente{i}@example.com", f"555-{i:06d}", START_EPOCH)
+             for i in range(1, dataset.clients + 1)]
+        )
+        db.executemany(
+            "INSERT INTO incidents (description, incident_type, updated_at) VALUES (?, ?, ?)",
+            [(" ".join(rng.sample(WORDS, 4)), rng.choice(INCIDENT_TYPES), START_EPOCH)
+             for _ in range(dataset.incidents)]
+        )
+        for start in range(0, dataset.tickets, SEED_CHUNK):
+            batch = []
+            for _ in range(min(SEED_CHUNK, dataset.tickets - start)):
+                created_at = START_EPOCH + rng.randrange(SEED_SPAN)
+                status = rng.choice(STATUSES)
+                batch.append({
+                    "id": None, "client_id": rng.randint(1, dataset.clients),
+                    "service": rng.choice(SERVICES), "incident_id": rng.randint(1, dataset.incidents),
+                    "status": status, "created_at": created_at,
+                    "closed_at": created_at + rng.randrange(7 * 86400) if status == "Closed" else None
+                })
+            db.save_tickets_many(batch)
+    finally:
+        services.close()
+
+
+# ------------------------------
+# Carga: (nombre, peso, arma el pedido) -> (metodo, ruta, cuerpo JSON)
+# ------------------------------
+def _ticket_filters(rng, data):
+    choice = rng.randrange(5)
+    if choice == 0:
+        return f"status={rng.choice(STATUSES).replace(' ', '%20')}"
+    if choice == 1:
+        return f"service={rng.choice(SERVICES).replace(' ', '%20')}"
+    if choice == 2:
+        return f"incident_id={rng.randint(1, data.incidents)}"
+    if choice == 3:
+        start = START_EPOCH + rng.randrange(SEED_SPAN)
+        return f"created_after={start}&created_before={start + 7 * 86400}"
+    return f"after_id={rng.randint(0, data.tickets)}"
+
+
+READS = [
+    ("GET /api/incidents/", 4, lambda rng, data: (
+        "GET", f"/api/incidents/?limit=50&after_id={rng.randint(0, data.incidents)}", None)),
+    ("GET /api/incidents/<id>", 8, lambda rng, data: (
+        "GET", f"/api/incidents/{rng.randint(1, data.incidents)}", None)),
+    ("GET /api/tickets/", 12, lambda rng, data: (
+        "GET", f"/api/tickets/?limit=50&{_ticket_filters(rng, data)}", None)),
+    ("GET /api/tickets/<id>", 25, lambda rng, data: (
+        "GET", f"/api/tickets/{rng.randint(1, data.tickets)}", None)),
+    ("GET /api/clients/", 4, lambda rng, data: (
+        "GET", f"/api/clients/?limit=50&after_id={rng.randint(0, data.clients)}", None)),
+    ("GET /api/clients/<id>", 10, lambda rng, data: (
+        "GET", f"/api/clients/{rng.randint(1, data.clients)}", None)),
+    ("GET /api/search", 5, lambda rng, data: (
+        "GET", f"/api/search?q={'%20'.join(rng.sample(WORDS, 2))}&limit=20", None)),
+    ("GET /api/stats/", 2, lambda rng, data: ("GET", "/api/stats/", None)),
+    ("GET /api/stats/<dimension>", 3, lambda rng, data: (
+        "GET", f"/api/stats/{rng.choice(['service', 'incident_type', 'day'])}", None)),
+    ("GET /api/changes", 3, lambda rng, data: (
+        "GET", f"/api/changes?since={rng.randint(0, data.tickets)}&limit=100", None)),
+]
+
+WRITES = [
+    ("POST /api/incidents/", 1, lambda rng, data: (
+        "POST", "/api/incidents/",
+        {"description": " ".join(rng.sample(WORDS, 4)), "incident_type": rng.choice(INCIDENT_TYPES)})),
+    ("PUT /api/incidents/<id>", 1, lambda rng, data: (
+        "PUT", f"/api/incidents/{rng.randint(1, data.incidents)}",
+        {"description": " ".join(rng.sample(WORDS, 4))})),
+    ("POST /api/tickets/", 6, lambda rng, data: (
+        "POST", "/api/tickets/",
+        {"client_id": rng.randint(1, data.clients), "incident_id": rng.randint(1, data.incidents),
+         "service": rng.choice(SERVICES)})),
+    ("POST /api/tickets/bulk", 1, lambda rng, data: (
+        "POST", "/api/tickets/bulk",
+        [{"client_id": rng.randint(1, data.clients), "incident_id": rng.randint(1, data.incidents),
+          "service": rng.choice(SERVICES)} for _ in range(20)])),
+    ("PUT /api/tickets/<id>", 3, lambda rng, data: (
+        "PUT", f"/api/tickets/{rng.randint(1, data.tickets)}",
+        {"status": rng.choice(STATUSES[:2]), "service": rng.choice(SERVICES)})),
+    ("PUT /api/tickets/<id>/close", 3, lambda rng, data: (
+        "PUT", f"/api/tickets/{rng.randint(1, data.tickets)}/close", None)),
+    ("POST /api/clients/", 1, lambda rng, data: (
+        "POST", "/api/clients/",
+        {"name": "Cliente nuevo", "email": f"nuevo{rng.randrange(10 ** 9)}@example.com",
+         "phone_number": "555-0000"})),
+    ("PUT /api/clients/<id>", 1, lambda rng, data: (
+        "PUT", f"/api/clients/{rng.randint(1, data.clients)}", {"phone_number": "555-9999"})),
+]
+
+
+def build_plan(total, write_ratio, data, rng):
+    """Lista fija de pedidos: la misma para todos los modos con el mismo --seed."""
+    plan = []
+    for _ in range(total):
+        ops = WRITES if rng.random() < write_ratio else READS
+        name, _, make = rng.choices(ops, weights=[op[1] for op in ops])[0]
+        plan.append((name, *make(rng, data)))
+    return plan
+
+
+# ------------------------------
+# Ejecutores
+# ------------------------------
+def run_plan(plan, concurrency, make_sender):
+    """Reparte ``plan`` entre ``concurrency`` hilos.
+
+    ``make_sender()`` se llama una vez por hilo y devuelve
+    send(metodo, ruta, cuerpo) -> status.
+    """
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    remaining = iter(plan)
+
+    def worker():
+        send = make_sender()
+        local, local_errors = defaultdict(list), defaultdict(int)
+        while True:
+            with lock:
+                item = next(remaining, None)
+            if item is None:
+                break
+            name, method, path, body = item
+            start = time.perf_counter()
+            try:
+                status = send(method, path, body)
+            except (OSError, http.client.HTTPException):
+                status = None
+            local[name].append(time.perf_counter() - start)
+            if status is None or status >= 400:
+                local_errors[name] += 1
+        with lock:
+            for name, values in local.items():
+                latencies[name].extend(values)
+            for name, count in local_errors.items():
+                errors[name] += count
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, latencies, errors
+
+
+def peak_rss_mb(pid=None):
+    """Pico de memoria residente (VmHWM) de ``pid``, o del proceso actual."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid is None:
+        # Fuera de Linux: ru_maxrss viene en KB (en bytes en macOS).
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    return None
+
+
+def run_testclient(workdir, plan, args):
+    """Corre la carga contra app.test_client() en este mismo proceso."""
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    os.environ[BACKEND_ENV] = args.backend
+    try:
+        from app import app, services
+        app.config["TESTING"] = True
+
+        def make_sender():
+            client = app.test_client()
+
+            def send(method, path, body):
+                return client.open(path, method=method, json=body).status_code
+            return send
+
+        run_plan(plan[:args.warmup], args.concurrency, make_sender)
+        result = run_plan(plan[args.warmup:], args.concurrency, make_sender)
+        services.close()
+    finally:
+        os.chdir(cwd)
+    return (*result, peak_rss_mb())
+
+
+def http_sender(port):
+    """make_sender para run_plan: una conexion HTTP keep-alive por hilo contra ``port``."""
+    def make_sender():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+        def send(method, path, body):
+            headers = {}
+            payload = None
+            if body is not None:
+                payload = json.dumps(body)
+                headers["Content-Type"] = "application/json"
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                raise
+            return response.status
+        return send
+    return make_sender
+
+
+def run_server(workdir, plan, args):
+    """Corre la carga con HTTP real contra el servidor WSGI de werkzeug."""
+    port = free_port()
+    cmd = [sys.executable, "-c",
+           f"from app import app; app.run(port={port}, threaded=True, debug=False)"]
+    env = dict(os.environ, PYTHONPATH=ROOT, **{BACKEND_ENV: args.backend})
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    make_sender = http_sender(port)
+    try:
+        wait_for_port(port)
+        run_plan(plan[:args.warmup], args.concurrency, make_sender)
+        result = run_plan(plan[args.warmup:], args.concurrency, make_sender)
+        rss = peak_rss_mb(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return (*result, rss)
+
+
+MODES = {"testclient": run_testclient, "server": run_server}
+
+
+# ------------------------------
+# Resultados y baseline
+# ------------------------------
+def summarize(elapsed, latencies, errors, rss):
+    everything = sorted(v for values in latencies.values() for v in values)
+    routes = {}
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        routes[name] = {
+            "count": len(values), "errors": errors.get(name, 0),
+            **{f"p{p}_ms": percentile(values, p) * 1000 for p in (50, 95, 99)}
+        }
+    return {
+        "requests": len(everything),
+        "throughput": len(everything) / elapsed,
+        "errors": sum(errors.values()),
+        "peak_rss_mb": rss,
+        **{f"p{p}_ms": percentile(everything, p) * 1000 for p in (50, 95, 99)},
+        "routes": routes,
+    }
+
+
+def print_summary(mode, summary):
+    rss = f"{summary['peak_rss_mb']:.1f} MB" if summary["peak_rss_mb"] is not None else "n/a"
+    print(f"[{mode}] {summary['requests']} requests  {summary['throughput']:.1f} req/s  "
+          f"p50 {summary['p50_ms']:.2f} ms  p95 {summary['p95_ms']:.2f} ms  "
+          f"p99 {summary['p99_ms']:.2f} ms  errors {summary['errors']}  peak RSS {rss}")
+    print(f"  {'route':32} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>6}")
+    for name, route in summary["routes"].items():
+        print(f"  {name:32} {route['count']:6} {route['p50_ms']:9.2f} {route['p95_ms']:9.2f} "
+              f"{route['p99_ms']:9.2f} {route['errors']:6}")
+
+
+def _change(old, new):
+    return (new - old) / old * 100 if old else 0.0
+
+
+def compare(mode, summary, baseline, threshold):
+    """Imprime la diferencia contra el baseline y devuelve cuantas metricas empeoraron."""
+    print(f"  vs baseline ({threshold:g}% de tolerancia):")
+    # (metrica, mas alto es mejor)
+    metrics = [("throughput", True), ("p50_ms", False), ("p95_ms", False),
+               ("p99_ms", False), ("peak_rss_mb", False)]
+    worse = 0
+    for metric, higher_is_better in metrics:
+        old, new = baseline.get(metric), summary.get(metric)
+        if old is None or new is None:
+            continue
+        change = _change(old, new)
+        regressed = (change < -threshold) if higher_is_better else (change > threshold)
+        worse += regressed
+        mark = "WORSE" if regressed else ""
+        print(f"    {metric:12} {old:10.2f} -> {new:10.2f}  {change:+7.1f}%  {mark}")
+    # Por ruta hay pocas muestras y el p95 es ruidoso: se muestra pero no cuenta.
+    for name, route in summary["routes"].items():
+        old = baseline.get("routes", {}).get(name)
+        if old is None:
+            continue
+        change = _change(old["p95_ms"], route["p95_ms"])
+        if change > threshold:
+            print(f"    {name:32} p95 {old['p95_ms']:.2f} -> {route['p95_ms']:.2f} ms  "
+                  f"{change:+.1f}%  slower")
+    return worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--incidents", type=int, default=200)
+    parser.add_argument("--tickets", type=int, default=50000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200, help="pedidos iniciales que no se miden")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="fraccion de escrituras en la carga")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--backend", default="sqlite", choices=list(BACKENDS))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="archivo JSON del baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="guardar esta corrida como baseline")
+    parser.add_argument("--check", action="store_true",
+                        help="codigo de salida 1 si alguna metrica empeoro mas que --threshold")
+    parser.add_argument("--threshold", type=float, default=10.0, help="tolerancia en porcentaje")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    data = Dataset(args.clients, args.incidents, args.tickets)
+    plan = build_plan(args.warmup + args.requests, args.write_ratio, data, rng)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results, worse = {}, 0
+    with tempfile.TemporaryDirectory() as tmp:
+        seeded = os.path.join(tmp, "seed.sqlite")
+        start = time.perf_counter()
+        seed(seeded, data, rng)
+        print(f"seeded {args.clients} clients, {args.incidents} incidents, {args.tickets} tickets "
+              f"in {time.perf_counter() - start:.1f} s")
+        print(f"{args.requests} requests (+{args.warmup} warmup), {args.concurrency} concurrent, "
+              f"write ratio {args.write_ratio:g}, backend {args.backend}\n")
+        for mode in args.modes:
+            # Cada modo arranca de la misma base: las escrituras de uno no afectan al otro.
+            workdir = os.path.join(tmp, mode)
+            os.mkdir(workdir)
+            shutil.copy(seeded, os.path.join(workdir, "db.sqlite"))
+            shutil.copy(os.path.join(ROOT, "swagger.yml"), workdir)
+            # El baseline guarda cada backend por separado: "sqlite/server", ...
+            key = f"{args.backend}/{mode}"
+            results[key] = summarize(*MODES[mode](workdir, plan, args))
+            print_summary(key, results[key])
+            if key in baseline:
+                worse += compare(key, results[key], baseline[key], args.threshold)
+            print()
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+    if args.check and worse:
+        print(f"{worse} metric(s) worse than baseline")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
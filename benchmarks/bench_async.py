@@ -0,0 +1,149 @@
+"""Prueba de carga: app Flask (WSGI, un hilo por conexion) vs asgi_app.
+
+Levanta cada servidor en un subproceso sobre una base temporal sembrada,
+y lo golpea con N clientes concurrentes que piden GET /api/tickets/<id>.
+Con --slow-ms cada cliente tarda ese tiempo en terminar de mandar el pedido
+(simula clientes lentos): en el servidor por hilos cada uno retiene un hilo,
+en el ASGI solo una corrutina.
+
+Uso (desde la raiz del repo; requiere uvicorn):
+    python benchmarks/bench_async.py [--concurrency 200] [--requests 2000] [--slow-ms 50]
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from database import DatabaseHandler  # noqa: E402
+
+SERVERS = {
+    "flask": [sys.executable, "-c",
+              "from app import app; app.run(port={port}, threaded=True, debug=False)"],
+    "asgi": [sys.executable, "-m", "uvicorn", "asgi_app:app", "--port", "{port}",
+             "--log-level", "warning"],
+}
+
+
+def seed(workdir, tickets):
+    db = DatabaseHandler(os.path.join(workdir, "db.sqlite"))
+    client = db.save_client({"id": None, "name": "Ana", "email": "ana@example.com", "phone_number": "555-0100"})
+    incident = db.save_incident({"id": None, "description": "Sin servicio", "incident_type": "Network"})
+    db.save_tickets_many([
+        {
+            "id": None, "client_id": client["id"], "service": "Email Support",
+            "incident_id": incident["id"], "status": "Open",
+            "created_at": 1704067200, "closed_at": None
+        }
+        for _ in range(tickets)
+    ])
+    db.close()
+    shutil.copy(os.path.join(ROOT, "swagger.yml"), workdir)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+async def one_request(port, ticket_id, slow):
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(f"GET /api/tickets/{ticket_id} HTTP/1.1\r\n".encode())
+        await writer.drain()
+        if slow:
+            await asyncio.sleep(slow)
+        writer.write(b"Host: localhost\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+    finally:
+        writer.close()
+    ok = status_line.split(b" ")[1:2] == [b"200"]
+    return time.perf_counter() - start, ok
+
+
+async def load(port, concurrency, total, tickets, slow):
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            try:
+                elapsed, ok = await one_request(port, random.randint(1, tickets), slow)
+                latencies.append(elapsed)
+                errors += not ok
+            except OSError:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, sorted(latencies), errors
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_server(name, workdir, args):
+    port = free_port()
+    cmd = [part.format(port=port) for part in SERVERS[name]]
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        elapsed, latencies, errors = asyncio.run(
+            load(port, args.concurrency, args.requests, args.tickets, args.slow_ms / 1000)
+        )
+    finally:
+        proc.terminate()
+        proc.wait()
+    print(f"{name:6} {len(latencies) / elapsed:9.1f} req/s  "
+          f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:7.1f} ms  errors {errors}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--tickets", type=int, default=10000)
+    parser.add_argument("--slow-ms", type=float, default=0)
+    parser.add_argument("--servers", nargs="+", default=list(SERVERS), choices=list(SERVERS))
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        seed(workdir, args.tickets)
+        print(f"{args.requests} requests, {args.concurrency} concurrent clients, "
+              f"{args.slow_ms:g} ms slow send\n")
+        for name in args.servers:
+            run_server(name, workdir, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Compara los backends de repository (sqlite y sqlalchemy) operacion por operacion.
+
+Siembra una base (como bench_api) y corre, sobre una copia para cada
+backend, las mismas operaciones del repositorio con los mismos parametros:
+lecturas por id, listados paginados con filtros, lotes por id y altas.
+Informa operaciones por segundo y latencia p50/p99 de cada una.
+
+Para comparar la API completa con cada backend:
+    python benchmarks/bench_api.py --backend sqlalchemy
+
+Uso (desde la raiz del repo; el backend sqlalchemy requiere SQLAlchemy):
+    python benchmarks/bench_backends.py [--tickets 50000] [--ops 2000] [--threads 1]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from repository import BACKENDS, create_repository  # noqa: E402
+from bench_api import (  # noqa: E402
+    Dataset, SEED_SPAN, SERVICES, START_EPOCH, STATUSES, seed
+)
+from bench_async import percentile  # noqa: E402
+
+# (nombre, llamada(db, rng, data)); las escrituras van al final para que
+# las lecturas vean la misma base en los dos backends.
+OPERATIONS = [
+    ("get_ticket", lambda db, rng, data: db.get_ticket(rng.randint(1, data.tickets))),
+    ("get_incident", lambda db, rng, data: db.get_incident(rng.randint(1, data.incidents))),
+    ("get_client", lambda db, rng, data: db.get_client(rng.randint(1, data.clients))),
+    ("get_clients_by_ids", lambda db, rng, data: db.get_clients_by_ids(
+        [rng.randint(1, data.clients) for _ in range(20)])),
+    ("get_tickets_page", lambda db, rng, data: db.get_tickets_page(
+        after_id=rng.randint(0, data.tickets), limit=50)),
+    ("get_tickets_page status", lambda db, rng, data: db.get_tickets_page(
+        status=rng.choice(STATUSES), limit=50)),
+    ("get_tickets_page created", lambda db, rng, data: db.get_tickets_page(
+        created_after=START_EPOCH + rng.randrange(SEED_SPAN), limit=50)),
+    ("get_clients_page", lambda db, rng, data: db.get_clients_page(
+        after_id=rng.randint(0, data.clients), limit=50)),
+    ("save_ticket", lambda db, rng, data: db.save_ticket({
+        "id": None, "client_id": rng.randint(1, data.clients), "service": rng.choice(SERVICES),
+        "incident_id": rng.randint(1, data.incidents), "status": "Open",
+        "created_at": START_EPOCH, "closed_at": None})),
+    ("save_tickets_many x50", lambda db, rng, data: db.save_tickets_many([{
+        "id": None, "client_id": rng.randint(1, data.clients), "service": rng.choice(SERVICES),
+        "incident_id": rng.randint(1, data.incidents), "status": "Open",
+        "created_at": START_EPOCH, "closed_at": None} for _ in range(50)])),
+    ("close_ticket", lambda db, rng, data: db.close_ticket(rng.randint(1, data.tickets), START_EPOCH)),
+]
+
+
+def run_operation(db, call, data, ops, threads, seed_value):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(seed_value * 1000 + index)
+        local = []
+        for _ in range(ops // threads):
+            start = time.perf_counter()
+            call(db, rng, data)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--incidents", type=int, default=200)
+    parser.add_argument("--tickets", type=int, default=50000)
+    parser.add_argument("--ops", type=int, default=2000, help="repeticiones de cada operacion")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    args = parser.parse_args(argv)
+
+    data = Dataset(args.clients, args.incidents, args.tickets)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        seeded = os.path.join(tmp, "seed.sqlite")
+        seed(seeded, data, random.Random(args.seed))
+        for backend in args.backends:
+            path = os.path.join(tmp, f"{backend}.sqlite")
+            shutil.copy(seeded, path)
+            db = create_repository(backend, db_name=path, size=max(args.threads, 1))
+            try:
+                for index, (name, call) in enumerate(OPERATIONS):
+                    elapsed, latencies = run_operation(db, call, data, args.ops, args.threads, args.seed + index)
+                    results[(name, backend)] = (len(latencies) / elapsed, latencies)
+            finally:
+                db.close()
+
+    print(f"{args.ops} ops per operation, {args.threads} thread(s), {args.tickets} tickets\n")
+    header = "".join(f"{backend + ' ops/s':>18}{'p50 ms':>9}{'p99 ms':>9}" for backend in args.backends)
+    print(f"{'operation':26}{header}")
+    for name, _ in OPERATIONS:
+        line = f"{name:26}"
+        for backend in args.backends:
+            rate, latencies = results[(name, backend)]
+            line += (f"{rate:18.0f}{percentile(latencies, 50) * 1000:9.3f}"
+                     f"{percentile(latencies, 99) * 1000:9.3f}")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
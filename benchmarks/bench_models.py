@@ -0,0 +1,125 @@
+"""Microbenchmark del camino fila -> JSON de los listados de tickets.
+
+Compara, por fila, el camino anterior (sqlite3.Row -> dict -> dataclass
+sin slots -> dataclasses.asdict) con el actual (tupla -> dict con zip ->
+forma JSON armada en el lugar por TicketManager). Informa tiempo y memoria
+asignada por fila, y el tamano de una instancia de cada modelo.
+
+Uso (desde la raiz del repo):
+    python benchmarks/bench_models.py [--rows 50000]
+"""
+import argparse
+import dataclasses
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from database import DatabaseHandler, TICKET_SELECT  # noqa: E402
+from managers import TicketManager  # noqa: E402
+from models import Client, Ticket  # noqa: E402
+
+
+# Modelos como estaban antes: dataclasses comunes, con __dict__ por instancia.
+@dataclasses.dataclass
+class LegacyClient:
+    id: int
+    name: str
+    email: str
+    phone_number: str
+
+
+@dataclasses.dataclass
+class LegacyTicket:
+    id: int
+    client: LegacyClient
+    service: str
+    incident_id: int
+    creation_date: str
+    status: str = "Open"
+    closing_date: Optional[str] = None
+    version: int = 0
+
+
+def seed(db, rows):
+    client = db.save_client({"id": None, "name": "Ana", "email": "ana@example.com", "phone_number": "555-0100"})
+    incident = db.save_incident({"id": None, "description": "Sin servicio", "incident_type": "Network"})
+    db.save_tickets_many([
+        {
+            "id": None, "client_id": client["id"], "service": "Email Support",
+            "incident_id": incident["id"], "status": "Open",
+            "created_at": 1704067200, "closed_at": None
+        }
+        for _ in range(rows)
+    ])
+
+
+def legacy_path(db_name):
+    conn = sqlite3.connect(db_name)
+    conn.row_factory = sqlite3.Row
+    result = []
+    for row in conn.execute(TICKET_SELECT):
+        t = dict(row)
+        client = LegacyClient(
+            id=t.pop("client_id"), name=t.pop("client_name"),
+            email=t.pop("client_email"), phone_number=t.pop("client_phone_number")
+        )
+        result.append(dataclasses.asdict(LegacyTicket(client=client, **t)))
+    conn.close()
+    return result
+
+
+def fast_path(manager):
+    return list(manager.stream_dicts())
+
+
+def measure(label, fn, rows):
+    fn()  # calentamiento
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    print(f"{label:28} {elapsed / rows * 1e6:8.2f} us/row  {peak / rows:8.0f} B/row peak")
+
+
+def instance_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.sqlite")
+        db = DatabaseHandler(db_name)
+        seed(db, args.rows)
+        manager = TicketManager(db)
+
+        print(f"{args.rows} tickets\n")
+        measure("antes (Row/asdict)", lambda: legacy_path(db_name), args.rows)
+        measure("ahora (tupla/dict directo)", lambda: fast_path(manager), args.rows)
+        db.close()
+
+    legacy = LegacyTicket(1, LegacyClient(1, "a", "b", "c"), "s", 1, "d")
+    slotted = Ticket(1, Client(1, "a", "b", "c"), "s", 1, "d")
+    print(f"\ninstancia Ticket: {instance_size(legacy)} B sin slots, {instance_size(slotted)} B con slots")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Benchmark de arranque: cuanto tarda un proceso nuevo en atender su primer pedido.
+
+Corre la app Flask en subprocesos nuevos (como un worker que arranca o un
+test que la importa) y mide, dentro de cada uno:
+
+- import: importar app.py (no abre la base ni carga la documentacion);
+- create_app: crear la app y abrir la base, esquema incluido;
+- first_request: el primer GET /api/incidents/;
+- apispec: el primer GET /apispec_1.json (la especificacion compilada);
+- apidocs: el primer GET /apidocs/ (recien aca se carga Flasgger).
+
+Ademas, process: el proceso completo visto desde afuera, con el arranque
+del interprete. Dos escenarios: cold (base vacia y sin swagger.json, como
+el primer despliegue) y warm (esquema ya al dia y swagger.json compilado,
+como cualquier arranque posterior). Los modulos se copian a un directorio
+temporal y se compilan a bytecode antes de medir.
+
+Informa mediana y minimo de --runs arranques por escenario. Como
+bench_api, compara contra un baseline en JSON (--save-baseline, --check).
+
+Uso (desde la raiz del repo):
+    python benchmarks/bench_startup.py [--runs 10] [--scenarios cold warm]
+        [--backend sqlite|sqlalchemy] [--save-baseline] [--check]
+"""
+import argparse
+import compileall
+import glob
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from repository import BACKEND_ENV, BACKENDS  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_baseline.json")
+PHASES = ("import", "create_app", "first_request", "apispec", "apidocs")
+SCENARIOS = ("cold", "warm")
+
+CHILD = """
+import json, time
+marks = [time.perf_counter()]
+import app as module
+marks.append(time.perf_counter())
+application = module.app
+marks.append(time.perf_counter())
+client = application.test_client()
+for path in ("/api/incidents/", "/apispec_1.json", "/apidocs/"):
+    assert client.get(path).status_code == 200, path
+    marks.append(time.perf_counter())
+module.services.close()
+print(json.dumps([(b - a) * 1000 for a, b in zip(marks, marks[1:])]))
+"""
+
+
+def prepare(workdir):
+    """Copia los modulos de la app a ``workdir`` y los compila a bytecode."""
+    for path in glob.glob(os.path.join(ROOT, "*.py")):
+        shutil.copy(path, workdir)
+    shutil.copy(os.path.join(ROOT, "swagger.yml"), workdir)
+    compileall.compile_dir(workdir, quiet=1)
+
+
+def reset(workdir, scenario):
+    if scenario != "cold":
+        return
+    for name in ("db.sqlite", "db.sqlite-wal", "db.sqlite-shm", "swagger.json"):
+        path = os.path.join(workdir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def run_once(workdir, backend):
+    env = dict(os.environ, PYTHONPATH=workdir, **{BACKEND_ENV: backend})
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=workdir, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    process = (time.perf_counter() - start) * 1000
+    return dict(zip(PHASES, json.loads(out)), process=process)
+
+
+def summarize(samples):
+    return {
+        metric: {"median_ms": statistics.median(values), "min_ms": min(values)}
+        for metric in (*PHASES, "process")
+        for values in [[sample[metric] for sample in samples]]
+    }
+
+
+def print_summary(key, summary):
+    print(key)
+    for metric, values in summary.items():
+        print(f"  {metric:14} median {values['median_ms']:8.1f} ms   min {values['min_ms']:8.1f} ms")
+
+
+def compare(summary, baseline, threshold):
+    """Imprime la diferencia de las medianas contra el baseline; devuelve cuantas empeoraron."""
+    print(f"  vs baseline ({threshold:g}% de tolerancia):")
+    worse = 0
+    for metric, values in summary.items():
+        old = baseline.get(metric, {}).get("median_ms")
+        if not old:
+            continue
+        new = values["median_ms"]
+        change = (new - old) / old * 100
+        regressed = change > threshold
+        worse += regressed
+        print(f"    {metric:14} {old:8.1f} -> {new:8.1f}  {change:+7.1f}%  {'WORSE' if regressed else ''}")
+    return worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="arranques por escenario")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--backend", default="sqlite", choices=list(BACKENDS))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="archivo JSON del baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="guardar esta corrida como baseline")
+    parser.add_argument("--check", action="store_true",
+                        help="salir con codigo 1 si alguna mediana empeoro mas que --threshold")
+    parser.add_argument("--threshold", type=float, default=20.0, help="tolerancia en porcentaje")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results, worse = {}, 0
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare(workdir)
+        for scenario in args.scenarios:
+            # Un arranque previo deja la base y swagger.json listos para warm.
+            reset(workdir, scenario)
+            run_once(workdir, args.backend)
+            samples = []
+            for _ in range(args.runs):
+                reset(workdir, scenario)
+                samples.append(run_once(workdir, args.backend))
+            key = f"{args.backend}/{scenario}"
+            results[key] = summarize(samples)
+            print_summary(key, results[key])
+            if key in baseline:
+                worse += compare(results[key], baseline[key], args.threshold)
+            print()
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+    if args.check and worse:
+        print(f"{worse} metric(s) worse than baseline")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
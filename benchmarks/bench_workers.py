@@ -0,0 +1,96 @@
+"""Throughput de serve.py segun la cantidad de workers.
+
+Siembra una base (como bench_api) y, para cada valor de --workers, levanta
+serve.py sobre una copia de esa base y le manda la misma carga mixta de
+bench_api (reproducible con --seed) por HTTP, con --concurrency clientes
+keep-alive. Informa pedidos por segundo, latencia p50/p95/p99 y errores
+de cada corrida, y la aceleracion contra la primera.
+
+Mas workers que nucleos no agrega capacidad de CPU: solo sirve mientras
+los pedidos esperan E/S. Con keep-alive, cada conexion queda en el worker
+que la acepto, asi que conviene que --concurrency sea bastante mayor que
+la cantidad de workers.
+
+Uso (desde la raiz del repo):
+    python benchmarks/bench_workers.py [--workers 1 2 4] [--requests 5000]
+        [--concurrency 32] [--write-ratio 0.2] [--backend sqlite|sqlalchemy]
+"""
+import argparse
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from repository import BACKENDS  # noqa: E402
+from bench_api import Dataset, build_plan, http_sender, run_plan, seed, summarize  # noqa: E402
+from bench_async import free_port, wait_for_port  # noqa: E402
+
+
+def run_workers(workers, db_path, plan, args):
+    port = free_port()
+    cmd = [sys.executable, os.path.join(ROOT, "serve.py"), "--port", str(port),
+           "--workers", str(workers), "--db", db_path, "--backend", args.backend]
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    make_sender = http_sender(port)
+    try:
+        wait_for_port(port)
+        # El primer pedido de cada worker paga la carga de la app: va en el calentamiento.
+        run_plan(plan[:args.warmup], args.concurrency, make_sender)
+        elapsed, latencies, errors = run_plan(plan[args.warmup:], args.concurrency, make_sender)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait()
+    return summarize(elapsed, latencies, errors, None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", nargs="+", type=int,
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--incidents", type=int, default=200)
+    parser.add_argument("--tickets", type=int, default=50000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200, help="pedidos iniciales que no se miden")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="fraccion de escrituras en la carga")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--backend", default="sqlite", choices=list(BACKENDS))
+    args = parser.parse_args(argv)
+
+    data = Dataset(args.clients, args.incidents, args.tickets)
+    rng = random.Random(args.seed)
+    plan = build_plan(args.requests + args.warmup, args.write_ratio, data, rng)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        seeded = os.path.join(tmp, "seed.sqlite")
+        start = time.perf_counter()
+        seed(seeded, data, rng)
+        print(f"seeded {args.clients} clients, {args.incidents} incidents, {args.tickets} tickets "
+              f"in {time.perf_counter() - start:.1f} s")
+        print(f"{args.requests} requests (+{args.warmup} warmup), {args.concurrency} concurrent, "
+              f"write ratio {args.write_ratio:g}, backend {args.backend}, {os.cpu_count()} CPU(s)\n")
+        for workers in args.workers:
+            # Cada corrida arranca de la misma base: las escrituras de una no afectan a la otra.
+            path = os.path.join(tmp, f"workers-{workers}.sqlite")
+            shutil.copy(seeded, path)
+            results[workers] = run_workers(workers, path, plan, args)
+
+    first = results[args.workers[0]]["throughput"]
+    print(f"{'workers':>7} {'req/s':>9} {'speedup':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for workers, summary in results.items():
+        print(f"{workers:7} {summary['throughput']:9.1f} {summary['throughput'] / first:7.2f}x "
+              f"{summary['p50_ms']:9.2f} {summary['p95_ms']:9.2f} {summary['p99_ms']:9.2f} "
+              f"{summary['errors']:7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Escrituras: commit por sentencia vs commit agrupado.
+
+Dos mediciones contra un DatabaseHandler con y sin GroupCommitWriter:
+
+- latencia de un escritor solo (--lone-writes escrituras seguidas desde un
+  hilo), el caso comun, donde agrupar no deberia costar nada;
+- throughput de N hilos que crean tickets a la vez (como POST
+  /api/tickets/ concurrentes): escrituras por segundo y errores "database
+  is locked".
+
+Con --check sale con codigo 1 si la latencia del escritor solo con commit
+agrupado supera a la del commit por sentencia en mas de --max-overhead.
+
+Uso (desde la raiz del repo):
+    python benchmarks/bench_writes.py [--threads 32] [--writes 200]
+        [--lone-writes 300] [--check]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from database import DatabaseHandler  # noqa: E402
+
+
+def open_db(tmp, group_commit, threads, synchronous):
+    db = DatabaseHandler(
+        os.path.join(tmp, "bench.sqlite"), group_commit=group_commit,
+        size=threads, timeout=5.0, synchronous=synchronous
+    )
+    client = db.save_client({"id": None, "name": "Ana", "email": "a@example.com", "phone_number": "1"})
+    incident = db.save_incident({"id": None, "description": "d", "incident_type": "t"})
+    ticket = {
+        "id": None, "client_id": client["id"], "service": "s",
+        "incident_id": incident["id"], "status": "Open",
+        "created_at": 1704067200, "closed_at": None
+    }
+    return db, ticket
+
+
+def lone_writer(group_commit, writes, synchronous):
+    """Latencia media en ms de ``writes`` escrituras seguidas desde un solo hilo."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db, ticket = open_db(tmp, group_commit, 1, synchronous)
+        try:
+            start = time.perf_counter()
+            for _ in range(writes):
+                db.save_ticket(dict(ticket))
+            return (time.perf_counter() - start) * 1000 / writes
+        finally:
+            db.close()
+
+
+def run(group_commit, threads, writes, synchronous):
+    with tempfile.TemporaryDirectory() as tmp:
+        db, ticket = open_db(tmp, group_commit, threads, synchronous)
+        errors = []
+
+        def worker():
+            for _ in range(writes):
+                try:
+                    db.save_ticket(dict(ticket))
+                except sqlite3.OperationalError as exc:
+                    errors.append(exc)
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - start
+        stats = db.write_stats()
+        db.close()
+
+    done = threads * writes - len(errors)
+    label = "group commit" if group_commit else "commit por sentencia"
+    extra = f"  avg batch {stats['avg_batch']:.1f}" if stats else ""
+    print(f"{label:22} {done / elapsed:9.0f} writes/s  errors {len(errors)}{extra}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--lone-writes", type=int, default=300, help="escrituras del escritor solo")
+    parser.add_argument("--synchronous", default="FULL", help="PRAGMA synchronous (FULL hace fsync por commit)")
+    parser.add_argument("--check", action="store_true",
+                        help="salir con codigo 1 si el escritor solo es mas lento con commit agrupado")
+    parser.add_argument("--max-overhead", type=float, default=0.25,
+                        help="ms por escritura que se toleran de mas con commit agrupado")
+    args = parser.parse_args(argv)
+
+    print(f"1 thread x {args.lone_writes} writes, synchronous={args.synchronous}\n")
+    plain = lone_writer(False, args.lone_writes, args.synchronous)
+    grouped = lone_writer(True, args.lone_writes, args.synchronous)
+    print(f"{'commit por sentencia':22} {plain:9.3f} ms/write")
+    print(f"{'group commit':22} {grouped:9.3f} ms/write  ({grouped - plain:+.3f} ms)\n")
+
+    print(f"{args.threads} threads x {args.writes} writes, synchronous={args.synchronous}\n")
+    run(False, args.threads, args.writes, args.synchronous)
+    run(True, args.threads, args.writes, args.synchronous)
+
+    if args.check and grouped - plain > args.max_overhead:
+        print(f"\ngroup commit adds {grouped - plain:.3f} ms per lone write (max {args.max_overhead:g})")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
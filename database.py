@@ -1,39 +1,655 @@
+import asyncio
+import contextvars
+import re
 import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+from queue import Queue, Empty
+
+from instrumentation import phase
+from repository import Repository
+from timestamps import TIMESTAMP_FORMAT, now
 
 DB_NAME = "db.sqlite"
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+# Hilos de AsyncDatabaseHandler. Van aparte del tamano del pool: un hilo
+# tambien espera al escritor o el cuerpo de una importacion sin tener una
+# conexion tomada.
+ASYNC_WORKERS = 32
+
+# Los tickets se leen siempre junto a su cliente; las columnas del cliente
+# llevan el prefijo client_ para poder armar el Client sin decodificar JSON.
+# Las fechas se guardan en created_at/closed_at (epoch UTC) y salen ya como
+# texto en creation_date/closing_date, la forma que usa la API.
+TICKET_SELECT = f"""
+    SELECT t.id, t.service, t.incident_id, t.status,
+           strftime('{TIMESTAMP_FORMAT}', t.created_at, 'unixepoch') AS creation_date,
+           strftime('{TIMESTAMP_FORMAT}', t.closed_at, 'unixepoch') AS closing_date,
+           t.version, t.client_id, c.name AS client_name, c.email AS client_email,
+           c.phone_number AS client_phone_number
+    FROM tickets t LEFT JOIN clients c ON c.id = t.client_id
+"""
+# Lo mismo sobre los tickets archivados (ver archive_tickets).
+ARCHIVED_TICKET_SELECT = TICKET_SELECT.replace("FROM tickets t", "FROM tickets_archive t")
+
+# Mismas columnas que TICKET_SELECT, para UPDATE ... RETURNING (que solo ve la
+# tabla modificada, por eso el cliente sale de subconsultas).
+TICKET_RETURNING = f"""
+    RETURNING id, service, incident_id, status,
+        strftime('{TIMESTAMP_FORMAT}', created_at, 'unixepoch') AS creation_date,
+        strftime('{TIMESTAMP_FORMAT}', closed_at, 'unixepoch') AS closing_date,
+        version, client_id,
+        (SELECT name FROM clients WHERE id = tickets.client_id) AS client_name,
+        (SELECT email FROM clients WHERE id = tickets.client_id) AS client_email,
+        (SELECT phone_number FROM clients WHERE id = tickets.client_id) AS client_phone_number
+"""
+
+# Columnas que forman la representacion de incidents y clients (sin las de
+# control version/updated_at, que solo usan los ETag).
+INCIDENT_SELECT = "SELECT id, description, incident_type FROM incidents"
+CLIENT_SELECT = "SELECT id, name, email, phone_number FROM clients"
+
+# Columnas que viajan en la importacion y exportacion masiva, por tabla (las
+# fechas de los tickets en epoch). version y updated_at son de cada base: al
+# importar arrancan de cero o se incrementan, como en cualquier escritura.
+TRANSFER_COLUMNS = {
+    "incidents": ("id", "description", "incident_type"),
+    "clients": ("id", "name", "email", "phone_number"),
+    "tickets": ("id", "client_id", "service", "incident_id", "status", "created_at", "closed_at"),
+}
+# Que hacer si una fila importada trae un id que ya existe.
+IMPORT_CONFLICTS = ("error", "skip", "update")
+# Estados de un ticket; la importacion rechaza cualquier otro.
+TICKET_STATUSES = ("Open", "Closed")
+
+# Archivo de tickets: los cerrados hace tiempo pasan de tickets a
+# tickets_archive (mismas columnas mas archived_at), de a ARCHIVE_CHUNK_SIZE
+# por transaccion. Salir de tickets no cuenta como borrado para las
+# estadisticas ni el changelog: los triggers de DELETE miran si la fila ya
+# esta en el archivo. Si deja de estar en el indice de busqueda.
+ARCHIVE_COLUMNS = ("id", "client_id", "service", "incident_id", "status",
+                   "created_at", "closed_at", "version", "updated_at")
+ARCHIVE_CHUNK_SIZE = 500
+ARCHIVED_ROW = "EXISTS (SELECT 1 FROM tickets_archive WHERE id = old.id)"
+
+# Indices secundarios administrados por init_db, pensados para los filtros
+# de los listados. Los indices idx_* que no figuren aca se eliminan, y los
+# que cambiaron de definicion se recrean. Las paginas se ordenan por id, que
+# todo indice lleva al final (es el rowid): un indice cuyas columnas son
+# exactamente las de los filtros de igualdad de una pagina ya la devuelve en
+# orden, sin ordenar todas las coincidencias.
+INDEXES = {
+    "idx_tickets_status": "tickets (status)",
+    "idx_tickets_incident": "tickets (incident_id)",
+    "idx_tickets_incident_status": "tickets (incident_id, status)",
+    "idx_tickets_service": "tickets (service)",
+    "idx_tickets_service_status": "tickets (service, status)",
+    "idx_tickets_created_at": "tickets (created_at)",
+    "idx_tickets_closed_at": "tickets (closed_at)",
+    "idx_tickets_client": "tickets (client_id)",
+    "idx_incidents_type": "incidents (incident_type)",
+    "idx_clients_email": "clients (email)",
+    # Para recalcular incident_type cuando cambia o se borra un incident.
+    "idx_tickets_archive_incident": "tickets_archive (incident_id)",
+}
+
+
+# Indices de texto completo (FTS5 con contenido externo: el texto vive en la
+# tabla original y el indice solo guarda los terminos). Los triggers los
+# mantienen al dia; un UPDATE que no toca las columnas indexadas no los
+# dispara. prefix='2 3' indexa ademas los prefijos cortos, para que "re*" no
+# tenga que expandirse a todos los terminos que empiezan asi.
+# Por tabla: (columnas indexadas, tipo de resultado en /api/search).
+SEARCH_TABLES = {
+    "incidents": (("description", "incident_type"), "incident"),
+    "tickets": (("service",), "ticket"),
+}
+SEARCH_COLUMNS = {kind: columns for columns, kind in SEARCH_TABLES.values()}
+SNIPPET_TOKENS = 12
+
+
+def _search_definitions():
+    """({tabla fts: CREATE VIRTUAL TABLE}, {nombre: CREATE TRIGGER}) de SEARCH_TABLES."""
+    tables, triggers = {}, {}
+    for table, (columns, _kind) in SEARCH_TABLES.items():
+        fts = f"{table}_fts"
+        cols = ", ".join(columns)
+        new = ", ".join(f"new.{c}" for c in columns)
+        old = ", ".join(f"old.{c}" for c in columns)
+        tables[fts] = (f"CREATE VIRTUAL TABLE {fts} "
+                       f"USING fts5({cols}, content='{table}', content_rowid='id', prefix='2 3')")
+        triggers[f"{fts}_ai"] = f"""CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN
+    INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new});
+END"""
+        triggers[f"{fts}_ad"] = f"""CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN
+    INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});
+END"""
+        triggers[f"{fts}_au"] = f"""CREATE TRIGGER {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+    INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});
+    INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new});
+END"""
+    return tables, triggers
+
+
+SEARCH_FTS_TABLES, SEARCH_TRIGGERS = _search_definitions()
+
+
+# Agregados de tickets mantenidos por triggers: cada dimension agrupa los
+# tickets por la expresion indicada ({t} es el alias de la fila). Cambiar una
+# expresion hace que init_db recree los triggers y recalcule ticket_stats.
+STATS_DIMENSIONS = {
+    "all": "'all'",
+    "service": "{t}.service",
+    "incident_type": "(SELECT incident_type FROM incidents WHERE id = {t}.incident_id)",
+    "day": "date({t}.created_at, 'unixepoch')",
+}
+STATS_COLUMNS = ("open_count", "closed_count", "timed_count", "close_seconds")
+# Segundos entre apertura y cierre de un ticket cerrado con fecha de cierre.
+CLOSE_SECONDS = """CASE WHEN {t}.status = 'Closed' AND {t}.closed_at IS NOT NULL
+    THEN {t}.closed_at - {t}.created_at ELSE 0 END"""
+STATS_UPSERT = """
+    INSERT INTO ticket_stats (dimension, bucket, open_count, closed_count, timed_count, close_seconds)
+    {rows}
+    ON CONFLICT (dimension, bucket) DO UPDATE SET
+        open_count = open_count + excluded.open_count,
+        closed_count = closed_count + excluded.closed_count,
+        timed_count = timed_count + excluded.timed_count,
+        close_seconds = close_seconds + excluded.close_seconds"""
+
+
+def _stats_row_values(t, sign):
+    """VALUES con el aporte de la fila ``t`` (new u old) a cada dimension."""
+    counts = (
+        f"{sign}({t}.status != 'Closed')",
+        f"{sign}({t}.status = 'Closed')",
+        f"{sign}({t}.status = 'Closed' AND {t}.closed_at IS NOT NULL)",
+        f"{sign}({CLOSE_SECONDS.format(t=t)})",
+    )
+    rows = ",\n        ".join(
+        f"('{dimension}', COALESCE({expr.format(t=t)}, ''), {', '.join(counts)})"
+        for dimension, expr in STATS_DIMENSIONS.items()
+    )
+    return STATS_UPSERT.format(rows=f"VALUES {rows}")
+
+
+def _all_tickets(where=""):
+    """Tickets vivos y archivados, con las columnas que usan las estadisticas."""
+    columns = "service, incident_id, status, created_at, closed_at"
+    return f"(SELECT {columns} FROM tickets {where} UNION ALL SELECT {columns} FROM tickets_archive {where})"
+
+
+def _stats_incident_values(incident_id, incident_type, sign):
+    """Aporte de todos los tickets de un incident a la dimension incident_type."""
+    select = f"""SELECT 'incident_type', COALESCE({incident_type}, ''),
+        {sign}SUM(t.status != 'Closed'), {sign}SUM(t.status = 'Closed'),
+        {sign}SUM(t.status = 'Closed' AND t.closed_at IS NOT NULL), {sign}SUM({CLOSE_SECONDS.format(t="t")})
+    FROM {_all_tickets(f"WHERE incident_id = {incident_id}")} t HAVING COUNT(*) > 0"""
+    return STATS_UPSERT.format(rows=select)
+
+
+STATS_TRIGGERS = {
+    "ticket_stats_ai": f"""CREATE TRIGGER ticket_stats_ai AFTER INSERT ON tickets BEGIN
+    {_stats_row_values("new", "")};
+END""",
+    "ticket_stats_ad": f"""CREATE TRIGGER ticket_stats_ad AFTER DELETE ON tickets WHEN NOT {ARCHIVED_ROW} BEGIN
+    {_stats_row_values("old", "-")};
+END""",
+    "ticket_stats_au": f"""CREATE TRIGGER ticket_stats_au
+AFTER UPDATE OF service, incident_id, status, created_at, closed_at ON tickets BEGIN
+    {_stats_row_values("old", "-")};
+    {_stats_row_values("new", "")};
+END""",
+    "ticket_stats_incident_au": f"""CREATE TRIGGER ticket_stats_incident_au
+AFTER UPDATE OF incident_type ON incidents WHEN old.incident_type IS NOT new.incident_type BEGIN
+    {_stats_incident_values("old.id", "old.incident_type", "-")};
+    {_stats_incident_values("old.id", "new.incident_type", "")};
+END""",
+    "ticket_stats_incident_ad": f"""CREATE TRIGGER ticket_stats_incident_ad AFTER DELETE ON incidents BEGIN
+    {_stats_incident_values("old.id", "old.incident_type", "-")};
+    {_stats_incident_values("old.id", "NULL", "")};
+END""",
+}
+
+
+# Contador de cambios por tabla (lo usan los ETag de los listados): cada
+# INSERT, UPDATE o DELETE incrementa la fila de su tabla en table_changes.
+CHANGE_TRACKED_TABLES = ("incidents", "tickets", "clients")
+CHANGE_TRIGGERS = {
+    f"{table}_changes_{suffix}": f"""CREATE TRIGGER {table}_changes_{suffix} AFTER {event} ON {table} BEGIN
+    UPDATE table_changes SET counter = counter + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+    WHERE name = '{table}';
+END"""
+    for table in CHANGE_TRACKED_TABLES
+    for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE"))
+}
+
+
+# Changelog: cada escritura sobre estas tablas agrega un evento en la misma
+# transaccion (lo hacen triggers, asi no importa que metodo escribio). Por
+# tabla: (nombre de la entidad, JSON de la fila; {r} es new u old). Archivar
+# un ticket no es un evento: sigue existiendo igual que antes.
+CHANGELOG_TABLES = {
+    "incidents": ("incident", "json_object('id', {r}.id, 'description', {r}.description, "
+                              "'incident_type', {r}.incident_type)"),
+    "tickets": ("ticket", "json_object('id', {r}.id, 'client_id', {r}.client_id, 'service', {r}.service, "
+                          "'incident_id', {r}.incident_id, 'status', {r}.status, "
+                          f"'creation_date', strftime('{TIMESTAMP_FORMAT}', {{r}}.created_at, 'unixepoch'), "
+                          f"'closing_date', strftime('{TIMESTAMP_FORMAT}', {{r}}.closed_at, 'unixepoch'), "
+                          "'version', {r}.version)"),
+    "clients": ("client", "json_object('id', {r}.id, 'name', {r}.name, 'email', {r}.email, "
+                          "'phone_number', {r}.phone_number)"),
+}
+CHANGELOG_TRIGGERS = {
+    f"{table}_changelog_{suffix}": f"""CREATE TRIGGER {table}_changelog_{suffix} AFTER {event} ON {table}{when} BEGIN
+    INSERT INTO changelog (entity, entity_id, op, changed_at, data)
+    VALUES ('{entity}', {row}.id, '{op}', CAST(strftime('%s', 'now') AS INTEGER), {data});
+END"""
+    for table, (entity, payload) in CHANGELOG_TABLES.items()
+    for suffix, event, op, row, data, when in (
+        ("ai", "INSERT", "insert", "new", payload.replace("{r}", "new"), ""),
+        ("au", "UPDATE", "update", "new", payload.replace("{r}", "new"), ""),
+        ("ad", "DELETE", "delete", "old", "NULL", f" WHEN NOT {ARCHIVED_ROW}" if table == "tickets" else ""),
+    )
+}
+
+# Tickets tomados desde la cola de despacho (POST /api/queue/claim): la clave
+# primaria garantiza un solo agente por ticket aunque reclamen varios procesos.
+# Reabrir un ticket lo devuelve a la cola; al borrarlo (o archivarlo) se olvida.
+CLAIM_TRIGGERS = {
+    "ticket_claims_reopen": """CREATE TRIGGER ticket_claims_reopen AFTER UPDATE OF status ON tickets
+WHEN new.status = 'Open' AND old.status != 'Open' BEGIN
+    DELETE FROM ticket_claims WHERE ticket_id = new.id;
+END""",
+    "ticket_claims_ad": """CREATE TRIGGER ticket_claims_ad AFTER DELETE ON tickets BEGIN
+    DELETE FROM ticket_claims WHERE ticket_id = old.id;
+END""",
+}
+
+# Retencion del changelog: prune_changelog (prune_changelog.py, periodico
+# como archive_tickets.py) borra los eventos viejos de a
+# CHANGELOG_PRUNE_CHUNK_SIZE por transaccion. Un cursor anterior a lo que
+# queda ya no puede ponerse al dia desde el changelog (ver
+# get_first_change_seq) y tiene que volver a leer todo.
+CHANGELOG_PRUNE_CHUNK_SIZE = 5000
+
+CHANGE_SELECT = f"""
+    SELECT seq, entity, entity_id, op,
+           strftime('{TIMESTAMP_FORMAT}', changed_at, 'unixepoch') AS changed_at, data
+    FROM changelog
+"""
 
-class DatabaseHandler:
-    """Encapsula toda la lógica de base de datos."""
+# Huella del esquema que init_db guarda en PRAGMA user_version: si la base
+# ya la tiene, arrancar no revisa tablas, indices ni triggers. Subir
+# SCHEMA_VERSION al cambiar una tabla o agregar una migracion; los indices
+# y triggers de este modulo entran solos en la huella.
+SCHEMA_VERSION = 1
+SCHEMA_FINGERPRINT = zlib.crc32(repr((
+    SCHEMA_VERSION, INDEXES, SEARCH_FTS_TABLES, SEARCH_TRIGGERS, STATS_TRIGGERS, CHANGE_TRIGGERS,
+    CHANGELOG_TRIGGERS, CLAIM_TRIGGERS
+)).encode()) & 0x7FFFFFFF
 
-    def __init__(self, db_name=DB_NAME):
+
+class PoolTimeout(Exception):
+    """No se libero ninguna conexion del pool dentro del tiempo de espera."""
+
+
+class VersionConflict(Exception):
+    """La fila existe pero su version no es la esperada (otro la modifico antes)."""
+
+
+class TicketArchived(Exception):
+    """El ticket esta en el archivo, que es de solo lectura."""
+
+
+def open_connection(db_name, timeout, pragmas):
+    """Abre una conexion con filas sqlite3.Row y los PRAGMA indicados (None: no se toca)."""
+    conn = sqlite3.connect(db_name, timeout=timeout, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for name, value in pragmas.items():
+        if value is not None:
+            conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+
+class ConnectionPool:
+    """Pool acotado de conexiones SQLite con reutilizacion por hilo.
+
+    Cada hilo que pide una conexion mientras ya tiene una tomada recibe la
+    misma, de modo que las llamadas anidadas no consumen mas de un lugar del
+    pool. Los PRAGMA se aplican una sola vez, al abrir cada conexion.
+    """
+
+    def __init__(self, db_name, size=5, timeout=30.0, journal_mode="WAL",
+                 synchronous="NORMAL", cache_size=-2000, mmap_size=0):
+        if size < 1:
+            raise ValueError("size must be at least 1")
         self.db_name = db_name
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = {
+            "journal_mode": journal_mode,
+            "synchronous": synchronous,
+            "cache_size": cache_size,
+            "mmap_size": mmap_size,
+        }
+        self._idle = Queue(maxsize=size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+        self._stats = {"created": 0, "acquired": 0, "reused": 0, "waits": 0, "timeouts": 0}
+
+    def _connect(self):
+        return open_connection(self.db_name, self.timeout, self.pragmas)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = self._connect()
+                self._all.append(conn)
+                self._stats["created"] += 1
+                return conn
+            self._stats["waits"] += 1
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except Empty:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeout(f"no connection available after {self.timeout}s")
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            owned = conn in self._all
+        if owned:
+            self._idle.put_nowait(conn)
+        else:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Presta una conexion al hilo actual y la devuelve al terminar."""
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is not None:
+            local.depth += 1
+            with self._lock:
+                self._stats["reused"] += 1
+            try:
+                yield conn
+            finally:
+                local.depth -= 1
+            return
+
+        with phase("connect"):
+            conn = self._acquire()
+        with self._lock:
+            self._stats["acquired"] += 1
+        local.conn = conn
+        local.depth = 1
+        try:
+            yield conn
+        finally:
+            local.conn = None
+            local.depth = 0
+            self._release(conn)
+
+    @contextmanager
+    def checkout(self):
+        """Presta una conexion exclusiva sin asociarla al hilo actual.
+
+        Para generadores, que pueden reanudarse desde otro hilo que el que
+        los empezo.
+        """
+        with phase("connect"):
+            conn = self._acquire()
+        with self._lock:
+            self._stats["acquired"] += 1
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = self.size
+            stats["open"] = len(self._all)
+        stats["idle"] = self._idle.qsize()
+        stats["in_use"] = stats["open"] - stats["idle"]
+        return stats
+
+    def close(self):
+        """Cierra todas las conexiones abiertas por el pool."""
+        with self._lock:
+            conns, self._all = self._all, []
+        while True:
+            try:
+                self._idle.get_nowait()
+            except Empty:
+                break
+        for conn in conns:
+            conn.close()
+
+
+class GroupCommitWriter:
+    """Unico escritor de la base, con commit agrupado.
+
+    Un hilo dedicado es el dueño de la conexion de escritura y vacia una cola
+    de operaciones pendientes. Toma todas las que ya estan encoladas (hasta
+    ``max_batch``) y las confirma juntas en una sola transaccion, es decir un
+    solo fsync. Solo si el grupo anterior o el actual juntaron mas de una
+    operacion (hay otros escribiendo) espera hasta ``max_delay`` segundos a
+    que lleguen mas; un escritor solo no espera nada. Cada operacion corre
+    dentro de su propio SAVEPOINT: si falla, se deshace solo ella y su
+    Future recibe la excepcion, sin afectar al resto del grupo.
+    """
+
+    def __init__(self, connect, max_batch=256, max_delay=0.0005):
+        self._connect = connect
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._last_batch = 0
+        self._stats = {"operations": 0, "batches": 0, "failed": 0, "waits": 0}
+
+    def submit(self, fn):
+        """Encola ``fn(conn)`` y devuelve un Future con su resultado."""
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="sqlite-writer", daemon=True
+                    )
+                    self._thread.start()
+        future = Future()
+        self._queue.put((future, fn))
+        return future
+
+    def run(self, fn):
+        """Ejecuta ``fn(conn)`` en el escritor y espera a que se confirme."""
+        return self.submit(fn).result()
+
+    def _run(self):
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                batch = [item]
+                stop = self._fill(batch)
+                self._last_batch = len(batch)
+                self._commit(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _fill(self, batch):
+        """Agrega a ``batch`` lo encolado; devuelve True si llego el pedido de cierre."""
+        stop = self._drain(batch, None)
+        if stop or len(batch) >= self.max_batch or self.max_delay <= 0:
+            return stop
+        if len(batch) == 1 and self._last_batch <= 1:
+            return False
+        self._stats["waits"] += 1
+        return self._drain(batch, time.monotonic() + self.max_delay)
+
+    def _drain(self, batch, deadline):
+        """Toma de la cola sin esperar (``deadline`` None) o hasta ``deadline``."""
+        while len(batch) < self.max_batch:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            try:
+                if timeout is None or timeout <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=timeout)
+            except Empty:
+                return False
+            if item is None:
+                return True
+            batch.append(item)
+        return False
+
+    def _commit(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for future, fn in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT op")
+                try:
+                    result = fn(conn)
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO op")
+                    outcomes.append((future, None, exc))
+                else:
+                    outcomes.append((future, result, None))
+                conn.execute("RELEASE op")
+            conn.execute("COMMIT")
+        except Exception as exc:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for future, _fn in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            self._stats["failed"] += len(batch)
+            return
+        self._stats["operations"] += len(outcomes)
+        self._stats["batches"] += 1
+        for future, result, exc in outcomes:
+            if exc is None:
+                future.set_result(result)
+            else:
+                self._stats["failed"] += 1
+                future.set_exception(exc)
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["pending"] = self._queue.qsize()
+        stats["avg_batch"] = stats["operations"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+class DatabaseHandler(Repository):
+    """Encapsula toda la lógica de base de datos (backend "sqlite" de repository).
+
+    Las lecturas usan el pool de conexiones. Las escrituras pasan por un
+    GroupCommitWriter, salvo que se cree con ``group_commit=False``.
+    """
+
+    def __init__(self, db_name=DB_NAME, group_commit=True, **pool_options):
+        self.db_name = db_name
+        self.pool = ConnectionPool(db_name, **pool_options)
+        self.writer = GroupCommitWriter(self.pool._connect) if group_commit else None
+        self._write_listeners = []
         self.init_db()
 
     def get_connection(self):
-        conn = sqlite3.connect(self.db_name, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return self.pool.connection()
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    def write_stats(self):
+        return self.writer.stats() if self.writer is not None else None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.pool.close()
 
     def init_db(self):
-        conn = self.get_connection()
-        cur = conn.cursor()
+        """Crea o actualiza el esquema en una sola transaccion.
+
+        BEGIN IMMEDIATE toma el lock de escritura de entrada: una migracion
+        que falla a mitad de camino no deja el esquema a medias, y dos
+        procesos que arrancan a la vez no migran la misma base en paralelo.
+        Si la base ya esta en SCHEMA_FINGERPRINT no hace nada mas que leerla.
+        """
+        with self.get_connection() as conn:
+            if self._schema_fingerprint(conn) == SCHEMA_FINGERPRINT:
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Otro proceso pudo haberla migrado mientras se esperaba el lock.
+                if self._schema_fingerprint(conn) != SCHEMA_FINGERPRINT:
+                    self._create_schema(conn.cursor())
+                    conn.execute(f"PRAGMA user_version = {SCHEMA_FINGERPRINT}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    @staticmethod
+    def _schema_fingerprint(conn):
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def _create_schema(self, cur):
         cur.execute("""
             CREATE TABLE IF NOT EXISTS incidents (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 description TEXT NOT NULL,
-                incident_type TEXT NOT NULL
+                incident_type TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at INTEGER NOT NULL DEFAULT 0
             )
         """)
         cur.execute("""
             CREATE TABLE IF NOT EXISTS tickets (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                client TEXT NOT NULL,
+                client_id INTEGER NOT NULL,
                 service TEXT NOT NULL,
                 incident_id INTEGER NOT NULL,
                 status TEXT NOT NULL,
-                creation_date TEXT NOT NULL,
-                closing_date TEXT,
-                FOREIGN KEY (incident_id) REFERENCES incidents (id)
+                created_at INTEGER NOT NULL,
+                closed_at INTEGER,
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (incident_id) REFERENCES incidents (id),
+                FOREIGN KEY (client_id) REFERENCES clients (id)
             )
         """)
         cur.execute("""
@@ -41,64 +657,629 @@ class DatabaseHandler:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT NOT NULL,
                 email TEXT NOT NULL,
-                phone_number TEXT NOT NULL
+                phone_number TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        # Sin AUTOINCREMENT ni claves foraneas: los id vienen de tickets.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS tickets_archive (
+                id INTEGER PRIMARY KEY,
+                client_id INTEGER NOT NULL,
+                service TEXT NOT NULL,
+                incident_id INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                closed_at INTEGER,
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at INTEGER NOT NULL DEFAULT 0,
+                archived_at INTEGER NOT NULL
+            )
+        """)
+        self._migrate_ticket_client(cur)
+        self._migrate_ticket_version(cur)
+        self._migrate_ticket_epoch(cur)
+        self._migrate_change_stamps(cur)
+        self._sync_indexes(cur)
+        self._sync_search(cur)
+        self._sync_stats(cur)
+        self._sync_changes(cur)
+        self._sync_changelog(cur)
+        self._sync_claims(cur)
+
+    def _migrate_ticket_version(self, cur):
+        columns = {row["name"] for row in cur.execute("PRAGMA table_info(tickets)")}
+        if "version" not in columns:
+            cur.execute("ALTER TABLE tickets ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def _migrate_change_stamps(self, cur):
+        """Agrega version/updated_at a incidents y clients, y updated_at a tickets.
+
+        Las filas existentes toman la hora de la migracion (los tickets, su
+        fecha de cierre o de alta).
+        """
+        stamp = now()
+        for table in CHANGE_TRACKED_TABLES:
+            columns = {row["name"] for row in cur.execute(f"PRAGMA table_info({table})")}
+            if "version" not in columns:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            if "updated_at" not in columns:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN updated_at INTEGER NOT NULL DEFAULT 0")
+                if table == "tickets":
+                    cur.execute("UPDATE tickets SET updated_at = COALESCE(closed_at, created_at)")
+                else:
+                    cur.execute(f"UPDATE {table} SET updated_at = ?", (stamp,))
+
+    def _sync_changes(self, cur):
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS table_changes (
+                name TEXT PRIMARY KEY,
+                counter INTEGER NOT NULL DEFAULT 0,
+                updated_at INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        """)
+        cur.executemany(
+            "INSERT OR IGNORE INTO table_changes (name, updated_at) VALUES (?, ?)",
+            [(table, now()) for table in CHANGE_TRACKED_TABLES]
+        )
+        self._sync_triggers(cur, CHANGE_TRIGGERS)
+
+    def _sync_changelog(self, cur):
+        # AUTOINCREMENT: seq nunca se reutiliza, aunque se borren eventos,
+        # asi un cursor since=<seq> no se saltea ni repite nada.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS changelog (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                entity TEXT NOT NULL,
+                entity_id INTEGER NOT NULL,
+                op TEXT NOT NULL,
+                changed_at INTEGER NOT NULL,
+                data TEXT
+            )
+        """)
+        self._sync_triggers(cur, CHANGELOG_TRIGGERS)
+
+    def _sync_claims(self, cur):
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS ticket_claims (
+                ticket_id INTEGER PRIMARY KEY,
+                agent TEXT NOT NULL,
+                claimed_at INTEGER NOT NULL
+            )
+        """)
+        self._sync_triggers(cur, CLAIM_TRIGGERS)
+
+    @staticmethod
+    def _sync_triggers(cur, triggers):
+        """Crea los triggers de ``triggers`` ({nombre: sql}) que falten y recrea los que cambiaron."""
+        existing = {
+            row["name"]: row["sql"]
+            for row in cur.execute("SELECT name, sql FROM sqlite_master WHERE type='trigger'")
+        }
+        for name, sql in triggers.items():
+            if existing.get(name) != sql:
+                if name in existing:
+                    cur.execute(f"DROP TRIGGER {name}")
+                cur.execute(sql)
+
+    def _migrate_ticket_epoch(self, cur):
+        """Pasa creation_date/closing_date (texto en hora local) a created_at/closed_at (epoch UTC).
+
+        Antes de borrar las columnas viejas se quitan el indice y los triggers
+        que las usan; _sync_indexes y _sync_stats los recrean sobre las nuevas.
+        """
+        columns = {row["name"] for row in cur.execute("PRAGMA table_info(tickets)")}
+        if "creation_date" not in columns:
+            return
+        cur.execute("ALTER TABLE tickets ADD COLUMN created_at INTEGER NOT NULL DEFAULT 0")
+        cur.execute("ALTER TABLE tickets ADD COLUMN closed_at INTEGER")
+        cur.execute("""
+            UPDATE tickets SET
+                created_at = CAST(strftime('%s', creation_date, 'utc') AS INTEGER),
+                closed_at = CAST(strftime('%s', closing_date, 'utc') AS INTEGER)
+        """)
+        for row in cur.execute("""
+            SELECT type, name FROM sqlite_master
+            WHERE type IN ('index', 'trigger')
+                AND (sql LIKE '%creation_date%' OR sql LIKE '%closing_date%')
+        """).fetchall():
+            cur.execute(f"DROP {row['type'].upper()} {row['name']}")
+        cur.execute("ALTER TABLE tickets DROP COLUMN creation_date")
+        cur.execute("ALTER TABLE tickets DROP COLUMN closing_date")
+
+    def _sync_indexes(self, cur):
+        existing = {
+            row["name"]: row["sql"]
+            for row in cur.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type='index' AND name LIKE 'idx\\_%' ESCAPE '\\'"
+            )
+        }
+        for name, sql in existing.items():
+            if name not in INDEXES or sql != f"CREATE INDEX {name} ON {INDEXES[name]}":
+                cur.execute(f"DROP INDEX {name}")
+                existing[name] = None
+        for name, target in INDEXES.items():
+            if existing.get(name) is None:
+                cur.execute(f"CREATE INDEX {name} ON {target}")
+
+    def _sync_search(self, cur):
+        """Crea las tablas FTS5 y sus triggers.
+
+        Una tabla FTS nueva, o cuyas columnas cambiaron, se (re)crea e indexa
+        lo existente. Los triggers pasan por _sync_triggers como los demas:
+        si cambia su cuerpo se recrean.
+        """
+        existing = {
+            row["name"]: row["sql"]
+            for row in cur.execute("SELECT name, sql FROM sqlite_master WHERE type='table'")
+        }
+        for fts, sql in SEARCH_FTS_TABLES.items():
+            if existing.get(fts) == sql:
+                continue
+            if fts in existing:
+                cur.execute(f"DROP TABLE {fts}")
+            cur.execute(sql)
+            cur.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+            cur.execute(f"INSERT INTO {fts} ({fts}) VALUES ('optimize')")
+        self._sync_triggers(cur, SEARCH_TRIGGERS)
+
+    def _sync_stats(self, cur):
+        """Crea ticket_stats y sus triggers; si faltaban o cambiaron, recalcula."""
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS ticket_stats (
+                dimension TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                open_count INTEGER NOT NULL DEFAULT 0,
+                closed_count INTEGER NOT NULL DEFAULT 0,
+                timed_count INTEGER NOT NULL DEFAULT 0,
+                close_seconds INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (dimension, bucket)
+            ) WITHOUT ROWID
+        """)
+        existing = {
+            row["name"]: row["sql"]
+            for row in cur.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type='trigger' AND name LIKE 'ticket\\_stats\\_%' ESCAPE '\\'"
             )
+        }
+        if existing == STATS_TRIGGERS:
+            return
+        for name in existing:
+            cur.execute(f"DROP TRIGGER {name}")
+        for sql in STATS_TRIGGERS.values():
+            cur.execute(sql)
+        cur.execute("DELETE FROM ticket_stats")
+        cur.executemany(self._stats_insert_sql(), self._compute_stats(cur))
+
+    def _migrate_ticket_client(self, cur):
+        """Pasa tickets.client (JSON del cliente) a la clave foranea client_id.
+
+        Los clientes que solo existen dentro del JSON se recrean en clients
+        con su id original para no perder datos.
+        """
+        columns = {row["name"] for row in cur.execute("PRAGMA table_info(tickets)")}
+        if "client" not in columns:
+            return
+        if "client_id" not in columns:
+            cur.execute("ALTER TABLE tickets ADD COLUMN client_id INTEGER REFERENCES clients (id)")
+        cur.execute("""
+            INSERT OR IGNORE INTO clients (id, name, email, phone_number)
+            SELECT json_extract(client, '$.id'), json_extract(client, '$.name'),
+                   json_extract(client, '$.email'), json_extract(client, '$.phone_number')
+            FROM tickets
+            WHERE client_id IS NULL AND json_extract(client, '$.id') IS NOT NULL
+        """)
+        cur.execute("""
+            UPDATE tickets SET client_id = json_extract(client, '$.id')
+            WHERE client_id IS NULL
         """)
-        conn.commit()
-        conn.close()
+        cur.execute("ALTER TABLE tickets DROP COLUMN client")
 
     # ------------------------------
     # Metodos de consulta
     # ------------------------------
+    @staticmethod
+    def _tuple_cursor(conn):
+        # Las filas salen como tuplas y se convierten con zip sobre los nombres
+        # de columna: evita crear un sqlite3.Row por fila y copiarlo con dict().
+        cur = conn.cursor()
+        cur.row_factory = None
+        return cur
+
+    @staticmethod
+    def _columns(cur):
+        return [d[0] for d in cur.description]
+
     def fetchall(self, query, params=()):
-        conn = self.get_connection()
-        try:
-            cur = conn.cursor()
-            cur.execute(query, params)
-            return [dict(row) for row in cur.fetchall()]
-        finally:
-            conn.close()
+        with phase("query", queries=1), self.get_connection() as conn:
+            cur = self._tuple_cursor(conn).execute(query, params)
+            columns = self._columns(cur)
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
 
     def fetchone(self, query, params=()):
-        conn = self.get_connection()
-        try:
-            cur = conn.cursor()
-            cur.execute(query, params)
+        with phase("query", queries=1), self.get_connection() as conn:
+            cur = self._tuple_cursor(conn).execute(query, params)
             row = cur.fetchone()
-            return dict(row) if row else None
-        finally:
-            conn.close()
+            return dict(zip(self._columns(cur), row)) if row else None
+
+    def add_write_listener(self, listener):
+        """Registra ``listener()``, que se llama despues de cada escritura confirmada."""
+        self._write_listeners.append(listener)
+
+    def write(self, fn):
+        """Ejecuta ``fn(conn)`` de forma atomica y confirmada; devuelve su resultado."""
+        with phase("query", queries=1):
+            if self.writer is not None:
+                result = self.writer.run(fn)
+            else:
+                with self.get_connection() as conn:
+                    try:
+                        result = fn(conn)
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+        self._notify_write()
+        return result
+
+    def _notify_write(self):
+        for listener in self._write_listeners:
+            listener()
 
     def execute(self, query, params=()):
-        conn = self.get_connection()
-        try:
-            cur = conn.cursor()
-            cur.execute(query, params)
-            conn.commit()
-            return cur.lastrowid
-        finally:
-            conn.close()
+        return self.write(lambda conn: conn.execute(query, params).lastrowid)
+
+    def executemany(self, query, seq_of_params):
+        """Ejecuta ``query`` para cada juego de parametros en una sola transaccion.
+
+        Devuelve el rowid de la ultima fila insertada.
+        """
+        def run(conn):
+            conn.executemany(query, seq_of_params)
+            return conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return self.write(run)
+
+    def fetch_by_ids(self, select, ids):
+        """Trae las filas de ``select`` (sin WHERE) cuyos id estan en ``ids`` con un solo IN (...)."""
+        ids = list(set(ids))
+        if not ids:
+            return []
+        placeholders = ", ".join("?" * len(ids))
+        return self.fetchall(f"{select} WHERE id IN ({placeholders})", ids)
+
+    @staticmethod
+    def _where(filters, after_id, key):
+        clauses, params = [], []
+        if after_id is not None:
+            clauses.append(f"{key} > ?")
+            params.append(after_id)
+        for condition, value in filters:
+            if value is not None:
+                clauses.append(condition)
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def fetch_page(self, select, filters=(), after_id=None, limit=PAGE_SIZE, key="id"):
+        """Pagina por clave (key > after_id) aplicando los filtros en SQL.
+
+        ``select`` es la consulta sin WHERE. ``filters`` es una secuencia de
+        pares (condicion, valor); los pares con valor None se ignoran.
+        Devuelve (filas, next_cursor), donde next_cursor es el id a usar como
+        after_id en la siguiente pagina, o None si no hay mas filas.
+        """
+        where, params = self._where(filters, after_id, key)
+        params.append(limit + 1)
+        rows = self.fetchall(f"{select} {where} ORDER BY {key} LIMIT ?", params)
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, rows[-1][key.rsplit(".", 1)[-1]]
+        return rows, None
+
+    def iter_filtered(self, select, filters=(), after_id=None, key="id", chunk_size=STREAM_CHUNK_SIZE):
+        """Como fetch_page pero sin limite, generando las filas de a ``chunk_size``.
+
+        Cada bloque es una pagina aparte (key > ultimo id entregado), asi la
+        conexion vuelve al pool antes de entregar las filas y un lector lento
+        no la retiene mientras consume el stream.
+        """
+        while True:
+            rows, after_id = self.fetch_page(select, filters, after_id, chunk_size, key)
+            yield from rows
+            if after_id is None:
+                return
+
+    # ------------------------------
+    # Marcas de cambio (ETag / Last-Modified)
+    # ------------------------------
+    def get_row_stamp(self, table, row_id):
+        """(version, updated_at) de una fila de incidents o clients, o None si no existe."""
+        row = self.fetchone(f"SELECT version, updated_at FROM {table} WHERE id=?", (row_id,))
+        return (row["version"], row["updated_at"]) if row else None
+
+    def get_ticket_stamp(self, ticket_id):
+        """Marca de un ticket: su representacion incluye al cliente, asi que suma la de este.
+
+        Si no esta en tickets, la busca en el archivo.
+        """
+        query = """
+            SELECT t.version, t.updated_at, t.client_id, c.version AS client_version,
+                   c.updated_at AS client_updated_at
+            FROM {table} t LEFT JOIN clients c ON c.id = t.client_id WHERE t.id=?
+        """
+        row = (self.fetchone(query.format(table="tickets"), (ticket_id,))
+               or self.fetchone(query.format(table="tickets_archive"), (ticket_id,)))
+        if not row:
+            return None
+        return (
+            f"{row['version']}.{row['client_id']}.{row['client_version']}",
+            max(row["updated_at"], row["client_updated_at"] or 0)
+        )
+
+    def get_table_stamps(self, tables):
+        """{tabla: (contador de cambios, updated_at)} leido de table_changes."""
+        placeholders = ", ".join("?" * len(tables))
+        rows = self.fetchall(
+            f"SELECT name, counter, updated_at FROM table_changes WHERE name IN ({placeholders})",
+            list(tables)
+        )
+        return {row["name"]: (row["counter"], row["updated_at"]) for row in rows}
+
+    # ------------------------------
+    # Changelog
+    # ------------------------------
+    def get_changes_page(self, after_seq=None, limit=PAGE_SIZE, entity=None):
+        """Eventos con seq > after_seq en orden; devuelve (filas, next_seq)."""
+        return self.fetch_page(CHANGE_SELECT, [("entity = ?", entity)], after_seq, limit, key="seq")
+
+    def get_last_change_seq(self):
+        return self.fetchone("SELECT COALESCE(MAX(seq), 0) AS seq FROM changelog")["seq"]
+
+    def get_first_change_seq(self):
+        """Seq del evento mas viejo que queda (0 si no hay eventos).
+
+        Los seq no se reutilizan y solo prune_changelog borra eventos: un
+        cursor ``since`` menor que esto menos uno se perdio eventos.
+        """
+        return self.fetchone("SELECT COALESCE(MIN(seq), 0) AS seq FROM changelog")["seq"]
+
+    def prune_changelog(self, changed_before, chunk_size=CHANGELOG_PRUNE_CHUNK_SIZE, pause=0.0):
+        """Borra los eventos anteriores a ``changed_before`` (epoch), de a ``chunk_size``.
+
+        Recorre el changelog por seq y se detiene en el primer evento que no
+        es tan viejo, sin recorrer el resto. Nunca borra el ultimo evento:
+        get_last_change_seq sigue devolviendo el seq vigente. Devuelve
+        cuantos eventos borro.
+        """
+        def prune(conn):
+            rows = conn.execute(
+                "SELECT seq, changed_at FROM changelog "
+                "WHERE seq < (SELECT MAX(seq) FROM changelog) ORDER BY seq LIMIT ?",
+                (chunk_size,)
+            ).fetchall()
+            last = None
+            for seq, changed_at in rows:
+                if changed_at >= changed_before:
+                    break
+                last = seq
+            if last is None:
+                return 0, False
+            deleted = conn.execute("DELETE FROM changelog WHERE seq <= ?", (last,)).rowcount
+            return deleted, last == rows[-1][0] and len(rows) == chunk_size
+
+        pruned = 0
+        while True:
+            count, more = self.write(prune)
+            pruned += count
+            if not more:
+                return pruned
+            if pause:
+                time.sleep(pause)
+
+    # ------------------------------
+    # Busqueda de texto completo
+    # ------------------------------
+    @staticmethod
+    def match_expression(text):
+        """Convierte texto libre en una expresion MATCH de FTS5 que no falla.
+
+        Cada palabra va entre comillas (se buscan todas, en cualquier orden);
+        una palabra terminada en * busca por prefijo. Devuelve None si no hay
+        ninguna palabra.
+        """
+        terms = re.findall(r"(\w+)(\*?)", text)
+        if not terms:
+            return None
+        return " ".join(f'"{word}"{star}' for word, star in terms)
+
+    def search(self, text, kinds=None, offset=0, limit=PAGE_SIZE):
+        """Busca ``text`` en las tablas de SEARCH_TABLES, ordenado por bm25.
+
+        ``kinds`` restringe los tipos de resultado ("incident", "ticket").
+        Cada tabla devuelve a lo sumo offset + limit + 1 filas (FTS5 resuelve
+        ORDER BY rank LIMIT sin ordenar todas las coincidencias) y se mezclan
+        por puntaje. El costo crece con la cantidad de coincidencias, no con
+        el tamaño de la tabla: un termino que aparece en casi todas las filas
+        sigue siendo lento. Devuelve (resultados, next_offset), con next_offset None
+        si no hay mas.
+        """
+        match = self.match_expression(text)
+        if match is None:
+            return [], None
+        results = []
+        for table, (columns, kind) in SEARCH_TABLES.items():
+            if kinds and kind not in kinds:
+                continue
+            fts = f"{table}_fts"
+            snippets = ", ".join(
+                f"snippet({fts}, {i}, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) AS {column}"
+                for i, column in enumerate(columns)
+            )
+            results.extend(self.fetchall(
+                f"""
+                SELECT '{kind}' AS type, rowid AS id, rank AS score, {snippets}
+                FROM {fts} WHERE {fts} MATCH ? ORDER BY rank LIMIT ?
+                """,
+                (match, offset + limit + 1)
+            ))
+        results.sort(key=lambda r: r["score"])
+        page = [
+            {
+                "type": row["type"],
+                "id": row["id"],
+                # bm25 es negativo (mas chico = mas relevante); se expone positivo.
+                "score": -row["score"],
+                "snippet": {column: row[column] for column in SEARCH_COLUMNS[row["type"]]},
+            }
+            for row in results[offset:offset + limit]
+        ]
+        next_offset = offset + limit if len(results) > offset + limit else None
+        return page, next_offset
+
+    # ------------------------------
+    # Estadisticas de tickets
+    # ------------------------------
+    @staticmethod
+    def _stats_insert_sql():
+        columns = ", ".join(STATS_COLUMNS)
+        return f"INSERT INTO ticket_stats (dimension, bucket, {columns}) VALUES (?, ?, ?, ?, ?, ?)"
+
+    @staticmethod
+    def _compute_stats(conn):
+        """Recalcula los agregados desde tickets y el archivo; devuelve tuplas de ticket_stats."""
+        selects = " UNION ALL ".join(
+            f"""
+            SELECT '{dimension}', COALESCE({expr.format(t="t")}, '') AS bucket,
+                   SUM(t.status != 'Closed'), SUM(t.status = 'Closed'),
+                   SUM(t.status = 'Closed' AND t.closed_at IS NOT NULL),
+                   SUM({CLOSE_SECONDS.format(t="t")})
+            FROM {_all_tickets()} t GROUP BY bucket
+            """
+            for dimension, expr in STATS_DIMENSIONS.items()
+        )
+        return [tuple(row) for row in conn.execute(selects)]
+
+    def rebuild_ticket_stats(self, check_only=False):
+        """Recalcula ticket_stats desde cero y devuelve las diferencias halladas.
+
+        Cada diferencia es (dimension, bucket, guardado, recalculado), con los
+        contadores como tuplas en el orden de STATS_COLUMNS. Con
+        ``check_only`` solo compara, sin reemplazar lo guardado.
+        """
+        def run(conn):
+            stored = {
+                (row[0], row[1]): tuple(row[2:])
+                for row in conn.execute(f"SELECT dimension, bucket, {', '.join(STATS_COLUMNS)} FROM ticket_stats")
+            }
+            fresh = self._compute_stats(conn)
+            fresh_by_key = {(row[0], row[1]): row[2:] for row in fresh}
+            empty = (0,) * len(STATS_COLUMNS)
+            drift = [
+                (dimension, bucket, stored.get((dimension, bucket), empty), fresh_by_key.get((dimension, bucket), empty))
+                for dimension, bucket in sorted(stored.keys() | fresh_by_key.keys())
+                if stored.get((dimension, bucket), empty) != fresh_by_key.get((dimension, bucket), empty)
+            ]
+            if not check_only:
+                conn.execute("DELETE FROM ticket_stats")
+                conn.executemany(self._stats_insert_sql(), fresh)
+            return drift
+        return self.write(run)
+
+    def get_ticket_stats(self, dimension, bucket=None, start=None, end=None):
+        """Filas de ticket_stats de una dimension, por clave primaria.
+
+        ``bucket`` pide un solo grupo; ``start``/``end`` acotan el rango de
+        grupos (start <= bucket < end), pensado para la dimension day.
+        """
+        return self.fetchall(
+            f"""
+            SELECT bucket, {', '.join(STATS_COLUMNS)} FROM ticket_stats
+            WHERE dimension = ? AND open_count + closed_count > 0
+                {"AND bucket = ?" if bucket is not None else ""}
+                {"AND bucket >= ?" if start is not None else ""}
+                {"AND bucket < ?" if end is not None else ""}
+            ORDER BY bucket
+            """,
+            [dimension] + [v for v in (bucket, start, end) if v is not None]
+        )
+
+    # ------------------------------
+    # Importacion y exportacion masiva
+    # ------------------------------
+    def iter_table(self, table, after_id=None):
+        """Genera las filas de ``table`` con las columnas de TRANSFER_COLUMNS, por id."""
+        columns = ", ".join(TRANSFER_COLUMNS[table])
+        return self.iter_filtered(f"SELECT {columns} FROM {table}", after_id=after_id)
+
+    def import_rows(self, table, rows, on_conflict="error"):
+        """Inserta ``rows`` en ``table`` con un executemany, en una sola transaccion.
+
+        Cada fila es una tupla en el orden de TRANSFER_COLUMNS[table]; con id
+        None se asigna uno nuevo. Si el id ya existe, ``on_conflict`` decide:
+        "error" (sqlite3.IntegrityError y no se importa nada del lote),
+        "skip" (se deja la fila existente) o "update" (se reemplazan sus datos
+        y se incrementa version). Los triggers mantienen FTS, estadisticas y
+        changelog como en cualquier escritura.
+
+        Devuelve cuantas filas se insertaron o actualizaron.
+        """
+        if on_conflict not in IMPORT_CONFLICTS:
+            raise ValueError(f"on_conflict must be one of {', '.join(IMPORT_CONFLICTS)}")
+        columns = TRANSFER_COLUMNS[table]
+        query = (
+            f"INSERT INTO {table} ({', '.join(columns)}, updated_at) "
+            f"VALUES ({', '.join('?' * len(columns))}, ?)"
+        )
+        if on_conflict == "skip":
+            query += " ON CONFLICT (id) DO NOTHING"
+        elif on_conflict == "update":
+            assignments = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+            query += (f" ON CONFLICT (id) DO UPDATE SET {assignments}, "
+                      "version = version + 1, updated_at = excluded.updated_at")
+        stamp = now()
+
+        def run(conn):
+            return conn.executemany(query, ((*row, stamp) for row in rows)).rowcount
+        return self.write(run)
 
     # ------------------------------
     # CRUD de incidents
     # ------------------------------
     def get_all_incidents(self):
-        return self.fetchall("SELECT * FROM incidents")
+        return self.fetchall(INCIDENT_SELECT)
+
+    @staticmethod
+    def _incident_filters(incident_type=None):
+        return [("incident_type = ?", incident_type)]
+
+    def get_incidents_page(self, after_id=None, limit=PAGE_SIZE, **filters):
+        return self.fetch_page(
+            INCIDENT_SELECT, self._incident_filters(**filters), after_id, limit
+        )
+
+    def iter_incidents(self, after_id=None, **filters):
+        return self.iter_filtered(
+            INCIDENT_SELECT, self._incident_filters(**filters), after_id
+        )
+
+    def get_incidents_by_ids(self, incident_ids):
+        return self.fetch_by_ids(INCIDENT_SELECT, incident_ids)
 
     def get_incident(self, incident_id):
-        return self.fetchone("SELECT * FROM incidents WHERE id=?", (incident_id,))
+        return self.fetchone(f"{INCIDENT_SELECT} WHERE id=?", (incident_id,))
 
     def save_incident(self, incident_dict):
         if "id" not in incident_dict or incident_dict["id"] is None:
             incident_id = self.execute(
-                "INSERT INTO incidents (description, incident_type) VALUES (?, ?)",
-                (incident_dict["description"], incident_dict["incident_type"])
+                "INSERT INTO incidents (description, incident_type, updated_at) VALUES (?, ?, ?)",
+                (incident_dict["description"], incident_dict["incident_type"], now())
             )
             incident_dict["id"] = incident_id
         else:
             self.execute(
-                "UPDATE incidents SET description=?, incident_type=? WHERE id=?",
-                (incident_dict["description"], incident_dict["incident_type"], incident_dict["id"])
+                "UPDATE incidents SET description=?, incident_type=?, version=version + 1, updated_at=? WHERE id=?",
+                (incident_dict["description"], incident_dict["incident_type"], now(), incident_dict["id"])
             )
         return incident_dict
 
@@ -109,25 +1290,59 @@ class DatabaseHandler:
     # CRUD de tickets
     # ------------------------------
     def get_all_tickets(self):
-        return self.fetchall("SELECT * FROM tickets")
+        return self.fetchall(TICKET_SELECT)
+
+    @staticmethod
+    def _ticket_filters(status=None, service=None, incident_id=None,
+                        created_after=None, created_before=None, closed_within=None):
+        """``created_after``/``created_before`` son epoch; ``closed_within``, segundos hacia atras."""
+        closed_from = closed_to = None
+        if closed_within is not None:
+            # Rango cerrado en ambos extremos: sin estadisticas, SQLite estima
+            # un rango acotado como selectivo y usa idx_tickets_closed_at en
+            # vez de recorrer la tabla por id.
+            closed_to = now()
+            closed_from = closed_to - closed_within
+        return [
+            ("t.status = ?", status),
+            ("t.service = ?", service),
+            ("t.incident_id = ?", incident_id),
+            ("t.created_at >= ?", created_after),
+            ("t.created_at < ?", created_before),
+            ("t.closed_at >= ?", closed_from),
+            ("t.closed_at <= ?", closed_to),
+        ]
+
+    def get_tickets_page(self, after_id=None, limit=PAGE_SIZE, **filters):
+        return self.fetch_page(
+            TICKET_SELECT, self._ticket_filters(**filters), after_id, limit, key="t.id"
+        )
+
+    def iter_tickets(self, after_id=None, **filters):
+        return self.iter_filtered(
+            TICKET_SELECT, self._ticket_filters(**filters), after_id, key="t.id"
+        )
 
     def get_ticket(self, ticket_id):
-        return self.fetchone("SELECT * FROM tickets WHERE id=?", (ticket_id,))
+        """El ticket ``ticket_id``, vivo o archivado."""
+        row = self.fetchone(f"{TICKET_SELECT} WHERE t.id=?", (ticket_id,))
+        return row if row is not None else self.get_archived_ticket(ticket_id)
 
     def save_ticket(self, ticket_dict):
         if "id" not in ticket_dict or ticket_dict["id"] is None:
             ticket_id = self.execute(
                 """
-                INSERT INTO tickets (client, service, incident_id, status, creation_date, closing_date)
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT INTO tickets (client_id, service, incident_id, status, created_at, closed_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
                 """,
                 (
-                    ticket_dict["client"],
+                    ticket_dict["client_id"],
                     ticket_dict["service"],
                     ticket_dict["incident_id"],
                     ticket_dict["status"],
-                    ticket_dict["creation_date"],
-                    ticket_dict["closing_date"]
+                    ticket_dict["created_at"],
+                    ticket_dict["closed_at"],
+                    now()
                 )
             )
             ticket_dict["id"] = ticket_id
@@ -135,51 +1350,249 @@ class DatabaseHandler:
             self.execute(
                 """
                 UPDATE tickets
-                SET client=?, service=?, incident_id=?, status=?, creation_date=?, closing_date=?
+                SET client_id=?, service=?, incident_id=?, status=?, created_at=?, closed_at=?,
+                    version=version + 1, updated_at=?
                 WHERE id=?
                 """,
                 (
-                    ticket_dict["client"],
+                    ticket_dict["client_id"],
                     ticket_dict["service"],
                     ticket_dict["incident_id"],
                     ticket_dict["status"],
-                    ticket_dict["creation_date"],
-                    ticket_dict["closing_date"],
+                    ticket_dict["created_at"],
+                    ticket_dict["closed_at"],
+                    now(),
                     ticket_dict["id"]
                 )
             )
         return ticket_dict
 
+    def _update_ticket_returning(self, ticket_id, assignments, params, expected_version):
+        """UPDATE ... RETURNING de un ticket en una sola sentencia.
+
+        Incrementa version. Con ``expected_version``, solo actualiza si la
+        version coincide y lanza VersionConflict si el ticket existe con otra.
+        Los tickets archivados no se modifican: lanza TicketArchived.
+        Devuelve la fila con la forma de TICKET_SELECT, o None si no existe.
+        """
+        assignments = assignments + ["version = version + 1", "updated_at = ?"]
+        params = list(params) + [now()]
+        where, where_params = "id = ?", [ticket_id]
+        if expected_version is not None:
+            where += " AND version = ?"
+            where_params.append(expected_version)
+        query = f"UPDATE tickets SET {', '.join(assignments)} WHERE {where} {TICKET_RETURNING}"
+
+        def run(conn):
+            cur = self._tuple_cursor(conn).execute(query, params + where_params)
+            row = cur.fetchone()
+            if row is not None:
+                return dict(zip(self._columns(cur), row))
+            if expected_version is not None and conn.execute(
+                "SELECT 1 FROM tickets WHERE id = ?", (ticket_id,)
+            ).fetchone():
+                raise VersionConflict(f"ticket {ticket_id} is not at version {expected_version}")
+            if conn.execute("SELECT 1 FROM tickets_archive WHERE id = ?", (ticket_id,)).fetchone():
+                raise TicketArchived(f"ticket {ticket_id} is archived")
+            return None
+        return self.write(run)
+
+    def update_ticket(self, ticket_id, changes, closed_at=None, expected_version=None):
+        """Actualiza solo las columnas de ``changes`` (client_id, service, incident_id, status).
+
+        Si cambia status, closed_at sigue la regla de los tickets: al pasar
+        a "Closed" conserva la fecha de cierre que tuviera o toma
+        ``closed_at``; al pasar a "Open" se borra.
+        """
+        assignments, params = [], []
+        for column in ("client_id", "service", "incident_id", "status"):
+            if column in changes:
+                assignments.append(f"{column} = ?")
+                params.append(changes[column])
+        if changes.get("status") == "Closed":
+            assignments.append("closed_at = COALESCE(closed_at, ?)")
+            params.append(closed_at)
+        elif changes.get("status") == "Open":
+            assignments.append("closed_at = NULL")
+        return self._update_ticket_returning(ticket_id, assignments, params, expected_version)
+
+    def close_ticket(self, ticket_id, closed_at, expected_version=None):
+        return self._update_ticket_returning(
+            ticket_id, ["status = 'Closed'", "closed_at = ?"], [closed_at], expected_version
+        )
+
+    def save_tickets_many(self, ticket_dicts):
+        """Inserta tickets nuevos con executemany dentro de una transaccion.
+
+        Mientras dura la transaccion nadie mas puede escribir, asi que los id
+        asignados son consecutivos y terminan en last_insert_rowid().
+        """
+        if not ticket_dicts:
+            return ticket_dicts
+        stamp = now()
+        last_id = self.executemany(
+            """
+            INSERT INTO tickets (client_id, service, incident_id, status, created_at, closed_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    t["client_id"],
+                    t["service"],
+                    t["incident_id"],
+                    t["status"],
+                    t["created_at"],
+                    t["closed_at"],
+                    stamp
+                )
+                for t in ticket_dicts
+            ]
+        )
+        first_id = last_id - len(ticket_dicts) + 1
+        for offset, ticket_dict in enumerate(ticket_dicts):
+            ticket_dict["id"] = first_id + offset
+        return ticket_dicts
+
     def delete_ticket(self, ticket_id):
         self.execute("DELETE FROM tickets WHERE id=?", (ticket_id,))
 
+    # ------------------------------
+    # Cola de despacho
+    # ------------------------------
+    def iter_dispatch_candidates(self):
+        """Genera (id, incident_id, created_at) de los tickets abiertos que nadie tomo."""
+        return self.iter_filtered(
+            "SELECT t.id, t.incident_id, t.created_at FROM tickets t",
+            [("t.status = ? AND NOT EXISTS (SELECT 1 FROM ticket_claims c WHERE c.ticket_id = t.id)", "Open")],
+            key="t.id"
+        )
+
+    def get_claimed_ticket_ids(self, ticket_ids):
+        """De ``ticket_ids``, el set de los que ya tienen agente en ticket_claims."""
+        ids = list(set(ticket_ids))
+        if not ids:
+            return set()
+        placeholders = ", ".join("?" * len(ids))
+        rows = self.fetchall(f"SELECT ticket_id FROM ticket_claims WHERE ticket_id IN ({placeholders})", ids)
+        return {row["ticket_id"] for row in rows}
+
+    def claim_ticket(self, ticket_id, agent, claimed_at):
+        """Asigna el ticket a ``agent`` si sigue abierto y nadie lo tomo.
+
+        Devuelve la fila con la forma de TICKET_SELECT, o None si ya estaba
+        tomado, cerrado o no existe.
+        """
+        def run(conn):
+            claimed = conn.execute(
+                """
+                INSERT INTO ticket_claims (ticket_id, agent, claimed_at)
+                SELECT id, ?, ? FROM tickets WHERE id = ? AND status = 'Open'
+                ON CONFLICT (ticket_id) DO NOTHING
+                """,
+                (agent, claimed_at, ticket_id)
+            ).rowcount
+            if not claimed:
+                return None
+            cur = self._tuple_cursor(conn).execute(f"{TICKET_SELECT} WHERE t.id=?", (ticket_id,))
+            return dict(zip(self._columns(cur), cur.fetchone()))
+        return self.write(run)
+
+    # ------------------------------
+    # Archivo de tickets cerrados
+    # ------------------------------
+    def get_archived_ticket(self, ticket_id):
+        return self.fetchone(f"{ARCHIVED_TICKET_SELECT} WHERE t.id=?", (ticket_id,))
+
+    def archive_tickets(self, closed_before, chunk_size=ARCHIVE_CHUNK_SIZE, pause=0.0):
+        """Mueve a tickets_archive los tickets cerrados antes de ``closed_before`` (epoch).
+
+        Cada tanda de ``chunk_size`` tickets es una transaccion corta (copia
+        y borra por id), asi las escrituras de la API se intercalan entre
+        tandas; ``pause`` son segundos de espera entre una y otra. Devuelve
+        cuantos tickets movio.
+        """
+        columns = ", ".join(ARCHIVE_COLUMNS)
+
+        def move(conn):
+            # "+status" deja afuera a idx_tickets_status: por idx_tickets_closed_at
+            # solo se recorren los cerrados antes del corte, no todos los cerrados.
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM tickets WHERE closed_at < ? AND +status = 'Closed' LIMIT ?",
+                (closed_before, chunk_size)
+            )]
+            if ids:
+                placeholders = ", ".join("?" * len(ids))
+                conn.execute(
+                    f"INSERT INTO tickets_archive ({columns}, archived_at) "
+                    f"SELECT {columns}, ? FROM tickets WHERE id IN ({placeholders})",
+                    [now(), *ids]
+                )
+                conn.execute(f"DELETE FROM tickets WHERE id IN ({placeholders})", ids)
+            return len(ids)
+
+        moved = 0
+        while True:
+            count = self.write(move)
+            moved += count
+            if count < chunk_size:
+                return moved
+            if pause:
+                time.sleep(pause)
+
+    def archive_stats(self):
+        """Tickets vivos, cerrados en tickets y archivados."""
+        return self.fetchone("""
+            SELECT (SELECT COUNT(*) FROM tickets) AS live,
+                   (SELECT COUNT(*) FROM tickets WHERE status = 'Closed') AS live_closed,
+                   (SELECT COUNT(*) FROM tickets_archive) AS archived
+        """)
+
     # ------------------------------
     # CRUD de cliente
     # ------------------------------
     def get_all_clients(self):
-        return self.fetchall("SELECT * FROM clients")
+        return self.fetchall(CLIENT_SELECT)
+
+    @staticmethod
+    def _client_filters(email=None):
+        return [("email = ?", email)]
+
+    def get_clients_page(self, after_id=None, limit=PAGE_SIZE, **filters):
+        return self.fetch_page(
+            CLIENT_SELECT, self._client_filters(**filters), after_id, limit
+        )
+
+    def iter_clients(self, after_id=None, **filters):
+        return self.iter_filtered(
+            CLIENT_SELECT, self._client_filters(**filters), after_id
+        )
+
+    def get_clients_by_ids(self, client_ids):
+        return self.fetch_by_ids(CLIENT_SELECT, client_ids)
 
     def get_client(self, client_id):
-        return self.fetchone("SELECT * FROM clients WHERE id=?", (client_id,))
+        return self.fetchone(f"{CLIENT_SELECT} WHERE id=?", (client_id,))
 
     def save_client(self, client_dict):
         if "id" not in client_dict or client_dict["id"] is None:
             client_id = self.execute(
-                "INSERT INTO clients (name, email, phone_number) VALUES (?, ?, ?)",
+                "INSERT INTO clients (name, email, phone_number, updated_at) VALUES (?, ?, ?, ?)",
                 (
                 client_dict["name"], 
                 client_dict["email"], 
-                client_dict["phone_number"]
+                client_dict["phone_number"],
+                now()
                 )
             )
             client_dict["id"] = client_id
         else:
             self.execute(
-                "UPDATE clients SET name=?, email=?, phone_number=? WHERE id=?",
+                "UPDATE clients SET name=?, email=?, phone_number=?, version=version + 1, updated_at=? WHERE id=?",
                 (
                 client_dict["name"], 
                 client_dict["email"], 
                 client_dict["phone_number"], 
+                now(),
                 client_dict["id"]
                 )
             )
@@ -188,3 +1601,57 @@ class DatabaseHandler:
     def delete_client(self, client_id):
         self.execute("DELETE FROM clients WHERE id=?", (client_id,))
 
+
+class AsyncDatabaseHandler:
+    """Contraparte asincronica de DatabaseHandler.
+
+    Cada llamada corre en un pool de hilos propio (ASYNC_WORKERS hilos, o
+    ``workers``), de modo que el event loop nunca espera I/O de SQLite. Los
+    metodos del handler se exponen como corutinas: ``await adb.get_ticket(1)``.
+    """
+
+    def __init__(self, db=None, workers=None):
+        self.db = db if db is not None else DatabaseHandler()
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or ASYNC_WORKERS, thread_name_prefix="sqlite"
+        )
+
+    async def run(self, fn, *args, **kwargs):
+        """Ejecuta ``fn`` en los hilos de base de datos y espera el resultado."""
+        loop = asyncio.get_running_loop()
+        # Copia el contexto para que las fases medidas en el hilo se sumen al pedido.
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, partial(context.run, fn, *args, **kwargs))
+
+    async def iterate(self, iterator, batch=STREAM_CHUNK_SIZE):
+        """Consume un generador sincronico (p. ej. iter_tickets) de a lotes.
+
+        Cada lote es una llamada aparte a ``run``: entre lotes no queda un hilo
+        ocupado, ni una conexion si el generador lee por bloques como
+        iter_filtered. Al terminar, o si quien consume abandona la iteracion,
+        cierra el generador para que corran sus finally.
+        """
+        try:
+            while True:
+                chunk = await self.run(lambda: list(islice(iterator, batch)))
+                if not chunk:
+                    break
+                for item in chunk:
+                    yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                await self.run(close)
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        return call
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.db.close()
@@ -0,0 +1,613 @@
+"""Logica de los endpoints de la API, comun a app.py (Flask) y asgi_app.py (Starlette).
+
+Aca se leen y validan los parametros, se llama a los managers y se arma
+la respuesta; cada framework solo traduce su pedido a estos argumentos y
+el resultado a su tipo de respuesta. Las operaciones devuelven
+(cuerpo JSON, status, headers o None) y no dependen del framework: app.py
+las llama directo y asgi_app.py, las que tocan la base, en los hilos de
+AsyncDatabaseHandler.
+
+Services agrupa la base y los managers de una app (una por proceso).
+"""
+import csv
+import json
+import os
+from email.utils import formatdate, parsedate_to_datetime
+
+from database import (
+    IMPORT_CONFLICTS, MAX_PAGE_SIZE, PAGE_SIZE, STREAM_CHUNK_SIZE, TRANSFER_COLUMNS,
+    TicketArchived, VersionConflict
+)
+from instrumentation import db_gauges
+from managers import (
+    IncidentManager, TicketManager, ClientManager, SearchManager, StatsManager,
+    ChangeManager, ChangeFeed, DispatchQueue, CacheSync
+)
+from timestamps import format_timestamp, now, parse_timestamp, parse_duration
+import transfer
+
+MAX_BULK_SIZE = 1000
+NDJSON = "application/x-ndjson"
+STREAM_BATCH = 200
+SSE_KEEPALIVE = 15
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+CORS_EXPOSE_HEADERS = ["X-Next-Cursor", "ETag", "Server-Timing"]
+# Rutas que pueden leer las caches de incidents y clients (ver needs_cache_sync).
+CACHED_ROUTES_PREFIX = "/api/"
+CHANGES_EXPIRED = "since is older than the retained changelog; reload and resume from the current seq"
+# Orden de atencion de la cola de despacho: tipos de incident separados por
+# coma, el mas urgente primero (por defecto, DispatchQueue.PRIORITIES).
+DISPATCH_PRIORITIES_ENV = "TICKETS_DISPATCH_PRIORITIES"
+
+# Filtros de la query string de cada listado: {nombre: conversion}.
+LIST_FILTERS = {
+    "incidents": {"incident_type": str},
+    "tickets": {
+        "status": str, "service": str, "incident_id": int,
+        "created_after": parse_timestamp, "created_before": parse_timestamp,
+        "closed_within": parse_duration,
+    },
+    "clients": {"email": str},
+}
+
+
+def dispatch_priorities():
+    """Los tipos de incident de TICKETS_DISPATCH_PRIORITIES, o None si no esta definida."""
+    types = [name.strip() for name in os.environ.get(DISPATCH_PRIORITIES_ENV, "").split(",")]
+    return [name for name in types if name] or None
+
+
+class Services:
+    """La base y los managers que usan los endpoints.
+
+    Si la base es un archivo, otros procesos pueden escribir en ella (los
+    workers de serve.py, archive_tickets.py, una importacion por linea de
+    comandos): ``cache_sync`` es entonces un CacheSync que la app llama al
+    empezar cada pedido. ``multiprocess`` lo fuerza (True) o lo apaga (False);
+    por defecto (None) se decide por la base. Con ":memory:" es None.
+    """
+
+    def __init__(self, db, multiprocess=None):
+        self.db = db
+        self.incident_manager = IncidentManager(db)
+        self.ticket_manager = TicketManager(db)
+        self.client_manager = ClientManager(db)
+        self.search_manager = SearchManager(db)
+        self.stats_manager = StatsManager(db)
+        self.change_manager = ChangeManager(db)
+        self.change_feed = ChangeFeed(db)
+        self.dispatch_queue = DispatchQueue(db, dispatch_priorities())
+        # Por nombre de tabla: las limpian una importacion y CacheSync.
+        self.cached_managers = {"incidents": self.incident_manager, "clients": self.client_manager}
+        self.list_managers = {
+            "incidents": self.incident_manager,
+            "tickets": self.ticket_manager,
+            "clients": self.client_manager,
+        }
+        if multiprocess is None:
+            multiprocess = db.db_name != ":memory:"
+        self.cache_sync = None
+        if multiprocess:
+            self.cache_sync = CacheSync(db, self.cached_managers)
+
+    def needs_cache_sync(self, path):
+        """Si un pedido a ``path`` corre cache_sync antes; /metrics y la documentacion no usan las caches."""
+        return self.cache_sync is not None and path.startswith(CACHED_ROUTES_PREFIX)
+
+    def gauges(self):
+        """Gauges de /metrics: base, caches, streams de cambios y cola de despacho."""
+        # La cola sin sync: /metrics no consulta la base ni la carga (en la
+        # app ASGI corre en el event loop). Hasta que se usa no tiene valor.
+        queued = self.dispatch_queue.size(sync=False)
+        return db_gauges(self.db) + [
+            ("lookup_cache", "Incident and client lookup cache counters.",
+             [({"cache": name, "stat": stat}, value)
+              for name, manager in self.cached_managers.items()
+              for stat, value in manager.cache_stats().items()]),
+            ("change_feed_subscribers", "Open change stream subscriptions.",
+             [({}, self.change_feed.subscriber_count())]),
+            ("dispatch_queue_size", "Open unclaimed tickets in the dispatch queue, as of its last sync.",
+             [({}, queued)] if queued is not None else []),
+        ]
+
+    def close(self):
+        self.change_feed.close()
+        self.db.close()
+
+
+# ------------------------------
+# Respuestas
+# ------------------------------
+def error(message, status):
+    return {"error": message}, status, None
+
+
+def paged(items, next_cursor):
+    """``items`` son dicts listos para JSON; el cursor viaja en X-Next-Cursor."""
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else None
+    return items, 200, headers
+
+
+def json_object(data):
+    """El cuerpo si es un objeto JSON; si no (falta o es otra cosa), {}."""
+    return data if isinstance(data, dict) else {}
+
+
+def missing_field(data, fields):
+    """El primero de ``fields`` que falta (o es null) en ``data``, o None."""
+    return next((name for name in fields if data.get(name) is None), None)
+
+
+def is_id(value):
+    """True si ``value`` es un id entero; en JSON true/false no lo son, aunque bool sea int."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# ------------------------------
+# Parametros de la query string
+# ------------------------------
+def page_args(args, **filters):
+    """Lee after_id, limit y los filtros indicados de ``args`` (la query string).
+
+    Devuelve (params, error); error es un mensaje si algun valor es invalido.
+    """
+    params = {}
+    for name, cast in {"after_id": int, "limit": int, **filters}.items():
+        value = args.get(name)
+        if value is None or value == "":
+            continue
+        try:
+            params[name] = cast(value)
+        except ValueError:
+            return None, f"Invalid value for {name}"
+    limit = params.get("limit", PAGE_SIZE)
+    if limit < 1:
+        return None, "limit must be positive"
+    params["limit"] = min(limit, MAX_PAGE_SIZE)
+    return params, None
+
+
+def search_args(args):
+    """Lee q, type, offset y limit de la query string.
+
+    Devuelve (text, kinds, params, error); error es un mensaje si algun valor
+    es invalido.
+    """
+    text = (args.get("q") or "").strip()
+    if not text:
+        return None, None, None, "q is required"
+    kinds = [k for k in (args.get("type") or "").split(",") if k]
+    if any(k not in SearchManager.KINDS for k in kinds):
+        return None, None, None, f"type must be one of {', '.join(SearchManager.KINDS)}"
+    params = {}
+    for name in ("offset", "limit"):
+        value = args.get(name)
+        if value is None or value == "":
+            continue
+        try:
+            params[name] = int(value)
+        except ValueError:
+            return None, None, None, f"Invalid value for {name}"
+    if params.get("offset", 0) < 0:
+        return None, None, None, "offset must not be negative"
+    limit = params.get("limit", PAGE_SIZE)
+    if limit < 1:
+        return None, None, None, "limit must be positive"
+    params["limit"] = min(limit, MAX_PAGE_SIZE)
+    return text, kinds or None, params, None
+
+
+# ------------------------------
+# Listados, streaming y respuestas condicionales
+# ------------------------------
+def list_args(entity, args):
+    """(params, error) de un listado de ``entity`` (incidents, tickets o clients)."""
+    return page_args(args, **LIST_FILTERS[entity])
+
+
+def list_is_conditional(params):
+    # closed_within depende de la hora actual: el mismo ETag no sirve.
+    return "closed_within" not in params
+
+
+def list_page(manager, params):
+    return paged(*manager.page_dicts(**params))
+
+
+def stream_format(accept, stream):
+    """"ndjson", "json" o None segun el tipo preferido en Accept y el parametro ?stream=."""
+    if accept == NDJSON:
+        return "ndjson"
+    if stream in ("1", "true"):
+        return "json"
+    return None
+
+
+def stream_mimetype(fmt):
+    return NDJSON if fmt == "ndjson" else "application/json"
+
+
+def stream_chunks(items, fmt):
+    """Serializa ``items`` a medida que salen del cursor, de a STREAM_BATCH.
+
+    Con fmt "json" arma un array JSON; con "ndjson", un objeto por linea.
+    """
+    if fmt == "json":
+        yield "["
+    batch, first = [], True
+    for item in items:
+        batch.append(json.dumps(item))
+        if len(batch) == STREAM_BATCH:
+            yield _join_batch(batch, fmt, first)
+            batch, first = [], False
+    if batch:
+        yield _join_batch(batch, fmt, first)
+    if fmt == "json":
+        yield "]"
+
+
+def _join_batch(batch, fmt, first):
+    if fmt == "ndjson":
+        return "\n".join(batch) + "\n"
+    return ("" if first else ",") + ",".join(batch)
+
+
+def is_fresh(stamp, if_none_match, if_modified_since):
+    """True si los headers del pedido ya corresponden a ``stamp`` (etag, last_modified)."""
+    etag, last_modified = stamp
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or any(tag.removeprefix("W/") == f'"{etag}"' for tag in tags)
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def stamp_headers(stamp):
+    """ETag y, si ya paso el segundo de ``last_modified``, Last-Modified.
+
+    Last-Modified tiene resolucion de un segundo: un cambio mas tarde en el
+    mismo segundo no lo mueve y un If-Modified-Since con esa fecha daria un
+    304 con datos viejos. Mientras dura ese segundo solo va el ETag.
+    """
+    etag, last_modified = stamp
+    headers = {"ETag": f'W/"{etag}"'}
+    if last_modified < now():
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def get_item(manager, item_id, label):
+    item = manager.get(item_id)
+    if item:
+        return item.to_dict(), 200, None
+    return error(f"{label} not found", 404)
+
+
+# ------------------------------
+# Incidents
+# ------------------------------
+def create_incident(svc, data):
+    if not isinstance(data, dict):
+        return error("Expected a JSON object", 400)
+    missing = missing_field(data, ("description", "incident_type"))
+    if missing:
+        return error(f"{missing} is required", 400)
+    incident = svc.incident_manager.create(data["description"], data["incident_type"])
+    return incident.to_dict(), 201, None
+
+
+def update_incident(svc, incident_id, data):
+    data = json_object(data)
+    incident = svc.incident_manager.update(
+        incident_id,
+        description=data.get("description"),
+        incident_type=data.get("incident_type")
+    )
+    if incident:
+        return incident.to_dict(), 200, None
+    return error("Incident not found", 404)
+
+
+# ------------------------------
+# Tickets
+# ------------------------------
+def create_ticket(svc, data):
+    if not isinstance(data, dict):
+        return error("Expected a JSON object", 400)
+
+    incident_id = data.get("incident_id")
+    incident = None if isinstance(incident_id, bool) else svc.incident_manager.get(incident_id)
+    if not incident:
+        return error("Incident is not valid", 400)
+
+    client_id = data.get("client_id")
+    if not client_id:
+        return error("client_id is required", 400)
+
+    client = None if isinstance(client_id, bool) else svc.client_manager.get(client_id)
+    if not client:
+        return error("Client not found", 404)
+
+    service = data.get("service") or "Unknown"
+    return svc.ticket_manager.create(client, service, incident.id).to_dict(), 201, None
+
+
+def create_tickets_bulk(svc, data):
+    if not isinstance(data, list):
+        return error("Expected a JSON array of tickets", 400)
+    if len(data) > MAX_BULK_SIZE:
+        return error(f"At most {MAX_BULK_SIZE} tickets per request", 400)
+
+    items = [item if isinstance(item, dict) else {} for item in data]
+    incidents = svc.incident_manager.get_many(
+        [i["incident_id"] for i in items if is_id(i.get("incident_id"))]
+    )
+    clients = svc.client_manager.get_many(
+        [i["client_id"] for i in items if is_id(i.get("client_id"))]
+    )
+
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        if not is_id(item.get("incident_id")) or item["incident_id"] not in incidents:
+            results[index] = {"index": index, "status": 400, "error": "Incident is not valid"}
+        elif not item.get("client_id"):
+            results[index] = {"index": index, "status": 400, "error": "client_id is required"}
+        elif not is_id(item["client_id"]) or item["client_id"] not in clients:
+            results[index] = {"index": index, "status": 404, "error": "Client not found"}
+        else:
+            valid.append((index, (clients[item["client_id"]], item.get("service") or "Unknown", item["incident_id"])))
+
+    tickets = svc.ticket_manager.create_many([params for _, params in valid])
+    for (index, _), ticket in zip(valid, tickets):
+        results[index] = {"index": index, "status": 201, "ticket": ticket.to_dict()}
+
+    body = {"created": len(tickets), "failed": len(items) - len(tickets), "results": results}
+    return body, 201 if len(tickets) == len(items) else 207, None
+
+
+def _expected_version(data):
+    """(version, error): la version esperada del cuerpo, que es opcional."""
+    version = data.get("version")
+    if version is not None and not isinstance(version, int):
+        return None, error("version must be an integer", 400)
+    return version, None
+
+
+def close_ticket(svc, ticket_id, data):
+    version, failure = _expected_version(json_object(data))
+    if failure:
+        return failure
+    try:
+        ticket = svc.ticket_manager.close(ticket_id, expected_version=version)
+    except VersionConflict:
+        return error("Ticket was modified by someone else", 409)
+    except TicketArchived:
+        return error("Ticket is archived", 409)
+    if ticket:
+        return ticket.to_dict(), 200, None
+    return error("Ticket not found", 404)
+
+
+def update_ticket(svc, ticket_id, data):
+    data = json_object(data)
+
+    incident_id = data.get("incident_id")
+    if incident_id is not None and not svc.incident_manager.get(incident_id):
+        return error("Invalid incident", 400)
+
+    client = None
+    if "client_id" in data:
+        client = svc.client_manager.get(data["client_id"])
+        if not client:
+            return error("Client not found", 404)
+
+    version, failure = _expected_version(data)
+    if failure:
+        return failure
+
+    try:
+        ticket = svc.ticket_manager.update(
+            ticket_id,
+            client=client,
+            service=data.get("service"),
+            incident_id=incident_id,
+            status=data.get("status"),
+            expected_version=version
+        )
+    except VersionConflict:
+        return error("Ticket was modified by someone else", 409)
+    except TicketArchived:
+        return error("Ticket is archived", 409)
+    if not ticket:
+        return error("Ticket not found", 404)
+    return ticket.to_dict(), 200, None
+
+
+def claim_ticket(svc, data):
+    agent = json_object(data).get("agent")
+    if not isinstance(agent, str) or not agent.strip():
+        return error("agent is required", 400)
+    claimed = svc.dispatch_queue.claim(agent.strip())
+    if claimed is None:
+        return error("No open tickets to claim", 404)
+    ticket, claimed_at = claimed
+    return {
+        "ticket": ticket.to_dict(),
+        "agent": agent.strip(),
+        "claimed_at": format_timestamp(claimed_at)
+    }, 200, None
+
+
+# ------------------------------
+# Clients
+# ------------------------------
+def create_client(svc, data):
+    if not isinstance(data, dict):
+        return error("Expected a JSON object", 400)
+    missing = missing_field(data, ("name", "email", "phone_number"))
+    if missing:
+        return error(f"{missing} is required", 400)
+    client = svc.client_manager.create(
+        name=data["name"],
+        email=data["email"],
+        phone_number=data["phone_number"]
+    )
+    return client.to_dict(), 201, None
+
+
+def update_client(svc, client_id, data):
+    data = json_object(data)
+    client = svc.client_manager.update(
+        client_id,
+        name=data.get("name"),
+        email=data.get("email"),
+        phone_number=data.get("phone_number")
+    )
+    if client:
+        return client.to_dict(), 200, None
+    return error("Client not found", 404)
+
+
+# ------------------------------
+# Busqueda y estadisticas
+# ------------------------------
+def search(svc, args):
+    text, kinds, params, message = search_args(args)
+    if message:
+        return error(message, 400)
+    return paged(*svc.search_manager.search(text, kinds, **params))
+
+
+def stats_summary(svc):
+    return svc.stats_manager.summary(), 200, None
+
+
+def stats_by(svc, dimension, args):
+    if dimension not in StatsManager.DIMENSIONS:
+        return error("Unknown stats dimension", 404)
+    return svc.stats_manager.by(
+        dimension, bucket=args.get("bucket"), start=args.get("from"), end=args.get("to")
+    ), 200, None
+
+
+# ------------------------------
+# Cambios
+# ------------------------------
+def changes_page(svc, args):
+    params, message = page_args(args, since=int, entity=str)
+    if message:
+        return error(message, 400)
+    if params.get("entity") not in (None, *ChangeManager.ENTITIES):
+        return error(f"entity must be one of {', '.join(ChangeManager.ENTITIES)}", 400)
+    if svc.change_manager.expired(params.get("since", params.get("after_id"))):
+        return error(CHANGES_EXPIRED, 410)
+    return paged(*svc.change_manager.page_dicts(**params))
+
+
+def stream_start(svc, since):
+    """Valida el since (de la query string o Last-Event-ID) de un stream de cambios.
+
+    Devuelve (since, error); since None es "desde ahora": quien arma el
+    stream lo reemplaza por el ultimo seq despues de suscribirse al
+    ChangeFeed, asi no se pierde nada entre una cosa y otra.
+    """
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return None, error("Invalid value for since", 400)
+    if svc.change_manager.expired(since):
+        return None, error(CHANGES_EXPIRED, 410)
+    return since, None
+
+
+def catch_up(svc, since):
+    """Genera (seq, frame) de los eventos posteriores a ``since`` ya guardados."""
+    next_seq = since
+    while next_seq is not None:
+        frames, next_seq = svc.change_manager.frames(since, STREAM_CHUNK_SIZE)
+        for seq, frame in frames:
+            yield seq, frame
+            since = seq
+
+
+def live_chunk(frames, since):
+    """Texto SSE de una tanda del ChangeFeed y el nuevo ultimo seq enviado.
+
+    Sin eventos (paso SSE_KEEPALIVE), un comentario keepalive; los eventos
+    ya enviados durante la puesta al dia se descartan.
+    """
+    if not frames:
+        return ": keepalive\n\n", since
+    text = []
+    for seq, frame in frames:
+        if seq > since:
+            text.append(frame)
+            since = seq
+    return "".join(text), since
+
+
+# ------------------------------
+# Importacion y exportacion masiva
+# ------------------------------
+def transfer_format(fmt, default_mimetype):
+    """Formato pedido en ?format=, o el que corresponde a ``default_mimetype``; None si es invalido."""
+    if fmt is None:
+        return "csv" if default_mimetype == transfer.MIMETYPES["csv"] else "ndjson"
+    return fmt if fmt in transfer.FORMATS else None
+
+
+def export_args(entity, args, accept):
+    """(formato, error) de una exportacion; ``accept`` es el tipo preferido del cliente."""
+    if entity not in TRANSFER_COLUMNS:
+        return None, error("Unknown entity", 404)
+    fmt = transfer_format(args.get("format"), accept)
+    if fmt is None:
+        return None, error(f"format must be one of {', '.join(transfer.FORMATS)}", 400)
+    return fmt, None
+
+
+def export_headers(entity, fmt):
+    return {"Content-Disposition": f"attachment; filename={entity}.{fmt}"}
+
+
+def import_args(entity, args, mimetype):
+    """((formato, batch_size, on_conflict), error) de una importacion."""
+    if entity not in TRANSFER_COLUMNS:
+        return None, error("Unknown entity", 404)
+    fmt = transfer_format(args.get("format"), mimetype)
+    if fmt is None:
+        return None, error(f"format must be one of {', '.join(transfer.FORMATS)}", 400)
+    on_conflict = args.get("on_conflict", "error")
+    if on_conflict not in IMPORT_CONFLICTS:
+        return None, error(f"on_conflict must be one of {', '.join(IMPORT_CONFLICTS)}", 400)
+    try:
+        batch_size = int(args.get("batch_size", transfer.BATCH_SIZE))
+    except ValueError:
+        return None, error("Invalid value for batch_size", 400)
+    if not 1 <= batch_size <= transfer.MAX_BATCH_SIZE:
+        return None, error(f"batch_size must be between 1 and {transfer.MAX_BATCH_SIZE}", 400)
+    return (fmt, batch_size, on_conflict), None
+
+
+def import_entity(svc, entity, body, options):
+    """Importa ``body`` (archivo de texto) con las opciones de import_args."""
+    fmt, batch_size, on_conflict = options
+    try:
+        result = transfer.import_file(svc.db, entity, body, fmt, batch_size, on_conflict)
+    except transfer.ImportRowError as exc:
+        return {"error": str(exc), "line": exc.line, "imported": exc.imported}, 400, None
+    except transfer.ImportConflict as exc:
+        return {"error": str(exc), "line": exc.line, "imported": exc.imported}, 409, None
+    except (UnicodeDecodeError, csv.Error) as exc:
+        return error(f"Unreadable body: {exc}", 400)
+    finally:
+        # Las filas importadas no pasaron por los managers.
+        if entity in svc.cached_managers:
+            svc.cached_managers[entity].cache.clear()
+    return result, 200, None
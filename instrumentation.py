@@ -0,0 +1,281 @@
+"""Instrumentacion por pedido: tiempo por fase, consultas y metricas Prometheus.
+
+Cada pedido lleva un RequestTiming en una variable de contexto. El codigo
+que interesa medir se envuelve en ``with phase(nombre):`` y el tiempo se
+acumula en esa fase; las fases anidadas se descuentan de la que las
+contiene (el tiempo de "connect" dentro de una consulta no cuenta como
+"query"). Fuera de un pedido instrumentado ``phase`` no hace nada.
+
+Fases:
+    connect    esperar o abrir una conexion del pool
+    query      ejecutar consultas y escrituras (incluye esperar al escritor)
+    decode     parsear el JSON que manda el cliente
+    convert    pasar filas a modelos (Incident, Ticket, Client)
+    serialize  generar el JSON de la respuesta
+
+Lo que no cae en ninguna fase se informa como "app". Las respuestas en
+streaming se generan despues de cerrar el pedido y no entran en la cuenta.
+
+Metrics acumula lo observado y lo devuelve en el formato de texto de
+Prometheus (ver /metrics). Con start_profile/finish_profile se perfila un
+pedido puntual con cProfile.
+"""
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+
+PHASES = ("connect", "query", "decode", "convert", "serialize")
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SLOW_REQUEST_SECONDS = 1.0
+# Mas consultas que esto en un pedido suele ser un N+1.
+MANY_QUERIES = 20
+PROFILE_HEADER = "X-Profile"
+PROFILE_LINES = 40
+
+logger = logging.getLogger("ticketing.requests")
+
+_current = contextvars.ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    """Tiempos y consultas de un pedido."""
+
+    __slots__ = ("start", "phases", "queries", "_stack")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self._stack = []
+
+    def enter(self, name):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        name, start, nested = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self.phases[name] += elapsed - nested
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def breakdown(self, elapsed):
+        """{fase: segundos}, con el resto del pedido en "app"."""
+        phases = dict(self.phases)
+        phases["app"] = max(elapsed - sum(phases.values()), 0.0)
+        return phases
+
+    def server_timing(self, elapsed):
+        """Valor del header Server-Timing (duraciones en ms)."""
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.breakdown(elapsed).items()]
+        parts.append(f"total;dur={elapsed * 1000:.2f}")
+        return ", ".join(parts)
+
+
+class _Phase:
+    __slots__ = ("timing", "name", "queries")
+
+    def __init__(self, timing, name, queries):
+        self.timing = timing
+        self.name = name
+        self.queries = queries
+
+    def __enter__(self):
+        self.timing.queries += self.queries
+        self.timing.enter(self.name)
+
+    def __exit__(self, *exc):
+        self.timing.exit()
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(name, queries=0):
+    """Context manager que suma su duracion a la fase ``name`` del pedido actual.
+
+    ``queries`` es cuantas consultas se cuentan al entrar.
+    """
+    timing = _current.get()
+    if timing is None:
+        return _NO_PHASE
+    return _Phase(timing, name, queries)
+
+
+def begin_request():
+    """Empieza a medir un pedido en el contexto actual; devuelve (timing, token)."""
+    timing = RequestTiming()
+    return timing, _current.set(timing)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def log_request(method, route, status, elapsed, timing):
+    """Deja en el log los pedidos lentos o con demasiadas consultas."""
+    if elapsed < SLOW_REQUEST_SECONDS and timing.queries <= MANY_QUERIES:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s %s %s %.1fms queries=%d", method, route, status, elapsed * 1000, timing.queries)
+        return
+    phases = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in timing.breakdown(elapsed).items())
+    logger.warning("%s %s %s %.1fms queries=%d %s", method, route, status,
+                   elapsed * 1000, timing.queries, phases)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Metrics:
+    """Acumula las observaciones de cada pedido y las expone para Prometheus.
+
+    Las etiquetas son metodo y plantilla de ruta (no la URL), asi la
+    cantidad de series queda acotada.
+    """
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, query_buckets=QUERY_BUCKETS):
+        self.latency_buckets = latency_buckets
+        self.query_buckets = query_buckets
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._latency = {}
+        self._queries = {}
+        self._phases = {}
+
+    def observe(self, method, route, status, elapsed, timing):
+        key = (method, route)
+        with self._lock:
+            self._requests[(method, route, status)] = self._requests.get((method, route, status), 0) + 1
+            latency = self._latency.get(key)
+            if latency is None:
+                latency = self._latency[key] = _Histogram(self.latency_buckets)
+                self._queries[key] = _Histogram(self.query_buckets)
+                self._phases[key] = dict.fromkeys((*PHASES, "app"), 0.0)
+            latency.observe(elapsed)
+            self._queries[key].observe(timing.queries)
+            phases = self._phases[key]
+            for name, seconds in timing.breakdown(elapsed).items():
+                phases[name] += seconds
+
+    def render(self, gauges=()):
+        """Texto en formato de exposicion de Prometheus.
+
+        ``gauges`` son tuplas (nombre, ayuda, [(etiquetas, valor), ...]) que
+        se agregan tal cual (estado del pool, suscriptores, ...).
+        """
+        lines = []
+        with self._lock:
+            lines += ["# HELP http_requests_total Requests handled.",
+                      "# TYPE http_requests_total counter"]
+            for (method, route, status), count in sorted(self._requests.items()):
+                lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+            self._render_histograms(lines, "http_request_duration_seconds",
+                                    "Request latency in seconds.", self._latency)
+            self._render_histograms(lines, "http_request_queries",
+                                    "SQL queries per request.", self._queries)
+            lines += ["# HELP http_request_phase_seconds_total Time spent per request phase.",
+                      "# TYPE http_request_phase_seconds_total counter"]
+            for (method, route), phases in sorted(self._phases.items()):
+                for name, seconds in phases.items():
+                    lines.append(f"http_request_phase_seconds_total"
+                                 f"{_labels(method=method, route=route, phase=name)} {seconds:.6f}")
+        for name, help_text, samples in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(**labels) if labels else ''} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histograms(lines, name, help_text, histograms):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (method, route), histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(method=method, route=route, le=bound)} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(method=method, route=route, le='+Inf')} {histogram.count}")
+            lines.append(f"{name}_sum{_labels(method=method, route=route)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{_labels(method=method, route=route)} {histogram.count}")
+
+
+def db_gauges(db):
+    """Gauges del pool de conexiones y del escritor de ``db`` para Metrics.render."""
+    pool = db.pool_stats()
+    gauges = [
+        ("db_pool_connections", "Connections in the pool by state.",
+         [({"state": state}, pool[state]) for state in ("size", "open", "idle", "in_use")]),
+    ]
+    events = [event for event in ("created", "acquired", "reused", "waits", "timeouts") if event in pool]
+    if events:
+        gauges.append(("db_pool_events", "Pool events since start.",
+                       [({"event": event}, pool[event]) for event in events]))
+    writes = db.write_stats()
+    if writes:
+        gauges.append(("db_writer", "Group commit writer counters.",
+                       [({"stat": name}, value) for name, value in writes.items()]))
+    return gauges
+
+
+# ------------------------------
+# Perfilado de un pedido puntual
+# ------------------------------
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def finish_profile(profiler, profile_dir, method, path):
+    """Detiene el perfil y lo guarda en ``profile_dir`` (para pstats o snakeviz).
+
+    Devuelve (nombre del archivo, reporte de texto con las funciones de
+    mayor tiempo acumulado).
+    """
+    profiler.disable()
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-") or "root"
+    filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.perf_counter_ns() % 10 ** 6:06d}-{method}-{slug}.prof"
+    os.makedirs(profile_dir, exist_ok=True)
+    profiler.dump_stats(os.path.join(profile_dir, filename))
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return filename, report.getvalue()
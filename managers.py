@@ -1,23 +1,207 @@
 from models import Incident, Ticket, Client
-from datetime import datetime
+from instrumentation import phase
+from timestamps import now, format_timestamp, parse_timestamp
+from collections import OrderedDict
+from queue import Queue, Empty, Full
+import asyncio
+import heapq
 import json
-import dataclasses
+import threading
+import time
+import zlib
 
-class IncidentManager:
-    def __init__(self, db):
+
+class LRUCache:
+    """Cache LRU acotado, con vencimiento opcional de entradas.
+
+    Guarda filas (dicts) y no modelos, para que quien recibe el modelo pueda
+    modificarlo sin alterar lo cacheado. ``maxsize=0`` desactiva la cache y
+    ``ttl`` es la vida de cada entrada en segundos (None: no vence).
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+
+class CachedLookupMixin:
+    """Lectura por id a traves de un LRUCache, para managers de filas que cambian poco."""
+
+    def _cached_get(self, key, load):
+        row = self.cache.get(key)
+        if row is None:
+            row = load(key)
+            if row is not None:
+                self.cache.set(key, row)
+        return row
+
+    def _cached_get_many(self, keys, load_many):
+        rows, missing = {}, []
+        for key in set(keys):
+            row = self.cache.get(key)
+            if row is None:
+                missing.append(key)
+            else:
+                rows[key] = row
+        for row in load_many(missing) if missing else ():
+            self.cache.set(row["id"], row)
+            rows[row["id"]] = row
+        return rows
+
+    def cache_stats(self):
+        return self.cache.stats()
+
+
+class CacheSync:
+    """Invalida las caches de lectura con lo que escribieron otros procesos.
+
+    Con varios procesos sobre la misma base, cada uno tiene sus LRUCache y
+    solo se entera de sus propias escrituras. sync() lee los contadores de
+    table_changes de las tablas cacheadas (una lectura por clave primaria)
+    y, si alguno avanzo desde la ultima vez, vacia la cache de esa tabla.
+    Llamado al empezar cada pedido, lo confirmado por otro proceso antes
+    del pedido ya no sale de la cache.
+
+    Los contadores avanzan con cualquier escritura, tambien las de este
+    proceso: incidents y clients cambian poco, y vaciar la cache es mas
+    barato que recorrer el changelog (donde estan ademas los eventos de
+    tickets) para saber que filas cambiaron.
+    """
+
+    def __init__(self, db, managers):
+        """``managers`` es {tabla de table_changes: manager con ``cache``}."""
+        self.db = db
+        self.managers = managers
+        self._counters = self._read_counters()
+        self._lock = threading.Lock()
+
+    def _read_counters(self):
+        return {table: counter for table, (counter, _) in self.db.get_table_stamps(list(self.managers)).items()}
+
+    def sync(self):
+        # La lectura corre sin lock; un hilo que leyo antes que otro trae
+        # contadores mas viejos y no hace nada.
+        counters = self._read_counters()
+        with self._lock:
+            for table, counter in counters.items():
+                if counter > self._counters.get(table, -1):
+                    self.managers[table].cache.clear()
+                    self._counters[table] = counter
+
+
+class ChangeStampMixin:
+    """ETag y Last-Modified a partir de las marcas de cambio, sin leer las filas.
+
+    ``STAMP_TABLES`` son las tablas de las que depende un listado: si sus
+    contadores en table_changes no cambiaron, ningun listado cambio.
+    """
+
+    STAMP_TABLES = ()
+
+    def list_stamp(self, key):
+        """(etag, last_modified) de un listado; ``key`` distingue filtros y formato."""
+        stamps = self.db.get_table_stamps(self.STAMP_TABLES)
+        counters = "-".join(f"{stamps[t][0]}.{stamps[t][1]}" for t in self.STAMP_TABLES)
+        etag = f"{self.STAMP_TABLES[0]}-{counters}-{zlib.crc32(key.encode()):08x}"
+        return etag, max(updated_at for _, updated_at in stamps.values())
+
+
+class IncidentManager(CachedLookupMixin, ChangeStampMixin):
+    STAMP_TABLES = ("incidents",)
+
+    def __init__(self, db, cache_size=1024, cache_ttl=None):
         self.db = db
+        self.cache = LRUCache(cache_size, cache_ttl)
 
     def show(self):
         return [Incident(**i) for i in self.db.get_all_incidents()]
 
+    def page(self, **params):
+        rows, next_cursor = self.db.get_incidents_page(**params)
+        return [Incident(**i) for i in rows], next_cursor
+
+    def stream(self, **params):
+        return (Incident(**i) for i in self.db.iter_incidents(**params))
+
+    # Camino rapido para listados: las filas ya tienen la forma JSON.
+    def page_dicts(self, **params):
+        return self.db.get_incidents_page(**params)
+
+    def stream_dicts(self, **params):
+        return self.db.iter_incidents(**params)
+
     def create(self, description, incident_type):
         incident_dict = {"id": None, "description": description, "incident_type": incident_type}
         saved = self.db.save_incident(incident_dict)
-        return Incident(**saved)
+        self.cache.set(saved["id"], dict(saved))
+        with phase("convert"):
+            return Incident(**saved)
 
     def get(self, incident_id):
-        row = self.db.get_incident(incident_id)
-        return Incident(**row) if row else None
+        row = self._cached_get(incident_id, self.db.get_incident)
+        with phase("convert"):
+            return Incident(**row) if row else None
+
+    def get_many(self, incident_ids):
+        """Devuelve {id: Incident} para los ids que existen."""
+        rows = self._cached_get_many(incident_ids, self.db.get_incidents_by_ids)
+        with phase("convert"):
+            return {incident_id: Incident(**row) for incident_id, row in rows.items()}
+
+    def stamp(self, incident_id):
+        """(etag, last_modified) del incident, o None si no existe."""
+        stamp = self.db.get_row_stamp("incidents", incident_id)
+        if stamp is None:
+            return None
+        version, updated_at = stamp
+        return f"incident-{incident_id}-{version}", updated_at
 
     def update(self, incident_id, description=None, incident_type=None):
         incident = self.get(incident_id)
@@ -27,96 +211,390 @@ class IncidentManager:
             incident.description = description
         if incident_type is not None:
             incident.incident_type = incident_type
-        saved = self.db.save_incident(vars(incident))
-        return Incident(**saved)
+        saved = self.db.save_incident(incident.to_dict())
+        self.cache.invalidate(incident_id)
+        with phase("convert"):
+            return Incident(**saved)
+
+    def delete(self, incident_id):
+        self.db.delete_incident(incident_id)
+        self.cache.invalidate(incident_id)
 
 
-class TicketManager:
+class TicketManager(ChangeStampMixin):
+    STAMP_TABLES = ("tickets", "clients")
+
     def __init__(self, db):
         self.db = db
 
+    @staticmethod
+    def _from_row(row):
+        """Arma el Ticket a partir de una fila de TICKET_SELECT (ticket + cliente)."""
+        client = Client(
+            id=row.pop("client_id"),
+            name=row.pop("client_name"),
+            email=row.pop("client_email"),
+            phone_number=row.pop("client_phone_number")
+        )
+        return Ticket(client=client if client.name is not None else None, **row)
+
+    @staticmethod
+    def _json_from_row(row):
+        """Arma la forma JSON de Ticket a partir de una fila de TICKET_SELECT."""
+        if row["client_name"] is None:
+            client = None
+        else:
+            client = {
+                "id": row["client_id"],
+                "name": row["client_name"],
+                "email": row["client_email"],
+                "phone_number": row["client_phone_number"]
+            }
+        return {
+            "id": row["id"],
+            "client": client,
+            "service": row["service"],
+            "incident_id": row["incident_id"],
+            "status": row["status"],
+            "creation_date": row["creation_date"],
+            "closing_date": row["closing_date"],
+            "version": row["version"]
+        }
+
     def show(self):
-        tickets = self.db.get_all_tickets()
-        result = []
-        for t in tickets:
-            t["client"] = Client(**json.loads(t["client"]))
-            result.append(Ticket(**t))
-        return result
+        return [self._from_row(t) for t in self.db.get_all_tickets()]
+
+    def page(self, **params):
+        rows, next_cursor = self.db.get_tickets_page(**params)
+        return [self._from_row(t) for t in rows], next_cursor
+
+    def stream(self, **params):
+        return (self._from_row(t) for t in self.db.iter_tickets(**params))
+
+    # Camino rapido para listados: de la fila al dict JSON sin pasar por Ticket.
+    def page_dicts(self, **params):
+        rows, next_cursor = self.db.get_tickets_page(**params)
+        with phase("convert"):
+            return [self._json_from_row(t) for t in rows], next_cursor
+
+    def stream_dicts(self, **params):
+        return (self._json_from_row(t) for t in self.db.iter_tickets(**params))
+
+    @staticmethod
+    def _new_ticket(saved, client):
+        return Ticket(
+            id=saved["id"],
+            client=client,
+            service=saved["service"],
+            incident_id=saved["incident_id"],
+            creation_date=format_timestamp(saved["created_at"]),
+            status=saved["status"]
+        )
 
     def create(self, client, service, incident_id):
-        date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         ticket_dict = {
             "id": None,
-            "client": json.dumps(dataclasses.asdict(client)),
+            "client_id": client.id,
             "service": service,
             "incident_id": incident_id,
             "status": "Open",
-            "creation_date": date,
-            "closing_date": None
+            "created_at": now(),
+            "closed_at": None
         }
-        saved = self.db.save_ticket(ticket_dict) 
-        saved["client"] = Client(**json.loads(saved["client"]))
-        return Ticket(**saved)
+        saved = self.db.save_ticket(ticket_dict)
+        with phase("convert"):
+            return self._new_ticket(saved, client)
+
+    def create_many(self, items):
+        """Crea varios tickets en una sola transaccion.
+
+        ``items`` es una lista de tuplas (client, service, incident_id).
+        """
+        created_at = now()
+        ticket_dicts = [
+            {
+                "id": None,
+                "client_id": client.id,
+                "service": service,
+                "incident_id": incident_id,
+                "status": "Open",
+                "created_at": created_at,
+                "closed_at": None
+            }
+            for client, service, incident_id in items
+        ]
+        saved = self.db.save_tickets_many(ticket_dicts)
+        with phase("convert"):
+            return [self._new_ticket(ticket_dict, client) for (client, _, _), ticket_dict in zip(items, saved)]
 
     def get(self, ticket_id):
         row = self.db.get_ticket(ticket_id)
         if not row:
             return None
-        row["client"] = Client(**json.loads(row["client"]))
-        return Ticket(**row)
+        with phase("convert"):
+            return self._from_row(row)
 
-    def close(self, ticket_id):
-        ticket = self.get(ticket_id)
-        if not ticket:
+    def stamp(self, ticket_id):
+        """(etag, last_modified) del ticket, o None si no existe."""
+        stamp = self.db.get_ticket_stamp(ticket_id)
+        if stamp is None:
             return None
-        ticket.status = "Closed"
-        ticket.closing_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        version, updated_at = stamp
+        return f"ticket-{ticket_id}-{version}", updated_at
 
-        ticket_dict = vars(ticket).copy()
-        ticket_dict["client"] = json.dumps(dataclasses.asdict(ticket.client))
-        saved = self.db.save_ticket(ticket_dict)
-        saved["client"] = Client(**json.loads(saved["client"]))
+    def close(self, ticket_id, expected_version=None):
+        """Cierra el ticket con un solo UPDATE ... RETURNING.
 
-        return Ticket(**saved)
+        Con ``expected_version`` lanza database.VersionConflict si el ticket
+        fue modificado por otro desde esa version; si el ticket esta
+        archivado, database.TicketArchived.
+        """
+        row = self.db.close_ticket(ticket_id, now(), expected_version)
+        with phase("convert"):
+            return self._from_row(row) if row else None
 
-    def update(self, ticket_id, client=None, service=None, incident_id=None, status=None):
-        ticket = self.get(ticket_id)
-        if not ticket:
-            return None
+    def update(self, ticket_id, client=None, service=None, incident_id=None, status=None,
+               expected_version=None):
+        changes = {}
         if client is not None:
-            ticket.client = client
+            changes["client_id"] = client.id
         if service is not None:
-            ticket.service = service
+            changes["service"] = service
         if incident_id is not None:
-            ticket.incident_id = incident_id
+            changes["incident_id"] = incident_id
         if status is not None:
-            ticket.status = status
-            if status == "Closed" and ticket.closing_date is None:
-                ticket.closing_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            elif status == "Open":
-                ticket.closing_date = None
-
-        ticket_dict = vars(ticket).copy()
-        ticket_dict["client"] = json.dumps(dataclasses.asdict(ticket.client))
-        saved = self.db.save_ticket(ticket_dict)
-        saved["client"] = Client(**json.loads(saved["client"]))
-        return Ticket(**saved)
+            changes["status"] = status
 
-class ClientManager:
-    def __init__(self, db):
+        row = self.db.update_ticket(
+            ticket_id, changes,
+            closed_at=now(),
+            expected_version=expected_version
+        )
+        with phase("convert"):
+            return self._from_row(row) if row else None
+
+
+class DispatchQueue:
+    """Cola de despacho: los tickets abiertos que nadie tomo, en el orden en que se asignan.
+
+    Un heap en memoria de (prioridad, created_at, id): primero la prioridad
+    del tipo de incident (``priorities``), despues el ticket mas viejo. Se arma
+    desde la base con el primer uso y se pone al dia leyendo el changelog
+    (tickets creados, cerrados, reabiertos o movidos de incident, incidents
+    que cambian de tipo), asi ve tambien lo que escriben otros procesos.
+    Las entradas que dejan de valer no se buscan en el heap: se descartan
+    al llegar arriba, y el heap se rearma si acumula demasiadas.
+
+    Quien se queda con un ticket lo decide la base: claim() saca el primero
+    del heap en O(log n) y lo confirma en ticket_claims, cuya clave primaria
+    no admite dos agentes para el mismo ticket. Si otro proceso lo tomo
+    antes, sigue con el proximo. Los tomados no pasan por el changelog: al
+    aplicar eventos de tickets abiertos se consulta ticket_claims, asi editar
+    un ticket ya asignado no lo devuelve a la cola.
+
+    ``priorities`` son los tipos de incident en orden de atencion (por
+    defecto, PRIORITIES); los demas tipos van al final.
+    """
+
+    PRIORITIES = ("Security", "Network", "Hardware", "Software", "Billing")
+
+    def __init__(self, db, priorities=None, batch=1000):
+        self.db = db
+        self.batch = batch
+        priorities = self.PRIORITIES if priorities is None else priorities
+        self.priorities = {incident_type: rank for rank, incident_type in enumerate(priorities)}
+        self.default_priority = len(self.priorities)
+        self._heap = []
+        self._queued = {}          # id -> (clave vigente en el heap, incident_id)
+        self._by_incident = {}     # incident_id -> ids en cola
+        self._incident_types = {}
+        self._seq = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def size(self, sync=True):
+        """Tickets en cola.
+
+        Con ``sync=False`` no toca la base: devuelve lo visto en la ultima
+        lectura del changelog, o None si la cola todavia no se cargo.
+        """
+        if sync:
+            self.sync()
+        elif self._seq is None:
+            return None
+        with self._lock:
+            return len(self._queued)
+
+    def claim(self, agent):
+        """Asigna a ``agent`` el primer ticket de la cola.
+
+        Devuelve (Ticket, claimed_at en epoch), o None si no queda ninguno.
+        """
+        self.sync()
+        while True:
+            with self._lock:
+                entry = self._pop()
+            if entry is None:
+                return None
+            claimed_at = now()
+            try:
+                row = self.db.claim_ticket(entry[0][2], agent, claimed_at)
+            except Exception:
+                with self._lock:
+                    self._push(entry[0][2], entry[1], entry[0][1])
+                raise
+            if row is not None:
+                with phase("convert"):
+                    return TicketManager._from_row(row), claimed_at
+
+    def sync(self):
+        """Aplica los eventos del changelog posteriores a lo ya leido.
+
+        Si otro hilo ya esta leyendo, no espera (salvo la primera vez, que
+        hay que cargar la cola).
+        """
+        if not self._sync_lock.acquire(blocking=self._seq is None):
+            return
+        try:
+            if self._seq is None:
+                self._load()
+            while True:
+                rows, next_seq = self.db.get_changes_page(after_seq=self._seq, limit=self.batch)
+                if rows and rows[0]["seq"] > self._seq + 1:
+                    # prune_changelog borro eventos que no se vieron: se recarga la cola.
+                    self._load()
+                    continue
+                claimed = self._claimed(rows)
+                with self._lock:
+                    for row in rows:
+                        self._apply(row, claimed)
+                if rows:
+                    self._seq = rows[-1]["seq"]
+                if next_seq is None:
+                    return
+        finally:
+            self._sync_lock.release()
+
+    def _load(self):
+        # El seq va primero: lo que cambie mientras se carga se vuelve a
+        # aplicar desde el changelog, y aplicar un evento dos veces no cambia nada.
+        seq = self.db.get_last_change_seq()
+        types = {row["id"]: row["incident_type"] for row in self.db.get_all_incidents()}
+        with self._lock:
+            self._heap, self._queued, self._by_incident = [], {}, {}
+            self._incident_types = types
+            for row in self.db.iter_dispatch_candidates():
+                self._push(row["id"], row["incident_id"], row["created_at"])
+        self._seq = seq
+
+    def _claimed(self, rows):
+        """De los tickets abiertos en ``rows``, los que ya estan tomados."""
+        open_ids = [row["entity_id"] for row in rows
+                    if row["entity"] == "ticket" and row["data"] is not None
+                    and json.loads(row["data"])["status"] == "Open"]
+        return self.db.get_claimed_ticket_ids(open_ids) if open_ids else set()
+
+    def _apply(self, row, claimed):
+        data = json.loads(row["data"]) if row["data"] is not None else None
+        if row["entity"] == "ticket":
+            if data is None or data["status"] != "Open" or row["entity_id"] in claimed:
+                self._remove(row["entity_id"])
+            else:
+                self._push(data["id"], data["incident_id"], parse_timestamp(data["creation_date"]))
+        elif row["entity"] == "incident":
+            incident_type = data["incident_type"] if data is not None else None
+            if self._incident_types.get(row["entity_id"]) != incident_type:
+                self._incident_types[row["entity_id"]] = incident_type
+                for ticket_id in list(self._by_incident.get(row["entity_id"], ())):
+                    key, incident_id = self._queued[ticket_id]
+                    self._push(ticket_id, incident_id, key[1])
+
+    # Lo que sigue corre con self._lock tomado.
+    def _push(self, ticket_id, incident_id, created_at):
+        priority = self.priorities.get(self._incident_types.get(incident_id), self.default_priority)
+        key = (priority, created_at, ticket_id)
+        current = self._queued.get(ticket_id)
+        if current is not None:
+            if current == (key, incident_id):
+                return
+            self._remove(ticket_id)
+        self._queued[ticket_id] = (key, incident_id)
+        self._by_incident.setdefault(incident_id, set()).add(ticket_id)
+        heapq.heappush(self._heap, key)
+
+    def _remove(self, ticket_id):
+        current = self._queued.pop(ticket_id, None)
+        if current is None:
+            return None
+        tickets = self._by_incident[current[1]]
+        tickets.discard(ticket_id)
+        if not tickets:
+            del self._by_incident[current[1]]
+        if len(self._heap) > 2 * len(self._queued) + 64:
+            self._heap = [key for key, _ in self._queued.values()]
+            heapq.heapify(self._heap)
+        return current
+
+    def _pop(self):
+        """Saca el primer ticket vigente; devuelve (clave, incident_id) o None."""
+        while self._heap:
+            key = heapq.heappop(self._heap)
+            current = self._queued.get(key[2])
+            if current is not None and current[0] == key:
+                self._remove(key[2])
+                return current
+        return None
+
+
+class ClientManager(CachedLookupMixin, ChangeStampMixin):
+    STAMP_TABLES = ("clients",)
+
+    def __init__(self, db, cache_size=1024, cache_ttl=None):
         self.db = db
+        self.cache = LRUCache(cache_size, cache_ttl)
     
     def show(self):
         return [Client(**c) for c in self.db.get_all_clients()]
+
+    def page(self, **params):
+        rows, next_cursor = self.db.get_clients_page(**params)
+        return [Client(**c) for c in rows], next_cursor
+
+    def stream(self, **params):
+        return (Client(**c) for c in self.db.iter_clients(**params))
+
+    # Camino rapido para listados: las filas ya tienen la forma JSON.
+    def page_dicts(self, **params):
+        return self.db.get_clients_page(**params)
+
+    def stream_dicts(self, **params):
+        return self.db.iter_clients(**params)
     
     def get(self, client_id):
-        row = self.db.get_client(client_id)
-        return Client(**row) if row else None
+        row = self._cached_get(client_id, self.db.get_client)
+        with phase("convert"):
+            return Client(**row) if row else None
+
+    def get_many(self, client_ids):
+        """Devuelve {id: Client} para los ids que existen."""
+        rows = self._cached_get_many(client_ids, self.db.get_clients_by_ids)
+        with phase("convert"):
+            return {client_id: Client(**row) for client_id, row in rows.items()}
     
     def create(self, name, email, phone_number):
         client_dict = {"id": None, "name": name, "email": email, "phone_number": phone_number}
         saved = self.db.save_client(client_dict)
-        return Client(**saved)
+        self.cache.set(saved["id"], dict(saved))
+        with phase("convert"):
+            return Client(**saved)
+
+    def stamp(self, client_id):
+        """(etag, last_modified) del cliente, o None si no existe."""
+        stamp = self.db.get_row_stamp("clients", client_id)
+        if stamp is None:
+            return None
+        version, updated_at = stamp
+        return f"client-{client_id}-{version}", updated_at
 
     def update(self, client_id, name=None, email=None, phone_number=None):
         client = self.get(client_id)
@@ -128,6 +606,264 @@ class ClientManager:
             client.email = email
         if phone_number is not None:
             client.phone_number = phone_number
-        saved = self.db.save_client(vars(client))
-        return Client(**saved)
+        saved = self.db.save_client(client.to_dict())
+        self.cache.invalidate(client_id)
+        with phase("convert"):
+            return Client(**saved)
+
+    def delete(self, client_id):
+        self.db.delete_client(client_id)
+        self.cache.invalidate(client_id)
+
+
+class SearchManager:
+    """Busqueda de texto completo sobre incidents y tickets (ver DatabaseHandler.search)."""
+
+    KINDS = ("incident", "ticket")
+
+    def __init__(self, db):
+        self.db = db
+
+    def search(self, text, kinds=None, **params):
+        """Devuelve (resultados, next_offset); los resultados ya tienen forma JSON."""
+        return self.db.search(text, kinds=kinds, **params)
+
+
+class StatsManager:
+    """Estadisticas de tickets leidas de ticket_stats (una fila por grupo)."""
+
+    DIMENSIONS = ("service", "incident_type", "day")
+
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    def _from_row(row):
+        timed = row["timed_count"]
+        return {
+            "bucket": row["bucket"],
+            "open": row["open_count"],
+            "closed": row["closed_count"],
+            "total": row["open_count"] + row["closed_count"],
+            "mean_time_to_close": row["close_seconds"] / timed if timed else None
+        }
+
+    def summary(self):
+        rows = self.db.get_ticket_stats("all")
+        if rows:
+            return self._from_row(rows[0])
+        return {"bucket": "all", "open": 0, "closed": 0, "total": 0, "mean_time_to_close": None}
+
+    def by(self, dimension, bucket=None, start=None, end=None):
+        rows = self.db.get_ticket_stats(dimension, bucket=bucket, start=start, end=end)
+        with phase("convert"):
+            return [self._from_row(row) for row in rows]
+
+
+class ChangeManager:
+    """Lectura del changelog para ponerse al dia (GET /api/changes)."""
+
+    ENTITIES = ("incident", "ticket", "client")
+
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    def _from_row(row):
+        return {
+            "seq": row["seq"],
+            "entity": row["entity"],
+            "id": row["entity_id"],
+            "op": row["op"],
+            "changed_at": row["changed_at"],
+            "data": json.loads(row["data"]) if row["data"] is not None else None
+        }
+
+    def page_dicts(self, since=None, after_id=None, **params):
+        """Eventos con seq > ``since`` (``after_id`` es sinonimo, como en los otros listados)."""
+        rows, next_seq = self.db.get_changes_page(
+            after_seq=since if since is not None else after_id, **params
+        )
+        with phase("convert"):
+            return [self._from_row(row) for row in rows], next_seq
+
+    def last_seq(self):
+        return self.db.get_last_change_seq()
+
+    def expired(self, since):
+        """True si los eventos posteriores a ``since`` ya no estan todos (prune_changelog)."""
+        return since is not None and since < self.db.get_first_change_seq() - 1
+
+    @classmethod
+    def sse_frame(cls, row):
+        """Evento de Server-Sent Events; el id es seq, para reanudar con Last-Event-ID."""
+        event = cls._from_row(row)
+        return f"id: {event['seq']}\nevent: {event['entity']}\ndata: {json.dumps(event)}\n\n"
+
+    def frames(self, since, limit):
+        """Eventos posteriores a ``since`` como (seq, frame); devuelve (frames, next_seq)."""
+        rows, next_seq = self.db.get_changes_page(after_seq=since, limit=limit)
+        return [(row["seq"], self.sse_frame(row)) for row in rows], next_seq
+
+
+class ChangeFeed:
+    """Reparte los eventos nuevos del changelog a todos los suscriptores.
+
+    Un solo hilo lee el changelog (una consulta por tanda de cambios, no una
+    por suscriptor) y arma cada evento SSE una sola vez; los suscriptores
+    reciben listas de (seq, frame). Se despierta con cada escritura de este
+    proceso y, para ver las de otros procesos, cada ``poll_interval``
+    segundos. Un suscriptor que acumula ``queue_size`` tandas sin leer se
+    descarta: debe reconectarse y ponerse al dia desde su ultimo seq.
+    """
+
+    def __init__(self, db, poll_interval=1.0, queue_size=256, batch=500):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.batch = batch
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        db.add_write_listener(self._wake.set)
+
+    def subscribe(self, loop=None):
+        """Devuelve una Subscription; con ``loop``, una que se lee con await desde ese event loop.
+
+        Recibe todo evento posterior al alta; lo anterior se lee con
+        ChangeManager.frames (puede solaparse: descartar seq ya vistos).
+        """
+        subscription = AsyncSubscription(self, loop) if loop is not None else Subscription(self)
+        with self._lock:
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, args=(self.db.get_last_change_seq(),),
+                    name="change-feed", daemon=True
+                )
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def _run(self, last_seq):
+        while not self._closed:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                last_seq = self._publish(last_seq)
+            except Exception:
+                # Sin poder leer el changelog no se sabe que se perdio: se
+                # cortan las suscripciones y cada cliente se pone al dia al
+                # reconectarse.
+                with self._lock:
+                    for subscription in self._subscribers:
+                        subscription.dropped = True
+                    self._subscribers.clear()
+
+    def _publish(self, last_seq):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            if not subscribers:
+                # Nadie escucha: no hace falta leer lo nuevo, solo no repetirlo
+                # despues. Bajo el lock, para no saltear eventos de un
+                # suscriptor que se esta dando de alta.
+                return self.db.get_last_change_seq()
+        while True:
+            rows, next_seq = self.db.get_changes_page(after_seq=last_seq, limit=self.batch)
+            if not rows:
+                return last_seq
+            frames = [(row["seq"], ChangeManager.sse_frame(row)) for row in rows]
+            last_seq = rows[-1]["seq"]
+            for subscription in subscribers:
+                if not subscription._deliver(frames):
+                    self.unsubscribe(subscription)
+            if next_seq is None:
+                return last_seq
+
+    def close(self):
+        """Detiene el hilo y corta las suscripciones abiertas.
+
+        Cada suscriptor recibe una tanda vacia para que deje de esperar; el
+        cliente se reconecta (a otro proceso, si este se esta apagando) y
+        se pone al dia desde su ultimo seq.
+        """
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for subscription in subscribers:
+            subscription.dropped = True
+            try:
+                subscription._deliver([])
+            except RuntimeError:
+                # El event loop de una AsyncSubscription ya se cerro.
+                pass
+
+
+class Subscription:
+    """Suscripcion de un hilo (WSGI) al ChangeFeed."""
+
+    def __init__(self, feed):
+        self.feed = feed
+        self.dropped = False
+        self._queue = Queue(maxsize=feed.queue_size)
+
+    def _deliver(self, frames):
+        try:
+            self._queue.put_nowait(frames)
+            return True
+        except Full:
+            self.dropped = True
+            return False
+
+    def get(self, timeout):
+        """Proxima tanda de (seq, frame), o [] si pasaron ``timeout`` segundos sin cambios."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except Empty:
+            return []
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+
+class AsyncSubscription(Subscription):
+    """Suscripcion leida desde un event loop (ASGI): entrega con call_soon_threadsafe."""
+
+    def __init__(self, feed, loop):
+        self.feed = feed
+        self.dropped = False
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=feed.queue_size)
+
+    def _deliver(self, frames):
+        if self._queue.full():
+            self.dropped = True
+            return False
+        self._loop.call_soon_threadsafe(self._put, frames)
+        return True
+
+    def _put(self, frames):
+        try:
+            self._queue.put_nowait(frames)
+        except asyncio.QueueFull:
+            self.dropped = True
 
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return []
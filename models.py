@@ -2,26 +2,57 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional
 
-@dataclass
+# slots=True: sin __dict__ por instancia, menos memoria y acceso mas rapido.
+# to_dict() arma la forma JSON directamente, sin la copia profunda de asdict().
+
+@dataclass(slots=True)
 class Client:
     id: int
     name: str
     email: str
     phone_number: str
 
-@dataclass
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "email": self.email,
+            "phone_number": self.phone_number
+        }
+
+@dataclass(slots=True)
 class Incident:
     id: int
     description: str
     incident_type: str
 
-@dataclass
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "description": self.description,
+            "incident_type": self.incident_type
+        }
+
+@dataclass(slots=True)
 class Ticket:
     id: int
     client: Client      
     service: str      # hardcodeado
     incident_id: int
-    status: str = "Open"
     creation_date: str 
+    status: str = "Open"
     closing_date: Optional[str] = None
+    version: int = 0
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "client": self.client.to_dict() if self.client is not None else None,
+            "service": self.service,
+            "incident_id": self.incident_id,
+            "status": self.status,
+            "creation_date": self.creation_date,
+            "closing_date": self.closing_date,
+            "version": self.version
+        }
 
@@ -0,0 +1,57 @@
+"""Borra del changelog los eventos mas viejos que la retencion.
+
+Cada escritura agrega un evento, asi que sin esto la tabla crece sin
+limite (tambien con los archivados y las importaciones masivas). Los
+clientes de GET /api/changes y del stream que vuelven con un since
+anterior a lo que queda reciben 410 y tienen que volver a leer todo.
+El borrado va en tandas cortas para no frenar a los escritores.
+
+Pensado para correr periodicamente (cron o similar), como archive_tickets.py.
+
+Uso:
+    python prune_changelog.py [--db db.sqlite] [--older-than 7d] [--chunk-size 5000] [--pause 0.05]
+"""
+import argparse
+import sys
+import time
+
+from database import CHANGELOG_PRUNE_CHUNK_SIZE, DB_NAME
+from repository import BACKENDS, create_repository
+from timestamps import now, parse_duration
+
+DEFAULT_AGE = "7d"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Borra los eventos viejos del changelog")
+    parser.add_argument("--db", default=DB_NAME, help="archivo SQLite")
+    parser.add_argument("--backend", choices=list(BACKENDS), help="backend de base (por defecto, TICKETS_DB_BACKEND)")
+    parser.add_argument("--older-than", default=DEFAULT_AGE,
+                        help="antiguedad minima de los eventos a borrar: segundos o 30d, 12h, ...")
+    parser.add_argument("--chunk-size", type=int, default=CHANGELOG_PRUNE_CHUNK_SIZE,
+                        help="eventos por transaccion")
+    parser.add_argument("--pause", type=float, default=0.0, help="segundos de espera entre tandas")
+    args = parser.parse_args(argv)
+    try:
+        age = parse_duration(args.older_than)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    db = create_repository(args.backend, db_name=args.db)
+    try:
+        start = time.perf_counter()
+        pruned = db.prune_changelog(now() - age, args.chunk_size, args.pause)
+        seconds = time.perf_counter() - start
+        first, last = db.get_first_change_seq(), db.get_last_change_seq()
+    finally:
+        db.close()
+
+    print(f"pruned {pruned} event(s) in {seconds:.1f}s")
+    print(f"changelog keeps seq {first}..{last}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""Auditoria de planes de consulta del DatabaseHandler.
+
+Ejecuta cada metodo del handler con parametros de ejemplo, captura el SQL
+que emite (sin tocar los datos) y corre EXPLAIN QUERY PLAN sobre cada
+consulta. Marca las consultas que recorren una tabla completa sin usar
+indice y las paginas que ordenan en un B-tree temporal (ordenan todas las
+coincidencias para devolver una pagina; en el resto de las consultas es
+solo un aviso). Devuelve codigo de salida 1 si encuentra alguno de los dos.
+
+Uso:
+    python query_audit.py [--db db.sqlite]
+"""
+import argparse
+import sys
+
+from database import DatabaseHandler, DB_NAME
+
+# (nombre, llamada) para cada consulta que emite el handler.
+AUDITED_CALLS = [
+    ("get_all_incidents", lambda db: db.get_all_incidents()),
+    ("get_incident", lambda db: db.get_incident(1)),
+    ("get_incidents_by_ids", lambda db: db.get_incidents_by_ids([1, 2, 3])),
+    ("get_incidents_page", lambda db: db.get_incidents_page(after_id=1)),
+    ("get_incidents_page incident_type", lambda db: db.get_incidents_page(incident_type="Software")),
+    ("save_incident insert", lambda db: db.save_incident({"id": None, "description": "d", "incident_type": "t"})),
+    ("save_incident update", lambda db: db.save_incident({"id": 1, "description": "d", "incident_type": "t"})),
+    ("delete_incident", lambda db: db.delete_incident(1)),
+    ("get_all_tickets", lambda db: db.get_all_tickets()),
+    ("get_ticket", lambda db: db.get_ticket(1)),
+    ("get_tickets_page", lambda db: db.get_tickets_page(after_id=1)),
+    ("get_tickets_page status", lambda db: db.get_tickets_page(status="Open")),
+    ("get_tickets_page service", lambda db: db.get_tickets_page(service="Email")),
+    ("get_tickets_page incident_id", lambda db: db.get_tickets_page(incident_id=1)),
+    ("get_tickets_page incident_id+status", lambda db: db.get_tickets_page(incident_id=1, status="Open")),
+    ("get_tickets_page created range", lambda db: db.get_tickets_page(
+        created_after=1704067200, created_before=1706745600)),
+    ("get_tickets_page closed_within", lambda db: db.get_tickets_page(closed_within=86400)),
+    ("save_ticket insert", lambda db: db.save_ticket({
+        "id": None, "client_id": 1, "service": "s", "incident_id": 1,
+        "status": "Open", "created_at": 1704067200, "closed_at": None})),
+    ("save_ticket update", lambda db: db.save_ticket({
+        "id": 1, "client_id": 1, "service": "s", "incident_id": 1,
+        "status": "Open", "created_at": 1704067200, "closed_at": None})),
+    ("save_tickets_many", lambda db: db.save_tickets_many([{
+        "id": None, "client_id": 1, "service": "s", "incident_id": 1,
+        "status": "Open", "created_at": 1704067200, "closed_at": None}])),
+    ("update_ticket", lambda db: db.update_ticket(1, {"service": "s", "status": "Closed"}, 1704067200, 1)),
+    ("close_ticket", lambda db: db.close_ticket(1, 1704067200, 1)),
+    ("delete_ticket", lambda db: db.delete_ticket(1)),
+    ("get_all_clients", lambda db: db.get_all_clients()),
+    ("get_client", lambda db: db.get_client(1)),
+    ("get_clients_by_ids", lambda db: db.get_clients_by_ids([1, 2, 3])),
+    ("get_clients_page", lambda db: db.get_clients_page(after_id=1)),
+    ("get_clients_page email", lambda db: db.get_clients_page(email="a@example.com")),
+    ("save_client insert", lambda db: db.save_client({"id": None, "name": "n", "email": "e", "phone_number": "p"})),
+    ("save_client update", lambda db: db.save_client({"id": 1, "name": "n", "email": "e", "phone_number": "p"})),
+    ("delete_client", lambda db: db.delete_client(1)),
+    ("search", lambda db: db.search("red caida*")),
+    ("get_row_stamp", lambda db: db.get_row_stamp("incidents", 1)),
+    ("get_ticket_stamp", lambda db: db.get_ticket_stamp(1)),
+    ("get_table_stamps", lambda db: db.get_table_stamps(("tickets", "clients"))),
+    ("get_changes_page", lambda db: db.get_changes_page(after_seq=10)),
+    ("get_changes_page entity", lambda db: db.get_changes_page(after_seq=10, entity="ticket")),
+    ("get_ticket_stats", lambda db: db.get_ticket_stats("service")),
+    ("get_ticket_stats bucket", lambda db: db.get_ticket_stats("service", bucket="Email")),
+    ("get_ticket_stats range", lambda db: db.get_ticket_stats("day", start="2024-01-01", end="2024-02-01")),
+    ("iter_dispatch_candidates", lambda db: list(db.iter_dispatch_candidates())),
+    ("get_claimed_ticket_ids", lambda db: db.get_claimed_ticket_ids([1, 2, 3])),
+    ("claim_ticket", lambda db: db.claim_ticket(1, "agent", 1704067200)),
+    ("archive_tickets", lambda db: db.archive_tickets(1704067200)),
+    ("prune_changelog", lambda db: db.prune_changelog(1704067200)),
+    ("import_rows", lambda db: db.import_rows("tickets", [(None, 1, "s", 1, "Open", 1704067200, None)])),
+    ("import_rows update", lambda db: db.import_rows(
+        "tickets", [(1, 1, "s", 1, "Open", 1704067200, None)], on_conflict="update")),
+]
+
+# Recorridos completos esperados: devuelven la tabla entera a proposito.
+FULL_SCAN_ALLOWED = {"get_all_incidents", "get_all_tickets", "get_all_clients"}
+
+# Paginas que ordenan a proposito: un rango sobre una columna no puede salir
+# ordenado por id de un indice. El indice acota el orden a las filas del rango.
+PAGE_SORT_ALLOWED = {"get_tickets_page created range", "get_tickets_page closed_within"}
+
+
+class _RecordingConnection:
+    """Conexion falsa para DatabaseHandler.write: anota el SQL y no devuelve filas."""
+
+    row_factory = None
+    lastrowid = 0
+    rowcount = 0
+    description = None
+
+    def __init__(self, captured):
+        self.captured = captured
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, params=()):
+        self.captured.append((query, tuple(params)))
+        return self
+
+    def executemany(self, query, seq_of_params):
+        for params in seq_of_params:
+            self.captured.append((query, tuple(params)))
+        return self
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+    def __iter__(self):
+        return iter(())
+
+
+def capture_queries(db, call):
+    """Devuelve las consultas (sql, params) que emite ``call`` sin ejecutarlas."""
+    captured = []
+
+    def fetchall(query, params=()):
+        captured.append((query, tuple(params)))
+        return []
+
+    def fetchone(query, params=()):
+        captured.append((query, tuple(params)))
+        return None
+
+    def execute(query, params=()):
+        captured.append((query, tuple(params)))
+        return 0
+
+    def executemany(query, seq_of_params):
+        for params in seq_of_params:
+            captured.append((query, tuple(params)))
+        return len(seq_of_params)
+
+    def write(fn):
+        return fn(_RecordingConnection(captured))
+
+    db.fetchall, db.fetchone, db.execute, db.executemany = fetchall, fetchone, execute, executemany
+    db.write = write
+    try:
+        call(db)
+    finally:
+        del db.fetchall, db.fetchone, db.execute, db.executemany, db.write
+    return captured
+
+
+def is_full_scan(detail):
+    # "SCAN t" recorre la tabla; "SCAN t USING INDEX ..." recorre un indice.
+    # En FTS5 "SCAN t VIRTUAL TABLE INDEX n:M..." resuelve un MATCH con el
+    # indice invertido; sin la M recorre toda la tabla virtual.
+    if " VIRTUAL TABLE INDEX " in detail:
+        return ":M" not in detail
+    return detail.startswith("SCAN ") and " USING " not in detail
+
+
+def is_sort(detail):
+    return detail.startswith("USE TEMP B-TREE")
+
+
+def is_paged(name):
+    return "_page" in name
+
+
+def problem(name, detail):
+    """Que tiene de malo el paso ``detail`` del plan de ``name``, o None."""
+    if is_full_scan(detail) and name not in FULL_SCAN_ALLOWED:
+        return "FULL SCAN"
+    if is_sort(detail) and is_paged(name) and name not in PAGE_SORT_ALLOWED:
+        return "PAGE SORT"
+    return None
+
+
+def audit(db):
+    """Devuelve una lista de (nombre, sql, detalle del plan, problema o None)."""
+    results = []
+    for name, call in AUDITED_CALLS:
+        for query, params in capture_queries(db, call):
+            plan = db.fetchall(f"EXPLAIN QUERY PLAN {query}", params)
+            for step in plan:
+                results.append((name, " ".join(query.split()), step["detail"], problem(name, step["detail"])))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN de las consultas del DatabaseHandler")
+    parser.add_argument("--db", default=DB_NAME, help="archivo SQLite a auditar")
+    args = parser.parse_args(argv)
+
+    db = DatabaseHandler(args.db, size=1)
+    try:
+        results = audit(db)
+    finally:
+        db.close()
+
+    problems = 0
+    for name, _query, detail, flagged in results:
+        if flagged:
+            mark = flagged
+        elif is_sort(detail):
+            mark = "sort"
+        else:
+            mark = "ok"
+        problems += flagged is not None
+        print(f"{mark:9}  {name:40}  {detail}")
+    print(f"\n{problems} problem(s) found (full scans or sorted pages)")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
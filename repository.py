@@ -0,0 +1,205 @@
+"""Interfaz comun de los backends de base de datos.
+
+Los managers, app.py, asgi_app.py y los comandos solo usan los metodos de
+Repository; cada backend los implementa sobre el mismo esquema SQLite:
+
+    sqlite      database.DatabaseHandler (sqlite3, pool propio y commit agrupado)
+    sqlalchemy  sqlalchemy_backend.SQLAlchemyDatabaseHandler (engine de
+                SQLAlchemy y sentencias Core en los caminos calientes)
+
+El backend se elige con create_repository(), por parametro o con la variable
+de entorno TICKETS_DB_BACKEND. Los modulos de cada backend se importan recien
+al elegirlo: SQLAlchemy solo hace falta si se usa.
+
+Las filas entran y salen como dicts con las mismas claves en los dos
+backends; los listados paginados devuelven (filas, next_cursor) y los
+iter_* generan las filas de a bloques.
+"""
+import importlib
+import os
+from contextlib import nullcontext
+from abc import ABC, abstractmethod
+
+BACKEND_ENV = "TICKETS_DB_BACKEND"
+DEFAULT_BACKEND = "sqlite"
+BACKENDS = {
+    "sqlite": ("database", "DatabaseHandler"),
+    "sqlalchemy": ("sqlalchemy_backend", "SQLAlchemyDatabaseHandler"),
+}
+
+
+class Repository(ABC):
+    """Operaciones que un backend tiene que ofrecer."""
+
+    # ------------------------------
+    # Incidents
+    # ------------------------------
+    @abstractmethod
+    def get_all_incidents(self): ...
+
+    @abstractmethod
+    def get_incidents_page(self, after_id=None, limit=None, **filters): ...
+
+    @abstractmethod
+    def iter_incidents(self, after_id=None, **filters): ...
+
+    @abstractmethod
+    def get_incidents_by_ids(self, incident_ids): ...
+
+    @abstractmethod
+    def get_incident(self, incident_id): ...
+
+    @abstractmethod
+    def save_incident(self, incident_dict): ...
+
+    @abstractmethod
+    def delete_incident(self, incident_id): ...
+
+    # ------------------------------
+    # Tickets
+    # ------------------------------
+    @abstractmethod
+    def get_all_tickets(self): ...
+
+    @abstractmethod
+    def get_tickets_page(self, after_id=None, limit=None, **filters): ...
+
+    @abstractmethod
+    def iter_tickets(self, after_id=None, **filters): ...
+
+    @abstractmethod
+    def get_ticket(self, ticket_id): ...
+
+    @abstractmethod
+    def save_ticket(self, ticket_dict): ...
+
+    @abstractmethod
+    def save_tickets_many(self, ticket_dicts): ...
+
+    @abstractmethod
+    def update_ticket(self, ticket_id, changes, closed_at=None, expected_version=None): ...
+
+    @abstractmethod
+    def close_ticket(self, ticket_id, closed_at, expected_version=None): ...
+
+    @abstractmethod
+    def delete_ticket(self, ticket_id): ...
+
+    @abstractmethod
+    def iter_dispatch_candidates(self): ...
+
+    @abstractmethod
+    def get_claimed_ticket_ids(self, ticket_ids): ...
+
+    @abstractmethod
+    def claim_ticket(self, ticket_id, agent, claimed_at): ...
+
+    @abstractmethod
+    def get_archived_ticket(self, ticket_id): ...
+
+    @abstractmethod
+    def archive_tickets(self, closed_before, chunk_size=None, pause=0.0): ...
+
+    @abstractmethod
+    def archive_stats(self): ...
+
+    # ------------------------------
+    # Clientes
+    # ------------------------------
+    @abstractmethod
+    def get_all_clients(self): ...
+
+    @abstractmethod
+    def get_clients_page(self, after_id=None, limit=None, **filters): ...
+
+    @abstractmethod
+    def iter_clients(self, after_id=None, **filters): ...
+
+    @abstractmethod
+    def get_clients_by_ids(self, client_ids): ...
+
+    @abstractmethod
+    def get_client(self, client_id): ...
+
+    @abstractmethod
+    def save_client(self, client_dict): ...
+
+    @abstractmethod
+    def delete_client(self, client_id): ...
+
+    # ------------------------------
+    # Marcas de cambio, changelog, busqueda y estadisticas
+    # ------------------------------
+    @abstractmethod
+    def get_row_stamp(self, table, row_id): ...
+
+    @abstractmethod
+    def get_ticket_stamp(self, ticket_id): ...
+
+    @abstractmethod
+    def get_table_stamps(self, tables): ...
+
+    @abstractmethod
+    def get_changes_page(self, after_seq=None, limit=None, entity=None): ...
+
+    @abstractmethod
+    def get_last_change_seq(self): ...
+
+    @abstractmethod
+    def get_first_change_seq(self): ...
+
+    @abstractmethod
+    def prune_changelog(self, changed_before, chunk_size=None, pause=0.0): ...
+
+    @abstractmethod
+    def add_write_listener(self, listener): ...
+
+    @abstractmethod
+    def search(self, text, kinds=None, offset=0, limit=None): ...
+
+    @abstractmethod
+    def get_ticket_stats(self, dimension, bucket=None, start=None, end=None): ...
+
+    @abstractmethod
+    def rebuild_ticket_stats(self, check_only=False): ...
+
+    # ------------------------------
+    # Importacion y exportacion masiva
+    # ------------------------------
+    @abstractmethod
+    def iter_table(self, table, after_id=None): ...
+
+    @abstractmethod
+    def import_rows(self, table, rows, on_conflict="error"): ...
+
+    # ------------------------------
+    # Operacion
+    # ------------------------------
+    @abstractmethod
+    def pool_stats(self): ...
+
+    @abstractmethod
+    def write_stats(self): ...
+
+    @abstractmethod
+    def close(self): ...
+
+    def request_scope(self):
+        """Context manager que abarca un pedido HTTP.
+
+        Un backend puede usarlo para compartir una conexion entre todas las
+        llamadas del pedido; por defecto no hace nada.
+        """
+        return nullcontext()
+
+
+def create_repository(backend=None, **options):
+    """Crea el backend ``backend`` (o el de TICKETS_DB_BACKEND, o sqlite).
+
+    ``options`` van al constructor (db_name, size, timeout, ...).
+    """
+    backend = backend or os.environ.get(BACKEND_ENV) or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown database backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    module_name, class_name = BACKENDS[backend]
+    return getattr(importlib.import_module(module_name), class_name)(**options)
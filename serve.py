@@ -0,0 +1,275 @@
+"""Servidor de produccion de app.py: varios procesos (prefork) sobre un mismo socket.
+
+El proceso principal abre el socket y lanza --workers procesos (por
+defecto, uno por nucleo), que se reparten las conexiones. El principal no
+importa la app ni abre la base: cada worker, ya despues del fork, importa
+app.py y llama a create_app, que abre su propio pool de conexiones, su
+escritor y su ChangeFeed (ni las conexiones SQLite ni los hilos sobreviven
+a un fork). Antes de lanzarlos, un proceso aparte migra el esquema y deja
+la base en WAL, donde los lectores de un proceso no bloquean al que
+escribe ni a los de otros procesos.
+
+Cada worker atiende con el servidor WSGI de werkzeug, un hilo por
+conexion. Lo que en un proceso se daba por hecho se resuelve con la base:
+las caches se invalidan con table_changes (create_app(multiprocess=True)),
+la cola de despacho y los streams de cambios leen lo que escriben los
+demas, y /metrics informa solo el worker que atendio el pedido.
+
+Senales del proceso principal:
+    TERM, INT  apagado ordenado: los workers dejan de aceptar conexiones,
+               terminan los pedidos en curso (hasta --graceful-timeout) y
+               cierran la base.
+    HUP        recarga sin cortar el servicio: lanza workers nuevos (que
+               importan el codigo de nuevo) y apaga en orden los viejos.
+Un worker que muere se reemplaza.
+
+Uso:
+    python serve.py [--host 127.0.0.1] [--port 8000] [--workers 4]
+        [--db db.sqlite] [--backend sqlite|sqlalchemy]
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+# Un worker que muere antes de esto se considera que no pudo arrancar: se
+# espera antes de reemplazarlo, para no lanzar procesos en un bucle.
+MIN_WORKER_LIFETIME = 1.0
+RESPAWN_DELAY = 1.0
+POLL_INTERVAL = 0.2
+
+
+def log(message):
+    print(f"[serve {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def open_database(args):
+    from repository import create_repository
+
+    options = {"db_name": args.db} if args.db else {}
+    return create_repository(args.backend, **options)
+
+
+# ------------------------------
+# Preparacion de la base (en un proceso aparte)
+# ------------------------------
+def prepare_database(args):
+    """Migra el esquema una sola vez y verifica el modo WAL."""
+    db = open_database(args)
+    try:
+        mode = db.fetchone("PRAGMA journal_mode")["journal_mode"]
+    finally:
+        db.close()
+    if mode != "wal" and args.workers > 1:
+        raise RuntimeError(f"journal_mode is {mode!r}; several workers need WAL")
+
+
+def run_in_child(target, *args):
+    """Corre ``target`` en un proceso hijo, asi el principal no carga la base; devuelve si salio bien."""
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            target(*args)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status) == 0
+
+
+# ------------------------------
+# Worker
+# ------------------------------
+def run_worker(listener, args, parent):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    import app as app_module
+
+    class RequestHandler(WSGIRequestHandler):
+        # Una conexion ociosa se cierra a los --keepalive segundos: si no,
+        # un cliente con keep-alive demoraria el apagado del worker.
+        timeout = args.keepalive
+
+        def log_request(self, *args, **kwargs):
+            # Los pedidos ya se registran con instrumentation.log_request.
+            pass
+
+    application = app_module.create_app(open_database(args), multiprocess=True)
+    server = make_server(args.host, args.port, application, threaded=True,
+                         request_handler=RequestHandler, fd=listener.fileno())
+    # Hilos no daemon: al cerrar, el servidor espera los pedidos en curso.
+    server.daemon_threads = False
+
+    stopping = threading.Event()
+
+    def shutdown():
+        # Corta los streams de cambios; sin esto, el servidor los esperaria
+        # hasta el SIGKILL.
+        app_module.services.change_feed.close()
+        server.shutdown()
+
+    def stop(*_):
+        if not stopping.is_set():
+            stopping.set()
+            # shutdown() espera a que termine serve_forever: no puede correr en este hilo.
+            threading.Thread(target=shutdown, daemon=True).start()
+
+    def watch_parent():
+        # Si el principal muere (kill -9), nadie mas apagaria este worker.
+        while not stopping.wait(1.0):
+            if os.getppid() != parent:
+                stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    threading.Thread(target=watch_parent, daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        app_module.services.close()
+
+
+def spawn_worker(listener, args):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(signum, signal.SIG_DFL)
+            run_worker(listener, args, os.getppid())
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stderr.flush()
+            os._exit(code)
+    return pid
+
+
+# ------------------------------
+# Proceso principal
+# ------------------------------
+class Arbiter:
+    """Mantiene --workers procesos vivos y atiende las senales de apagado y recarga."""
+
+    def __init__(self, listener, args):
+        self.listener = listener
+        self.args = args
+        self.workers = {}    # pid -> momento en que se lanzo
+        self.retiring = {}   # pid -> limite para terminar; despues, SIGKILL
+        self.stopping = False
+        self.reloading = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._reload)
+        self._spawn_missing()
+        log(f"listening on http://{self.args.host}:{self.args.port} with {self.args.workers} worker(s)")
+        while not self.stopping:
+            if self.reloading:
+                self.reloading = False
+                old, self.workers = list(self.workers), {}
+                self._spawn_missing()
+                self._retire(old)
+                log("reloading: new workers started, old ones finishing their requests")
+            self._reap()
+            self._spawn_missing()
+            self._kill_overdue()
+            time.sleep(POLL_INTERVAL)
+        self._shutdown()
+
+    def _stop(self, *_):
+        self.stopping = True
+
+    def _reload(self, *_):
+        self.reloading = True
+
+    def _spawn_missing(self):
+        while len(self.workers) < self.args.workers:
+            self.workers[spawn_worker(self.listener, self.args)] = time.monotonic()
+
+    def _retire(self, pids):
+        deadline = time.monotonic() + self.args.graceful_timeout
+        for pid in pids:
+            self.workers.pop(pid, None)
+            self.retiring[pid] = deadline
+            self._signal(pid, signal.SIGTERM)
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.retiring.pop(pid, None)
+            started = self.workers.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            log(f"worker {pid} exited with code {os.waitstatus_to_exitcode(status)}; replacing it")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(RESPAWN_DELAY)
+
+    def _kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                log(f"worker {pid} did not finish in {self.args.graceful_timeout}s; killing it")
+                self._signal(pid, signal.SIGKILL)
+                self.retiring[pid] = float("inf")
+
+    def _shutdown(self):
+        log("shutting down")
+        self._retire(list(self.workers))
+        while self.retiring:
+            self._reap()
+            self._kill_overdue()
+            time.sleep(POLL_INTERVAL)
+
+    @staticmethod
+    def _signal(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sirve app.py con varios procesos")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="procesos que atienden pedidos (por defecto, uno por nucleo)")
+    parser.add_argument("--db", help="archivo SQLite (por defecto, el de database.DB_NAME)")
+    parser.add_argument("--backend", help="backend de base (por defecto, TICKETS_DB_BACKEND)")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0,
+                        help="segundos que tiene un worker para terminar sus pedidos al apagarse")
+    parser.add_argument("--keepalive", type=float, default=5.0,
+                        help="segundos que se mantiene abierta una conexion ociosa")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    if not run_in_child(prepare_database, args):
+        log("could not prepare the database")
+        return 1
+    listener = socket.create_server((args.host, args.port), backlog=2048)
+    try:
+        Arbiter(listener, args).run()
+    finally:
+        listener.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,482 @@
+"""Backend "sqlalchemy" de repository: el mismo esquema SQLite sobre un engine de SQLAlchemy.
+
+Hereda de DatabaseHandler lo que es SQL propio de SQLite (esquema,
+triggers, busqueda FTS5, estadisticas, marcas de cambio y changelog): esas
+consultas corren sobre las conexiones del pool de SQLAlchemy, asi los dos
+backends no se separan. Las lecturas y escrituras de filas son sentencias
+Core que se arman una sola vez (los listados, una por combinacion de
+filtros) con bindparams, asi SQLAlchemy reutiliza su compilacion; las
+filas salen como dicts sin pasar por objetos ORM ni copiar atributos, y
+las modificaciones son un solo UPDATE ... RETURNING, sin leer antes.
+
+request_scope() presta una conexion para todo un pedido: las llamadas que
+caen dentro la comparten en vez de tomar y devolver una del pool cada vez.
+
+Las escrituras no pasan por GroupCommitWriter: cada una es su propia
+transaccion y los escritores concurrentes esperan con el busy timeout de
+SQLite.
+"""
+import contextvars
+from contextlib import contextmanager
+from operator import eq, ge, le, lt
+
+from sqlalchemy import (
+    Column, Integer, MetaData, Table, Text, bindparam, create_engine, func, insert, select, update
+)
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from database import DatabaseHandler, DB_NAME, PAGE_SIZE, TicketArchived, VersionConflict, open_connection
+from instrumentation import phase
+from timestamps import TIMESTAMP_FORMAT, now
+
+# Solo describen las columnas para armar sentencias; las tablas las crea
+# y migra DatabaseHandler.init_db.
+metadata = MetaData()
+incidents = Table(
+    "incidents", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("description", Text),
+    Column("incident_type", Text),
+    Column("version", Integer),
+    Column("updated_at", Integer),
+)
+tickets = Table(
+    "tickets", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("client_id", Integer),
+    Column("service", Text),
+    Column("incident_id", Integer),
+    Column("status", Text),
+    Column("created_at", Integer),
+    Column("closed_at", Integer),
+    Column("version", Integer),
+    Column("updated_at", Integer),
+)
+tickets_archive = Table(
+    "tickets_archive", metadata,
+    Column("id", Integer, primary_key=True),
+)
+clients = Table(
+    "clients", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", Text),
+    Column("email", Text),
+    Column("phone_number", Text),
+    Column("version", Integer),
+    Column("updated_at", Integer),
+)
+
+
+def _date(column, name):
+    return func.strftime(TIMESTAMP_FORMAT, column, "unixepoch").label(name)
+
+
+def _client_column(column, name):
+    # Subconsulta correlacionada con tickets: en RETURNING solo se ve la fila modificada.
+    return select(column).where(clients.c.id == tickets.c.client_id).correlate(tickets).scalar_subquery().label(name)
+
+
+# Mismas columnas y nombres que INCIDENT_SELECT, CLIENT_SELECT, TICKET_SELECT
+# y TICKET_RETURNING.
+_t = tickets.alias("t")
+_c = clients.alias("c")
+INCIDENT_QUERY = select(incidents.c.id, incidents.c.description, incidents.c.incident_type)
+CLIENT_QUERY = select(clients.c.id, clients.c.name, clients.c.email, clients.c.phone_number)
+TICKET_QUERY = select(
+    _t.c.id, _t.c.service, _t.c.incident_id, _t.c.status,
+    _date(_t.c.created_at, "creation_date"), _date(_t.c.closed_at, "closing_date"),
+    _t.c.version, _t.c.client_id, _c.c.name.label("client_name"),
+    _c.c.email.label("client_email"), _c.c.phone_number.label("client_phone_number"),
+).select_from(_t.outerjoin(_c, _c.c.id == _t.c.client_id))
+TICKET_RETURNING = (
+    tickets.c.id, tickets.c.service, tickets.c.incident_id, tickets.c.status,
+    _date(tickets.c.created_at, "creation_date"), _date(tickets.c.closed_at, "closing_date"),
+    tickets.c.version, tickets.c.client_id,
+    _client_column(clients.c.name, "client_name"),
+    _client_column(clients.c.email, "client_email"),
+    _client_column(clients.c.phone_number, "client_phone_number"),
+)
+
+# Filtros de cada listado: nombre del parametro -> (columna, operador).
+INCIDENT_FILTERS = {"incident_type": (incidents.c.incident_type, eq)}
+CLIENT_FILTERS = {"email": (clients.c.email, eq)}
+TICKET_FILTERS = {
+    "status": (_t.c.status, eq),
+    "service": (_t.c.service, eq),
+    "incident_id": (_t.c.incident_id, eq),
+    "created_after": (_t.c.created_at, ge),
+    "created_before": (_t.c.created_at, lt),
+    "closed_from": (_t.c.closed_at, ge),
+    "closed_to": (_t.c.closed_at, le),
+}
+
+# Los bindparams de UPDATE llevan el prefijo b_: SQLAlchemy reserva los
+# nombres de columna para los valores de SET.
+INCIDENT_BY_ID = INCIDENT_QUERY.where(incidents.c.id == bindparam("id"))
+INCIDENTS_BY_IDS = INCIDENT_QUERY.where(incidents.c.id.in_(bindparam("ids", expanding=True)))
+INSERT_INCIDENT = insert(incidents)
+UPDATE_INCIDENT = update(incidents).where(incidents.c.id == bindparam("b_id")).values(
+    description=bindparam("description"), incident_type=bindparam("incident_type"),
+    version=incidents.c.version + 1, updated_at=bindparam("updated_at"),
+)
+DELETE_INCIDENT = incidents.delete().where(incidents.c.id == bindparam("id"))
+
+CLIENT_BY_ID = CLIENT_QUERY.where(clients.c.id == bindparam("id"))
+CLIENTS_BY_IDS = CLIENT_QUERY.where(clients.c.id.in_(bindparam("ids", expanding=True)))
+INSERT_CLIENT = insert(clients)
+UPDATE_CLIENT = update(clients).where(clients.c.id == bindparam("b_id")).values(
+    name=bindparam("name"), email=bindparam("email"), phone_number=bindparam("phone_number"),
+    version=clients.c.version + 1, updated_at=bindparam("updated_at"),
+)
+DELETE_CLIENT = clients.delete().where(clients.c.id == bindparam("id"))
+
+TICKET_BY_ID = TICKET_QUERY.where(_t.c.id == bindparam("id"))
+TICKET_EXISTS = select(tickets.c.id).where(tickets.c.id == bindparam("id"))
+ARCHIVED_TICKET_EXISTS = select(tickets_archive.c.id).where(tickets_archive.c.id == bindparam("id"))
+INSERT_TICKET = insert(tickets)
+# RETURNING con sort_by_parameter_order: los id vuelven en el orden de las
+# filas aunque SQLAlchemy agrupe el executemany en INSERTs de varias filas.
+INSERT_TICKETS = insert(tickets).returning(tickets.c.id, sort_by_parameter_order=True)
+UPDATE_TICKET = update(tickets).where(tickets.c.id == bindparam("b_id")).values(
+    client_id=bindparam("client_id"), service=bindparam("service"),
+    incident_id=bindparam("incident_id"), status=bindparam("status"),
+    created_at=bindparam("created_at"), closed_at=bindparam("closed_at"),
+    version=tickets.c.version + 1, updated_at=bindparam("updated_at"),
+)
+CLOSE_TICKET = update(tickets).where(tickets.c.id == bindparam("b_id")).values(
+    status="Closed", closed_at=bindparam("closed_at"),
+    version=tickets.c.version + 1, updated_at=bindparam("updated_at"),
+).returning(*TICKET_RETURNING)
+DELETE_TICKET = tickets.delete().where(tickets.c.id == bindparam("id"))
+
+# Sentencias de listado ya armadas, por (listado, filtros presentes, hay after_id).
+_PAGE_STATEMENTS = {}
+
+
+class EnginePool:
+    """Pool de SQLAlchemy con la interfaz de ConnectionPool.
+
+    Para un archivo usa QueuePool de ``size`` conexiones, sin desborde (en
+    WAL los lectores no se bloquean entre si y acotar el pool acota los
+    file descriptors); para ":memory:", StaticPool, porque cada conexion a
+    ":memory:" seria una base distinta. Las conexiones se abren con
+    open_connection, con los mismos PRAGMA que el backend sqlite.
+
+    connection() y checkout() prestan la conexion sqlite3 de debajo para el
+    SQL heredado de DatabaseHandler; dentro de scope() todas las llamadas
+    usan la misma conexion.
+    """
+
+    def __init__(self, db_name, size=5, timeout=30.0, journal_mode="WAL",
+                 synchronous="NORMAL", cache_size=-2000, mmap_size=0, query_cache_size=500):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.db_name = db_name
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = {
+            "journal_mode": journal_mode,
+            "synchronous": synchronous,
+            "cache_size": cache_size,
+            "mmap_size": mmap_size,
+        }
+        if db_name == ":memory:":
+            pool_options = {"poolclass": StaticPool}
+            self.size = 1
+        else:
+            pool_options = {"poolclass": QueuePool, "pool_size": size, "max_overflow": 0, "pool_timeout": timeout}
+        self.engine = create_engine(
+            "sqlite://", creator=lambda: open_connection(db_name, timeout, self.pragmas),
+            query_cache_size=query_cache_size, **pool_options
+        )
+        self._scoped = contextvars.ContextVar(f"scoped_connection_{id(self)}", default=None)
+
+    @contextmanager
+    def scope(self):
+        """Toma una conexion que comparten todas las llamadas del bloque (y de este contexto)."""
+        if self._scoped.get() is not None:
+            yield
+            return
+        with phase("connect"):
+            conn = self.engine.connect()
+        token = self._scoped.set(conn)
+        try:
+            yield
+        finally:
+            self._scoped.reset(token)
+            conn.close()
+
+    @contextmanager
+    def connect(self):
+        """Conexion de SQLAlchemy: la del scope actual o una del pool."""
+        conn = self._scoped.get()
+        if conn is not None:
+            yield conn
+            return
+        with phase("connect"):
+            conn = self.engine.connect()
+        with conn:
+            yield conn
+
+    @contextmanager
+    def connection(self):
+        conn = self._scoped.get()
+        if conn is not None:
+            yield conn.connection.driver_connection
+            return
+        with self.checkout() as conn:
+            yield conn
+
+    @contextmanager
+    def checkout(self):
+        """Conexion sqlite3 exclusiva, fuera del scope (para generadores)."""
+        with phase("connect"):
+            proxied = self.engine.raw_connection()
+        try:
+            yield proxied.driver_connection
+        finally:
+            # Al volver al pool SQLAlchemy hace rollback de lo no confirmado.
+            proxied.close()
+
+    def stats(self):
+        pool = self.engine.pool
+        if isinstance(pool, StaticPool):
+            return {"size": 1, "open": 1, "idle": 0, "in_use": 1}
+        idle, in_use = pool.checkedin(), pool.checkedout()
+        return {"size": self.size, "open": idle + in_use, "idle": idle, "in_use": in_use}
+
+    def close(self):
+        self.engine.dispose()
+
+
+class SQLAlchemyDatabaseHandler(DatabaseHandler):
+    """DatabaseHandler sobre SQLAlchemy, con sentencias Core para las filas."""
+
+    def __init__(self, db_name=DB_NAME, **pool_options):
+        self.db_name = db_name
+        self.pool = EnginePool(db_name, **pool_options)
+        self.engine = self.pool.engine
+        self.writer = None
+        self._write_listeners = []
+        self.init_db()
+
+    def request_scope(self):
+        return self.pool.scope()
+
+    # ------------------------------
+    # Ejecucion de sentencias Core
+    # ------------------------------
+    def _rows(self, stmt, params=None):
+        with phase("query", queries=1), self.pool.connect() as conn:
+            result = conn.execute(stmt, params)
+            columns = list(result.keys())
+            return [dict(zip(columns, row)) for row in result]
+
+    def _row(self, stmt, params=None):
+        rows = self._rows(stmt, params)
+        return rows[0] if rows else None
+
+    def _write_core(self, stmt, params=None, check=None):
+        """Ejecuta ``stmt`` en su propia transaccion.
+
+        Devuelve la primera fila de RETURNING como dict (o None), o la clave
+        insertada en un INSERT sin RETURNING. ``check(conn, fila)`` corre antes del
+        commit y puede lanzar una excepcion para deshacer la sentencia.
+        """
+        with phase("query", queries=1), self.pool.connect() as conn:
+            try:
+                result = conn.execute(stmt, params)
+                if result.returns_rows:
+                    row = result.mappings().first()
+                    returned = dict(row) if row is not None else None
+                elif result.is_insert:
+                    returned = result.inserted_primary_key
+                else:
+                    returned = None
+                if check is not None:
+                    check(conn, returned)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        self._notify_write()
+        return returned
+
+    def _executemany_returning(self, stmt, params):
+        with phase("query", queries=1), self.pool.connect() as conn:
+            try:
+                returned = conn.execute(stmt, params).scalars().all()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        self._notify_write()
+        return returned
+
+    def _page(self, name, base, key, filters, values, after_id, limit):
+        """Pagina por clave con la sentencia ya armada para esta combinacion de filtros."""
+        present = tuple(sorted(n for n, value in values.items() if value is not None))
+        cache_key = (name, present, after_id is not None)
+        stmt = _PAGE_STATEMENTS.get(cache_key)
+        if stmt is None:
+            stmt = base
+            if after_id is not None:
+                stmt = stmt.where(key > bindparam("after_id"))
+            for n in present:
+                if n not in filters:
+                    raise TypeError(f"unexpected filter {n!r}")
+                column, op = filters[n]
+                stmt = stmt.where(op(column, bindparam(n)))
+            stmt = _PAGE_STATEMENTS[cache_key] = stmt.order_by(key).limit(bindparam("limit"))
+        params = {n: values[n] for n in present}
+        params["limit"] = limit + 1
+        if after_id is not None:
+            params["after_id"] = after_id
+        rows = self._rows(stmt, params)
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, rows[-1]["id"]
+        return rows, None
+
+    # ------------------------------
+    # Incidents
+    # ------------------------------
+    def get_incidents_page(self, after_id=None, limit=PAGE_SIZE, incident_type=None):
+        return self._page("incidents", INCIDENT_QUERY, incidents.c.id, INCIDENT_FILTERS,
+                          {"incident_type": incident_type}, after_id, limit)
+
+    def get_incidents_by_ids(self, incident_ids):
+        ids = list(set(incident_ids))
+        return self._rows(INCIDENTS_BY_IDS, {"ids": ids}) if ids else []
+
+    def get_incident(self, incident_id):
+        return self._row(INCIDENT_BY_ID, {"id": incident_id})
+
+    def save_incident(self, incident_dict):
+        values = {
+            "description": incident_dict["description"],
+            "incident_type": incident_dict["incident_type"],
+            "updated_at": now(),
+        }
+        if incident_dict.get("id") is None:
+            incident_dict["id"] = self._write_core(INSERT_INCIDENT, values)[0]
+        else:
+            self._write_core(UPDATE_INCIDENT, {**values, "b_id": incident_dict["id"]})
+        return incident_dict
+
+    def delete_incident(self, incident_id):
+        self._write_core(DELETE_INCIDENT, {"id": incident_id})
+
+    # ------------------------------
+    # Tickets
+    # ------------------------------
+    def get_tickets_page(self, after_id=None, limit=PAGE_SIZE, closed_within=None, **filters):
+        if closed_within is not None:
+            # Rango cerrado en los dos extremos, como en DatabaseHandler._ticket_filters.
+            filters["closed_to"] = now()
+            filters["closed_from"] = filters["closed_to"] - closed_within
+        return self._page("tickets", TICKET_QUERY, _t.c.id, TICKET_FILTERS, filters, after_id, limit)
+
+    def get_ticket(self, ticket_id):
+        row = self._row(TICKET_BY_ID, {"id": ticket_id})
+        return row if row is not None else self.get_archived_ticket(ticket_id)
+
+    @staticmethod
+    def _ticket_values(ticket_dict, updated_at):
+        return {
+            "client_id": ticket_dict["client_id"],
+            "service": ticket_dict["service"],
+            "incident_id": ticket_dict["incident_id"],
+            "status": ticket_dict["status"],
+            "created_at": ticket_dict["created_at"],
+            "closed_at": ticket_dict["closed_at"],
+            "updated_at": updated_at,
+        }
+
+    def save_ticket(self, ticket_dict):
+        values = self._ticket_values(ticket_dict, now())
+        if ticket_dict.get("id") is None:
+            ticket_dict["id"] = self._write_core(INSERT_TICKET, values)[0]
+        else:
+            self._write_core(UPDATE_TICKET, {**values, "b_id": ticket_dict["id"]})
+        return ticket_dict
+
+    def save_tickets_many(self, ticket_dicts):
+        """Inserta los tickets con un executemany de SQLAlchemy y RETURNING de los id."""
+        if not ticket_dicts:
+            return ticket_dicts
+        stamp = now()
+        ids = self._executemany_returning(
+            INSERT_TICKETS, [self._ticket_values(t, stamp) for t in ticket_dicts]
+        )
+        for ticket_dict, ticket_id in zip(ticket_dicts, ids):
+            ticket_dict["id"] = ticket_id
+        return ticket_dicts
+
+    def _update_ticket_core(self, ticket_id, stmt, params, expected_version):
+        """UPDATE ... RETURNING con el control de version de DatabaseHandler._update_ticket_returning."""
+        def check(conn, row):
+            if row is not None:
+                return
+            if expected_version is not None and conn.execute(TICKET_EXISTS, {"id": ticket_id}).first() is not None:
+                raise VersionConflict(f"ticket {ticket_id} is not at version {expected_version}")
+            if conn.execute(ARCHIVED_TICKET_EXISTS, {"id": ticket_id}).first() is not None:
+                raise TicketArchived(f"ticket {ticket_id} is archived")
+
+        params = {**params, "b_id": ticket_id, "updated_at": now()}
+        if expected_version is not None:
+            stmt = stmt.where(tickets.c.version == bindparam("b_version"))
+            params["b_version"] = expected_version
+        return self._write_core(stmt, params, check)
+
+    def update_ticket(self, ticket_id, changes, closed_at=None, expected_version=None):
+        values, params = {}, {}
+        for column in ("client_id", "service", "incident_id", "status"):
+            if column in changes:
+                values[column] = bindparam(column)
+                params[column] = changes[column]
+        if changes.get("status") == "Closed":
+            values["closed_at"] = func.coalesce(tickets.c.closed_at, bindparam("b_closed_at"))
+            params["b_closed_at"] = closed_at
+        elif changes.get("status") == "Open":
+            values["closed_at"] = None
+        stmt = update(tickets).where(tickets.c.id == bindparam("b_id")).values(
+            **values, version=tickets.c.version + 1, updated_at=bindparam("updated_at")
+        ).returning(*TICKET_RETURNING)
+        return self._update_ticket_core(ticket_id, stmt, params, expected_version)
+
+    def close_ticket(self, ticket_id, closed_at, expected_version=None):
+        return self._update_ticket_core(ticket_id, CLOSE_TICKET, {"closed_at": closed_at}, expected_version)
+
+    def delete_ticket(self, ticket_id):
+        self._write_core(DELETE_TICKET, {"id": ticket_id})
+
+    # ------------------------------
+    # Clientes
+    # ------------------------------
+    def get_clients_page(self, after_id=None, limit=PAGE_SIZE, email=None):
+        return self._page("clients", CLIENT_QUERY, clients.c.id, CLIENT_FILTERS,
+                          {"email": email}, after_id, limit)
+
+    def get_clients_by_ids(self, client_ids):
+        ids = list(set(client_ids))
+        return self._rows(CLIENTS_BY_IDS, {"ids": ids}) if ids else []
+
+    def get_client(self, client_id):
+        return self._row(CLIENT_BY_ID, {"id": client_id})
+
+    def save_client(self, client_dict):
+        values = {
+            "name": client_dict["name"],
+            "email": client_dict["email"],
+            "phone_number": client_dict["phone_number"],
+            "updated_at": now(),
+        }
+        if client_dict.get("id") is None:
+            client_dict["id"] = self._write_core(INSERT_CLIENT, values)[0]
+        else:
+            self._write_core(UPDATE_CLIENT, {**values, "b_id": client_dict["id"]})
+        return client_dict
+
+    def delete_client(self, client_id):
+        self._write_core(DELETE_CLIENT, {"id": client_id})
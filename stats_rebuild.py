@@ -0,0 +1,40 @@
+"""Recalcula ticket_stats desde la tabla tickets.
+
+Los agregados se mantienen con triggers en cada escritura; este comando los
+recalcula desde cero y muestra los grupos cuyo valor guardado no coincidia
+(drift). Con --check solo compara, sin modificar nada, y devuelve codigo de
+salida 1 si encontro diferencias.
+
+Uso:
+    python stats_rebuild.py [--db db.sqlite] [--check]
+"""
+import argparse
+import sys
+
+from database import DatabaseHandler, DB_NAME, STATS_COLUMNS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recalcula las estadisticas de tickets")
+    parser.add_argument("--db", default=DB_NAME, help="archivo SQLite")
+    parser.add_argument("--check", action="store_true", help="solo informar diferencias, sin corregirlas")
+    args = parser.parse_args(argv)
+
+    db = DatabaseHandler(args.db)
+    try:
+        drift = db.rebuild_ticket_stats(check_only=args.check)
+    finally:
+        db.close()
+
+    print(f"{'dimension':15}  {'bucket':20}  " + "  ".join(f"{c:>15}" for c in STATS_COLUMNS))
+    for dimension, bucket, stored, fresh in drift:
+        print(f"{dimension:15}  {bucket:20}  " + "  ".join(
+            f"{f'{s} -> {f}' if s != f else s:>15}" for s, f in zip(stored, fresh)
+        ))
+    action = "found" if args.check else "fixed"
+    print(f"\n{len(drift)} drifted bucket(s) {action}")
+    return 1 if args.check and drift else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
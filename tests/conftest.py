@@ -0,0 +1,32 @@
+import pytest
+
+from database import DatabaseHandler
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Base SQLite nueva (esquema actual) en un directorio temporal."""
+    handler = DatabaseHandler(str(tmp_path / "db.sqlite"))
+    yield handler
+    handler.close()
+
+
+@pytest.fixture
+def ticket_refs(db):
+    """(incident_id, client_id) validos para crear tickets."""
+    incident = db.save_incident({"description": "Sin conexion", "incident_type": "network"})
+    client = db.save_client({"name": "Ana", "email": "ana@example.com", "phone_number": "123"})
+    return incident["id"], client["id"]
+
+
+@pytest.fixture
+def new_ticket(db, ticket_refs):
+    """Crea un ticket abierto y devuelve su id."""
+    incident_id, client_id = ticket_refs
+
+    def create(service="Internet", status="Open", created_at=1_700_000_000, closed_at=None):
+        return db.save_ticket({
+            "client_id": client_id, "service": service, "incident_id": incident_id,
+            "status": status, "created_at": created_at, "closed_at": closed_at,
+        })["id"]
+    return create
@@ -0,0 +1,45 @@
+import pytest
+
+from app import create_app
+from database import DatabaseHandler
+
+
+@pytest.fixture
+def client(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "db.sqlite"))
+    app = create_app(db, multiprocess=False)
+    yield app.test_client()
+    db.close()
+
+
+@pytest.fixture
+def ticket(client):
+    incident = client.post("/api/incidents/", json={"description": "Sin conexion", "incident_type": "network"})
+    owner = client.post("/api/clients/", json={"name": "Ana", "email": "ana@example.com", "phone_number": "123"})
+    response = client.post("/api/tickets/", json={
+        "incident_id": incident.get_json()["id"], "client_id": owner.get_json()["id"], "service": "Internet"
+    })
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def test_stale_version_is_a_conflict(client, ticket):
+    url = f"/api/tickets/{ticket['id']}"
+    response = client.put(url, json={"service": "Telefonia", "version": ticket["version"]})
+    assert response.status_code == 200
+    assert response.get_json()["version"] == ticket["version"] + 1
+
+    response = client.put(url, json={"service": "Internet", "version": ticket["version"]})
+    assert response.status_code == 409
+    assert client.get(url).get_json()["service"] == "Telefonia"
+
+    response = client.put(f"{url}/close", json={"version": ticket["version"]})
+    assert response.status_code == 409
+
+
+def test_queue_hands_out_each_ticket_once(client, ticket):
+    first = client.post("/api/queue/claim", json={"agent": "ana"})
+    assert first.status_code == 200
+    assert first.get_json()["ticket"]["id"] == ticket["id"]
+    assert client.post("/api/queue/claim", json={"agent": "beto"}).status_code == 404
+    assert client.post("/api/queue/claim", json={}).status_code == 400
@@ -0,0 +1,114 @@
+import json
+import os
+import sqlite3
+import time
+
+import pytest
+
+from database import SCHEMA_FINGERPRINT, DatabaseHandler
+from timestamps import TIMESTAMP_FORMAT
+
+# Esquema original: el cliente como JSON dentro del ticket y fechas en texto (hora local).
+LEGACY_SCHEMA = """
+CREATE TABLE incidents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    description TEXT NOT NULL,
+    incident_type TEXT NOT NULL
+);
+CREATE TABLE tickets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client TEXT NOT NULL,
+    service TEXT NOT NULL,
+    incident_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    creation_date TEXT NOT NULL,
+    closing_date TEXT,
+    FOREIGN KEY (incident_id) REFERENCES incidents (id)
+);
+CREATE TABLE clients (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    phone_number TEXT NOT NULL
+);
+"""
+
+ANA = {"id": 1, "name": "Ana", "email": "ana@example.com", "phone_number": "123"}
+# Solo existe dentro del JSON del ticket: la migracion la recrea con su id.
+BETO = {"id": 7, "name": "Beto", "email": "beto@example.com", "phone_number": "456"}
+
+
+@pytest.fixture
+def local_tz():
+    """Zona horaria fija y distinta de UTC, para que la conversion se note."""
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "America/Argentina/Buenos_Aires"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+
+@pytest.fixture
+def legacy_path(tmp_path, local_tz):
+    path = str(tmp_path / "legacy.sqlite")
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.execute("INSERT INTO incidents (description, incident_type) VALUES ('Sin conexion', 'network')")
+    conn.execute("INSERT INTO clients (id, name, email, phone_number) VALUES (?, ?, ?, ?)", tuple(ANA.values()))
+    conn.executemany(
+        "INSERT INTO tickets (client, service, incident_id, status, creation_date, closing_date) "
+        "VALUES (?, ?, 1, ?, ?, ?)",
+        [
+            (json.dumps(ANA), "Internet", "Closed", "2024-03-10 09:15:00", "2024-03-10 18:45:30"),
+            (json.dumps(BETO), "Telefonia", "Open", "2024-03-11 23:30:00", None),
+        ]
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def epoch(text):
+    return int(time.mktime(time.strptime(text, TIMESTAMP_FORMAT)))
+
+
+def columns(db, table):
+    return {row["name"] for row in db.fetchall(f"PRAGMA table_info({table})")}
+
+
+def test_legacy_tickets_are_migrated(legacy_path):
+    db = DatabaseHandler(legacy_path)
+    try:
+        tickets = db.fetchall("SELECT id, client_id, created_at, closed_at FROM tickets ORDER BY id")
+        assert tickets == [
+            {"id": 1, "client_id": 1, "created_at": epoch("2024-03-10 09:15:00"),
+             "closed_at": epoch("2024-03-10 18:45:30")},
+            {"id": 2, "client_id": 7, "created_at": epoch("2024-03-11 23:30:00"), "closed_at": None},
+        ]
+        assert db.get_client(7)["name"] == "Beto"
+        assert db.get_client(1)["email"] == ANA["email"]
+        assert not columns(db, "tickets") & {"client", "creation_date", "closing_date"}
+        assert db.fetchone("PRAGMA user_version")["user_version"] == SCHEMA_FINGERPRINT
+        # Las tablas derivadas se arman con los datos migrados.
+        assert db.rebuild_ticket_stats(check_only=True) == []
+        assert [r["id"] for r in db.search("Telefonia")[0]] == [2]
+    finally:
+        db.close()
+
+
+def test_migration_runs_once(legacy_path):
+    DatabaseHandler(legacy_path).close()
+    db = DatabaseHandler(legacy_path)
+    try:
+        before = db.fetchall("SELECT * FROM tickets ORDER BY id")
+        schema = db.fetchall("SELECT name, sql FROM sqlite_master ORDER BY name")
+        db.init_db()
+        assert db.fetchall("SELECT * FROM tickets ORDER BY id") == before
+        assert db.fetchall("SELECT name, sql FROM sqlite_master ORDER BY name") == schema
+        assert db.fetchone("SELECT COUNT(*) AS n FROM clients")["n"] == 2
+    finally:
+        db.close()
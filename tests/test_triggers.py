@@ -0,0 +1,154 @@
+import threading
+
+import pytest
+
+from database import VersionConflict
+
+DAY = 86_400
+
+
+def stats(db, dimension):
+    return {row["bucket"]: row for row in db.get_ticket_stats(dimension)}
+
+
+def search_ids(db, text, kind):
+    return [row["id"] for row in db.search(text, kinds=[kind])[0]]
+
+
+def counter(db, table):
+    return db.get_table_stamps([table])[table][0]
+
+
+def test_ticket_stats_follow_every_write(db, new_ticket):
+    first = new_ticket(service="Internet", created_at=1_700_000_000)
+    second = new_ticket(service="Internet", created_at=1_700_000_000 + DAY)
+    new_ticket(service="Telefonia", created_at=1_700_000_000)
+    assert db.rebuild_ticket_stats(check_only=True) == []
+
+    db.close_ticket(first, closed_at=1_700_000_000 + 3_600)
+    db.update_ticket(second, {"service": "Telefonia"})
+    assert db.rebuild_ticket_stats(check_only=True) == []
+
+    by_service = stats(db, "service")
+    assert (by_service["Internet"]["open_count"], by_service["Internet"]["closed_count"]) == (0, 1)
+    assert by_service["Internet"]["close_seconds"] == 3_600
+    assert by_service["Telefonia"]["open_count"] == 2
+    assert stats(db, "all")["all"]["open_count"] == 2
+
+    db.update_ticket(first, {"status": "Open"})
+    db.delete_ticket(second)
+    assert db.rebuild_ticket_stats(check_only=True) == []
+    assert "Internet" in stats(db, "service")
+    assert stats(db, "all")["all"]["open_count"] == 2
+    assert stats(db, "all")["all"]["closed_count"] == 0
+
+
+def test_incident_type_change_moves_ticket_stats(db, new_ticket, ticket_refs):
+    new_ticket()
+    incident_id, _client_id = ticket_refs
+    db.save_incident({"id": incident_id, "description": "Sin conexion", "incident_type": "hardware"})
+    assert db.rebuild_ticket_stats(check_only=True) == []
+    assert list(stats(db, "incident_type")) == ["hardware"]
+
+
+def test_search_index_follows_updates_and_deletes(db, new_ticket, ticket_refs):
+    ticket_id = new_ticket(service="Internet")
+    incident_id, _client_id = ticket_refs
+    assert search_ids(db, "Internet", "ticket") == [ticket_id]
+    assert search_ids(db, "conexion", "incident") == [incident_id]
+
+    db.update_ticket(ticket_id, {"service": "Telefonia"})
+    db.save_incident({"id": incident_id, "description": "Router quemado", "incident_type": "network"})
+    assert search_ids(db, "Internet", "ticket") == []
+    assert search_ids(db, "Telefonia", "ticket") == [ticket_id]
+    assert search_ids(db, "conexion", "incident") == []
+    assert search_ids(db, "router", "incident") == [incident_id]
+
+    db.delete_ticket(ticket_id)
+    assert search_ids(db, "Telefonia", "ticket") == []
+
+
+def test_changelog_records_each_write(db, new_ticket):
+    start = db.get_last_change_seq()
+    ticket_id = new_ticket()
+    db.update_ticket(ticket_id, {"service": "Telefonia"})
+    db.delete_ticket(ticket_id)
+
+    events, _next_seq = db.get_changes_page(after_seq=start, entity="ticket")
+    assert [(e["entity_id"], e["op"]) for e in events] == [
+        (ticket_id, "insert"), (ticket_id, "update"), (ticket_id, "delete")
+    ]
+    assert [e["seq"] for e in events] == sorted(e["seq"] for e in events)
+    assert "Telefonia" in events[1]["data"]
+    assert events[2]["data"] is None
+
+
+def test_table_changes_counts_writes(db, new_ticket):
+    tickets, clients = counter(db, "tickets"), counter(db, "clients")
+    ticket_id = new_ticket()
+    db.update_ticket(ticket_id, {"service": "Telefonia"})
+    db.delete_ticket(ticket_id)
+    assert counter(db, "tickets") == tickets + 3
+    # Escribir en otra tabla no toca el contador de clients.
+    assert counter(db, "clients") == clients
+
+
+def test_failed_write_leaves_no_trace(db, new_ticket):
+    ticket_id = new_ticket()
+    seq, count = db.get_last_change_seq(), counter(db, "tickets")
+    with pytest.raises(VersionConflict):
+        db.update_ticket(ticket_id, {"service": "Telefonia"}, expected_version=5)
+    assert db.get_ticket(ticket_id)["service"] == "Internet"
+    assert db.get_last_change_seq() == seq
+    assert counter(db, "tickets") == count
+    assert search_ids(db, "Telefonia", "ticket") == []
+
+
+def test_update_with_expected_version(db, new_ticket):
+    ticket_id = new_ticket()
+    updated = db.update_ticket(ticket_id, {"service": "Telefonia"}, expected_version=0)
+    assert updated["version"] == 1
+    with pytest.raises(VersionConflict):
+        db.update_ticket(ticket_id, {"service": "Internet"}, expected_version=0)
+    assert db.update_ticket(ticket_id + 1, {"service": "Internet"}, expected_version=0) is None
+
+
+def test_ticket_is_claimed_once(db, new_ticket):
+    ticket_id = new_ticket()
+    claimed = db.claim_ticket(ticket_id, "ana", 1_700_000_000)
+    assert claimed["id"] == ticket_id
+    assert db.claim_ticket(ticket_id, "beto", 1_700_000_001) is None
+    assert db.get_claimed_ticket_ids([ticket_id]) == {ticket_id}
+    assert ticket_id not in [row["id"] for row in db.iter_dispatch_candidates()]
+
+
+def test_concurrent_claims_have_one_winner(db, new_ticket):
+    ticket_id = new_ticket()
+    barrier = threading.Barrier(8)
+    results = []
+
+    def claim(agent):
+        barrier.wait()
+        results.append(db.claim_ticket(ticket_id, agent, 1_700_000_000))
+
+    threads = [threading.Thread(target=claim, args=(f"agent-{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len([r for r in results if r is not None]) == 1
+    assert db.fetchone("SELECT COUNT(*) AS n FROM ticket_claims")["n"] == 1
+
+
+def test_claims_follow_ticket_status(db, new_ticket):
+    closed = new_ticket(status="Closed", closed_at=1_700_000_100)
+    assert db.claim_ticket(closed, "ana", 1_700_000_200) is None
+    assert db.claim_ticket(closed + 1, "ana", 1_700_000_200) is None
+
+    ticket_id = new_ticket()
+    db.claim_ticket(ticket_id, "ana", 1_700_000_200)
+    db.close_ticket(ticket_id, closed_at=1_700_000_300)
+    # Al reabrirlo vuelve a la cola y otro agente puede tomarlo.
+    db.update_ticket(ticket_id, {"status": "Open"})
+    assert db.get_claimed_ticket_ids([ticket_id]) == set()
+    assert db.claim_ticket(ticket_id, "beto", 1_700_000_400)["id"] == ticket_id
@@ -0,0 +1,70 @@
+import sqlite3
+import threading
+
+import pytest
+
+
+def insert_incident(description):
+    def run(conn):
+        return conn.execute(
+            "INSERT INTO incidents (description, incident_type) VALUES (?, 'test')", (description,)
+        ).lastrowid
+    return run
+
+
+def failing(description):
+    # Escribe antes de fallar: el SAVEPOINT tiene que deshacer esta fila.
+    def run(conn):
+        insert_incident(description)(conn)
+        raise ValueError("boom")
+    return run
+
+
+def descriptions(db):
+    return {row["description"] for row in db.fetchall("SELECT description FROM incidents")}
+
+
+def test_failed_operation_is_isolated_within_its_batch(db):
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(conn):
+        started.set()
+        release.wait(5)
+        return insert_incident("blocker")(conn)
+
+    # Mientras la primera operacion espera, las demas se encolan y el
+    # escritor las toma juntas en el grupo siguiente.
+    batches = db.writer.stats()["batches"]
+    first = db.writer.submit(blocker)
+    assert started.wait(5)
+    before = db.writer.submit(insert_incident("before"))
+    bad = db.writer.submit(failing("bad"))
+    after = db.writer.submit(insert_incident("after"))
+    release.set()
+
+    assert first.result(5)
+    assert before.result(5) and after.result(5)
+    with pytest.raises(ValueError, match="boom"):
+        bad.result(5)
+    stats = db.writer.stats()
+    assert stats["batches"] == batches + 2
+    assert stats["failed"] == 1
+    assert descriptions(db) == {"blocker", "before", "after"}
+
+
+def test_writer_keeps_working_after_a_failure(db):
+    with pytest.raises(ValueError):
+        db.write(failing("bad"))
+    assert db.write(insert_incident("ok"))
+    assert descriptions(db) == {"ok"}
+
+
+def test_failed_statement_does_not_leave_partial_rows(db):
+    def partial(conn):
+        conn.execute("INSERT INTO incidents (description, incident_type) VALUES ('first', 'test')")
+        conn.execute("INSERT INTO incidents (description) VALUES ('second')")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        db.write(partial)
+    assert descriptions(db) == set()
+    assert db.get_changes_page()[0] == []
@@ -0,0 +1,47 @@
+"""Fechas de los tickets: se guardan como segundos epoch (UTC) en columnas
+INTEGER y la API las muestra como texto "YYYY-MM-DD HH:MM:SS" en UTC.
+"""
+import re
+import time
+from datetime import datetime, timezone
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def now():
+    return int(time.time())
+
+
+def format_timestamp(epoch):
+    """Epoch -> texto de la API (mismo formato que strftime en las consultas)."""
+    if epoch is None:
+        return None
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(epoch))
+
+
+def parse_timestamp(value):
+    """Texto de la API -> epoch.
+
+    Acepta segundos epoch o una fecha ISO 8601 ("2024-01-31",
+    "2024-01-31 10:00:00", "2024-01-31T10:00:00-03:00"); sin zona horaria
+    se toma como UTC. Lanza ValueError si no la reconoce.
+    """
+    value = value.strip()
+    if re.fullmatch(r"-?\d+", value):
+        return int(value)
+    if value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def parse_duration(value):
+    """"3600", "90m", "24h", "7d" -> segundos. Lanza ValueError si no la reconoce."""
+    match = re.fullmatch(r"(\d+)\s*([smhdw]?)", value.strip().lower())
+    if not match:
+        raise ValueError(f"invalid duration: {value!r}")
+    amount, unit = match.groups()
+    return int(amount) * DURATION_UNITS[unit or "s"]
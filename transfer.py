@@ -0,0 +1,319 @@
+"""Importacion y exportacion masiva de tickets, clientes e incidents (CSV o NDJSON).
+
+Para migrar o conciliar con otros sistemas sin pasar por un POST por fila
+ni por los get_all_* sin limite. Los datos van en streaming en los dos
+sentidos: la exportacion lee de a bloques y la importacion junta
+``batch_size`` filas por transaccion (un executemany cada una), asi la
+memoria queda acotada por el tamano del lote y no por el del archivo. El
+lote tiene un tope (MAX_BATCH_SIZE): cada uno es una escritura corta y las
+de la API se intercalan entre lotes, como en archive_tickets.
+
+Las columnas son las de database.TRANSFER_COLUMNS. Las fechas de los tickets
+salen en epoch y al importar se aceptan en epoch o ISO 8601; sin id, la fila
+toma uno nuevo. El status de un ticket tiene que ser uno de TICKET_STATUSES
+y su client_id e incident_id tienen que existir: se validan por lote, con
+una consulta IN (...) por referencia, como en POST /api/tickets/bulk. Lo
+mismo esta disponible en /api/export y /api/import.
+
+Cada lote se confirma por separado: si una fila es invalida o choca con un
+id existente (con --on-conflict error), lo importado en lotes anteriores
+queda y el error dice en que linea parar o desde donde seguir.
+
+Uso:
+    python transfer.py export tickets [-o tickets.csv] [--format csv]
+    python transfer.py import tickets tickets.csv [--batch-size 5000] [--on-conflict skip]
+"""
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+import time
+
+from database import DB_NAME, IMPORT_CONFLICTS, STREAM_CHUNK_SIZE, TICKET_STATUSES, TRANSFER_COLUMNS
+from repository import BACKENDS, create_repository
+from timestamps import now, parse_timestamp
+
+FORMATS = ("csv", "ndjson")
+MIMETYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+# Filas por transaccion; unas 1000 filas de tickets (con sus triggers) son
+# unos 75 ms del escritor.
+BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 5000
+# Cada cuantos segundos como maximo se informa el avance.
+PROGRESS_INTERVAL = 2.0
+
+TEXT_COLUMNS = {"description", "incident_type", "name", "email", "phone_number", "service", "status"}
+REQUIRED_IDS = {"client_id", "incident_id"}
+# Referencias que se validan antes de escribir cada lote: {tabla: {columna: lectura por ids}}.
+REFERENCES = {
+    "tickets": {
+        "client_id": lambda db, ids: db.get_clients_by_ids(ids),
+        "incident_id": lambda db, ids: db.get_incidents_by_ids(ids),
+    },
+}
+
+
+class ImportRowError(ValueError):
+    """Una fila de la importacion no se pudo convertir."""
+
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+class ImportConflict(Exception):
+    """Un lote choco con filas existentes (on_conflict "error"); no se importo nada de el."""
+
+    def __init__(self, line, message):
+        super().__init__(f"batch starting at line {line}: {message}")
+        self.line = line
+
+
+def format_from_name(name, default="ndjson"):
+    """Formato segun la extension del archivo (.csv o .ndjson/.jsonl)."""
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return default
+
+
+# ------------------------------
+# Exportacion
+# ------------------------------
+def export_chunks(db, table, fmt, after_id=None, meter=None):
+    """Genera el contenido de ``table`` en ``fmt`` como texto, de a STREAM_CHUNK_SIZE filas."""
+    columns = TRANSFER_COLUMNS[table]
+    rows = db.iter_table(table, after_id=after_id)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n") if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(columns)
+    pending = 0
+    try:
+        for row in rows:
+            if writer is not None:
+                writer.writerow([row[column] for column in columns])
+            else:
+                buffer.write(json.dumps(row))
+                buffer.write("\n")
+            pending += 1
+            if pending == STREAM_CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                if meter is not None:
+                    meter.add(pending)
+                pending = 0
+        if buffer.tell():
+            yield buffer.getvalue()
+        if meter is not None:
+            meter.add(pending)
+    finally:
+        rows.close()
+
+
+def export_table(db, table, out, fmt, progress=None):
+    """Escribe ``table`` en el archivo de texto ``out``.
+
+    Devuelve {"entity", "rows", "seconds", "rows_per_second"}.
+    """
+    meter = _Meter(progress)
+    for chunk in export_chunks(db, table, fmt, meter=meter):
+        out.write(chunk)
+    return meter.summary(table)
+
+
+# ------------------------------
+# Importacion
+# ------------------------------
+def read_records(lines, fmt):
+    """Genera (numero de linea, dict) desde un iterable de lineas de texto."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            raise ImportRowError(number, f"invalid JSON: {exc}") from None
+        if not isinstance(record, dict):
+            raise ImportRowError(number, "expected a JSON object")
+        yield number, record
+
+
+def _convert(column, value):
+    if isinstance(value, str):
+        value = value.strip()
+    if value == "" or value is None:
+        if column in TEXT_COLUMNS or column in REQUIRED_IDS:
+            raise ValueError(f"{column} is required")
+        return now() if column == "created_at" else None
+    if column == "status" and value not in TICKET_STATUSES:
+        raise ValueError(f"status must be one of {', '.join(TICKET_STATUSES)}")
+    if column in TEXT_COLUMNS:
+        return str(value)
+    if isinstance(value, (bool, float, dict, list)):
+        raise ValueError(f"invalid {column}: {value!r}")
+    try:
+        if column in ("created_at", "closed_at"):
+            return value if isinstance(value, int) else parse_timestamp(value)
+        return int(value)
+    except ValueError:
+        raise ValueError(f"invalid {column}: {value!r}") from None
+
+
+def convert_record(table, line, record):
+    """dict leido del archivo -> tupla en el orden de TRANSFER_COLUMNS[table]."""
+    try:
+        return tuple(_convert(column, record.get(column)) for column in TRANSFER_COLUMNS[table])
+    except ValueError as exc:
+        raise ImportRowError(line, str(exc)) from None
+
+
+def check_references(db, table, lines, batch):
+    """Lanza ImportRowError en la primera fila de ``batch`` con un client_id o incident_id inexistente.
+
+    ``lines`` son los numeros de linea de las filas de ``batch``.
+    """
+    columns = TRANSFER_COLUMNS[table]
+    for column, fetch in REFERENCES.get(table, {}).items():
+        index = columns.index(column)
+        found = {row["id"] for row in fetch(db, [row[index] for row in batch])}
+        for line, row in zip(lines, batch):
+            if row[index] not in found:
+                raise ImportRowError(line, f"{column} {row[index]} does not exist")
+
+
+def import_records(db, table, records, batch_size=BATCH_SIZE, on_conflict="error", progress=None):
+    """Importa los (linea, dict) de ``records`` de a ``batch_size`` filas por transaccion.
+
+    Devuelve {"entity", "rows", "seconds", "rows_per_second", "written"};
+    ``written`` no cuenta las filas salteadas por on_conflict "skip".
+    Lanza ImportRowError o ImportConflict; ``error.imported`` son las filas
+    ya confirmadas hasta ese momento.
+    """
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+    meter = _Meter(progress)
+    batch, lines, written = [], [], 0
+
+    def flush():
+        nonlocal written
+        check_references(db, table, lines, batch)
+        try:
+            written += db.import_rows(table, batch, on_conflict)
+        except sqlite3.IntegrityError as exc:
+            raise ImportConflict(lines[0], str(exc)) from None
+        meter.add(len(batch))
+        batch.clear()
+        lines.clear()
+
+    try:
+        for line, record in records:
+            lines.append(line)
+            batch.append(convert_record(table, line, record))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    except (ImportRowError, ImportConflict) as exc:
+        exc.imported = meter.rows
+        raise
+    return {**meter.summary(table), "written": written}
+
+
+def import_file(db, table, lines, fmt, batch_size=BATCH_SIZE, on_conflict="error", progress=None):
+    return import_records(db, table, read_records(lines, fmt), batch_size, on_conflict, progress)
+
+
+class _Meter:
+    """Cuenta filas y llama a ``progress(filas, segundos)`` cada PROGRESS_INTERVAL."""
+
+    def __init__(self, progress):
+        self.progress = progress
+        self.start = self.reported = time.perf_counter()
+        self.rows = 0
+
+    def add(self, rows):
+        self.rows += rows
+        if self.progress is not None and time.perf_counter() - self.reported >= PROGRESS_INTERVAL:
+            self.reported = time.perf_counter()
+            self.progress(self.rows, self.reported - self.start)
+
+    def summary(self, table):
+        seconds = time.perf_counter() - self.start
+        return {
+            "entity": table,
+            "rows": self.rows,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.rows / seconds) if seconds else None,
+        }
+
+
+# ------------------------------
+# Linea de comandos
+# ------------------------------
+def _print_progress(rows, seconds):
+    print(f"{rows} rows, {rows / seconds:.0f} rows/s", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa o exporta tickets, clientes e incidents")
+    parser.add_argument("--db", default=DB_NAME, help="archivo SQLite")
+    parser.add_argument("--backend", choices=list(BACKENDS), help="backend de base (por defecto, TICKETS_DB_BACKEND)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="escribir una tabla en CSV o NDJSON")
+    export.add_argument("entity", choices=list(TRANSFER_COLUMNS))
+    export.add_argument("-o", "--output", default="-", help="archivo de salida (- es stdout)")
+    export.add_argument("--format", choices=FORMATS, help="por defecto, segun la extension")
+
+    load = commands.add_parser("import", help="cargar una tabla desde CSV o NDJSON")
+    load.add_argument("entity", choices=list(TRANSFER_COLUMNS))
+    load.add_argument("input", help="archivo de entrada (- es stdin)")
+    load.add_argument("--format", choices=FORMATS, help="por defecto, segun la extension")
+    load.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="filas por transaccion")
+    load.add_argument("--on-conflict", choices=IMPORT_CONFLICTS, default="error",
+                      help="si el id ya existe: fallar, saltear la fila o actualizarla")
+    args = parser.parse_args(argv)
+    if args.command == "import" and not 1 <= args.batch_size <= MAX_BATCH_SIZE:
+        parser.error(f"--batch-size must be between 1 and {MAX_BATCH_SIZE}")
+
+    db = create_repository(args.backend, db_name=args.db)
+    try:
+        if args.command == "export":
+            fmt = args.format or format_from_name(args.output)
+            if args.output == "-":
+                result = export_table(db, args.entity, sys.stdout, fmt, _print_progress)
+            else:
+                with open(args.output, "w", encoding="utf-8", newline="") as out:
+                    result = export_table(db, args.entity, out, fmt, _print_progress)
+        else:
+            fmt = args.format or format_from_name(args.input)
+            source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", newline="")
+            try:
+                result = import_file(db, args.entity, source, fmt, args.batch_size,
+                                     args.on_conflict, _print_progress)
+            except (ImportRowError, ImportConflict) as exc:
+                print(f"{exc} ({exc.imported} rows imported before the error)", file=sys.stderr)
+                return 1
+            finally:
+                if source is not sys.stdin:
+                    source.close()
+    finally:
+        db.close()
+
+    print(f"{args.command} {result['entity']}: {result['rows']} rows in {result['seconds']}s "
+          f"({result['rows_per_second']} rows/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())